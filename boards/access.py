@@ -0,0 +1,92 @@
+"""
+Which boards a user can open.
+
+BoardAccess holds one row per board owner and member. sync_board_access()
+rebuilds the rows of a board from Board.owner and Board.members and is
+called by the signal receivers whenever either changes; querysets filter
+on accessible_board_ids() instead of joining the members table.
+
+board_roles() loads a user's rows with one indexed query and keeps the
+answer on the request and, for ACCESS_TTL seconds, in the default cache.
+Access changes clear the cached entry of the users involved; the TTL
+bounds how long another process may serve an outdated answer.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from .models import Board, BoardAccess
+
+ACCESS_TTL = 30
+
+OWNER = BoardAccess.OWNER
+MEMBER = BoardAccess.MEMBER
+
+
+def _key(user_id):
+    return f'board_access:{user_id}'
+
+
+def accessible_board_ids(user):
+    """
+    Subquery of the ids of the boards `user` can open, for pk__in /
+    board_id__in filters.
+    """
+    return BoardAccess.objects.filter(user=user).values('board_id')
+
+
+def board_roles(user, request=None):
+    """
+    {board_id: OWNER or MEMBER} for every board `user` can access.
+    """
+    if user is None or not user.is_authenticated:
+        return {}
+    memo = getattr(request, '_board_roles', None)
+    if memo is not None and memo[0] == user.pk:
+        return memo[1]
+
+    roles = cache.get(_key(user.pk))
+    if roles is None:
+        roles = dict(BoardAccess.objects.filter(user=user).values_list('board_id', 'role'))
+        cache.set(_key(user.pk), roles, ACCESS_TTL)
+
+    if request is not None:
+        request._board_roles = (user.pk, roles)
+    return roles
+
+
+def invalidate_board_access(user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids if user_id is not None])
+
+
+def sync_board_access(board_ids):
+    """
+    Make the BoardAccess rows of `board_ids` match their owners and
+    members. Returns the ids of the users whose access changed.
+    """
+    board_ids = set(board_ids)
+    if not board_ids:
+        return set()
+
+    wanted = {
+        key: MEMBER for key in Board.members.through.objects.filter(
+            board_id__in=board_ids
+        ).values_list('board_id', 'user_id')
+    }
+    for key in Board.objects.filter(pk__in=board_ids).values_list('pk', 'owner_id'):
+        wanted[key] = OWNER
+    existing = {
+        (board_id, user_id): (pk, role)
+        for pk, board_id, user_id, role in BoardAccess.objects.filter(
+            board_id__in=board_ids
+        ).values_list('pk', 'board_id', 'user_id', 'role')
+    }
+
+    stale = {key: pk for key, (pk, role) in existing.items() if wanted.get(key) != role}
+    missing = {key: role for key, role in wanted.items() if key not in existing or key in stale}
+    if stale or missing:
+        with transaction.atomic():
+            BoardAccess.objects.filter(pk__in=stale.values()).delete()
+            BoardAccess.objects.bulk_create([
+                BoardAccess(board_id=board_id, user_id=user_id, role=role)
+                for (board_id, user_id), role in missing.items()
+            ], ignore_conflicts=True)
+    return {user_id for _, user_id in stale.keys() | missing.keys()}
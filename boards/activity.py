@@ -0,0 +1,107 @@
+"""
+Buffered Activity writes.
+
+record_activity() does not touch the database. Entries are collected per
+request (see boards.buffering) and written with one bulk INSERT after the
+response has been produced, and only if the transaction that logged them
+committed. With settings.BOARD_ACTIVITY_ASYNC the INSERT moves off the
+request thread entirely, to a background writer that is drained when the
+process exits.
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .buffering import CommitBuffer
+from .models import Activity
+
+logger = logging.getLogger(__name__)
+
+# Largest batch the background writer inserts at once
+WRITE_BATCH_SIZE = 500
+
+
+class ActivityWriter:
+    """
+    Background thread that bulk-inserts queued activity entries.
+    Everything queued before shutdown() is written before it returns.
+    """
+    _stop = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, activities):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='activity-writer', daemon=True
+                )
+                self._thread.start()
+        self._queue.put(activities)
+
+    def shutdown(self, timeout=10):
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(self._stop)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning('Activity writer did not drain within %ss', timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            while True:
+                if item is self._stop:
+                    stopping = True
+                else:
+                    batch.extend(item)
+                if len(batch) >= WRITE_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        close_old_connections()
+        try:
+            Activity.objects.bulk_create(batch, batch_size=WRITE_BATCH_SIZE)
+        except Exception:
+            logger.exception('Writing %d activity entries failed', len(batch))
+        finally:
+            close_old_connections()
+
+
+writer = ActivityWriter()
+atexit.register(writer.shutdown)
+
+
+def write_activities(activities):
+    if getattr(settings, 'BOARD_ACTIVITY_ASYNC', False):
+        writer.submit(activities)
+    else:
+        Activity.objects.bulk_create(activities)
+
+
+activity_buffer = CommitBuffer(write_activities, 'activity entries')
+
+
+def record_activity(**fields):
+    """
+    Log an Activity (same keyword arguments as the model) once the current
+    transaction commits.
+    """
+    activity_buffer.add(Activity(**fields))
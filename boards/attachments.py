@@ -0,0 +1,276 @@
+"""
+Attachment storage: resumable uploads into content-addressed blobs, and
+downloads the web server can send straight from disk.
+
+An upload first creates an UploadSession, then sends the file in chunks
+(PATCH with the offset the chunk starts at). Chunks are copied from the
+request stream to the session's part file in CHUNK_SIZE pieces, so memory
+use does not grow with the file. Once the last byte is in, the part file
+is hashed and moved to blobs/<aa>/<bb>/<sha256> under ATTACHMENT_ROOT,
+unless an identical file is already stored there, in which case the new
+attachment points at the existing blob.
+
+Downloads are handed to the front-end server with X-Accel-Redirect when
+ATTACHMENT_ACCEL_REDIRECT is set (nginx then serves ranges itself, with
+sendfile). Otherwise they go out as a FileResponse, which WSGI servers
+with a file wrapper send with sendfile too; single byte ranges are
+supported either way.
+"""
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header, parse_etags
+
+from .models import Attachment, Blob, UploadSession
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UploadConflict(Exception):
+    """
+    A chunk did not start at the session's current offset.
+    """
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+
+def storage_root():
+    return str(settings.ATTACHMENT_ROOT)
+
+
+def blob_name(sha256):
+    return os.path.join('blobs', sha256[:2], sha256[2:4], sha256)
+
+
+def blob_path(sha256):
+    return os.path.join(storage_root(), blob_name(sha256))
+
+
+def part_path(session):
+    return os.path.join(storage_root(), 'uploads', f'{session.pk}.part')
+
+
+def start_upload(card, user, name, size, content_type=''):
+    session = UploadSession.objects.create(
+        card=card, user=user, name=name, size=size, content_type=content_type
+    )
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+def write_chunk(session, stream, offset, length):
+    """
+    Copy `length` bytes from `stream` into the part file at `offset`, which
+    must be where the session currently stands. Returns the new offset;
+    bytes received before a broken connection still count.
+    """
+    if offset != session.offset:
+        raise UploadConflict(session.offset)
+    if offset + length > session.size:
+        raise ValueError('Chunk runs past the declared upload size')
+
+    written = 0
+    with open(part_path(session), 'r+b') as part:
+        part.seek(offset)
+        try:
+            while written < length:
+                data = stream.read(min(CHUNK_SIZE, length - written))
+                if not data:
+                    break
+                part.write(data)
+                written += len(data)
+        finally:
+            part.flush()
+            # Only the request that still sees the old offset moves it on;
+            # a duplicate of the same chunk wrote the same bytes
+            moved = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+                offset=offset + written
+            )
+    if not moved:
+        session.refresh_from_db(fields=['offset'])
+        raise UploadConflict(session.offset)
+    session.offset = offset + written
+    return session.offset
+
+
+def finish_upload(session):
+    """
+    Turn a complete upload into an Attachment, storing its content as a new
+    blob or reusing the identical one already stored.
+
+    The session row is claimed (deleted) first, so of two requests
+    completing the same upload only one gets past it; the other raises
+    UploadSession.DoesNotExist. The part file is only moved or removed
+    once the rows are committed: if they are not, the session and its part
+    file are both still there to retry with.
+    """
+    path = part_path(session)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for data in iter(lambda: part.read(CHUNK_SIZE), b''):
+            digest.update(data)
+    sha256 = digest.hexdigest()
+
+    with transaction.atomic():
+        claimed, _ = UploadSession.objects.filter(pk=session.pk, offset=session.size).delete()
+        if not claimed:
+            raise UploadSession.DoesNotExist('Upload is already finished or gone')
+        blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is None:
+            blob = Blob.objects.create(sha256=sha256, size=session.size)
+        attachment = Attachment.objects.create(
+            card_id=session.card_id, blob=blob, name=session.name,
+            content_type=session.content_type, size=session.size,
+            uploaded_by_id=session.user_id
+        )
+        transaction.on_commit(lambda: store_part(path, sha256))
+    return attachment
+
+
+def store_part(path, sha256):
+    """
+    Move a finished part file into place as the blob's file, or drop it if
+    an identical upload got there first.
+    """
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+
+def abort_upload(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def collect_blob(sha256):
+    """
+    Delete the blob and its file once no attachment refers to it.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is None or blob.attachments.exists():
+            return
+        blob.delete()
+        try:
+            os.remove(blob_path(sha256))
+        except FileNotFoundError:
+            pass
+
+
+class FileRange:
+    """
+    The `length` bytes of an open file from its current position. Keeps
+    fileno() so WSGI file wrappers can still sendfile() the range; they
+    stop at the Content-Length.
+    """
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, inclusive, or None when the
+    header should be ignored. Raises ValueError if it cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+def serve_attachment(request, attachment):
+    """
+    Download response for an uploaded attachment. The blob digest is its
+    ETag, so unchanged content is answered with 304.
+    """
+    blob_id = attachment.blob_id
+    etag = f'"{blob_id}"'
+    size = attachment.size
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'X-Content-Type-Options': 'nosniff',
+        'Cache-Control': 'private, max-age=31536000, immutable',
+    }
+    content_type = attachment.content_type or 'application/octet-stream'
+
+    # Served as a download so uploaded HTML or SVG never runs on this origin
+    accel_prefix = settings.ATTACHMENT_ACCEL_REDIRECT
+    if accel_prefix:
+        headers['Content-Disposition'] = content_disposition_header(True, attachment.name)
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + blob_name(blob_id).replace(os.sep, '/')
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+    file = open(blob_path(blob_id), 'rb')
+    if byte_range is None:
+        return FileResponse(
+            file, as_attachment=True, filename=attachment.name,
+            content_type=content_type, headers=headers
+        )
+
+    start, end = byte_range
+    file.seek(start)
+    response = FileResponse(
+        FileRange(file, end - start + 1), as_attachment=True, filename=attachment.name,
+        status=206, content_type=content_type, headers=headers
+    )
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -0,0 +1,141 @@
+"""
+Resized variants of board background images.
+
+When a board gets a new background image, render_variants() runs in a
+process pool once the transaction commits and writes tile, header and full
+sizes as WebP and JPEG under MEDIA_ROOT/board_backgrounds/variants/, keyed
+by the image's SHA-256. Identical uploads therefore share their variants
+and are never resized twice. When they are ready the board's
+background_hash is set and a board change is logged, so clients pick up
+the variant URLs through the usual sync. Until then background_variants
+is null and clients use background_image.
+
+With settings.BOARD_BACKGROUND_WORKERS = 0 the variants are rendered on
+the committing thread instead.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .changes import record_changes
+from .imaging import FORMATS, VARIANTS, render_variants, variant_name
+from .models import Board
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'board_backgrounds/variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variants_root():
+    return os.path.join(settings.MEDIA_ROOT, VARIANT_DIR)
+
+
+def variant_urls(board, request=None):
+    """
+    {variant: {extension: url}} for the board's background, or None while
+    there is no background or its variants are not ready yet.
+    """
+    if not board.background_hash:
+        return None
+    urls = {}
+    for variant in VARIANTS:
+        urls[variant] = {}
+        for extension in FORMATS:
+            url = f'{settings.MEDIA_URL}{VARIANT_DIR}/' + variant_name(board.background_hash, variant, extension)
+            urls[variant][extension] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned, not forked: the workers start clean instead of
+            # inheriting the server's threads and sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.BOARD_BACKGROUND_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def schedule_variants(board):
+    """
+    Render the variants of the board's current background image after the
+    transaction commits.
+    """
+    name = board.background_image.name
+    # Robust: the board is already saved, a failure here must not fail the request
+    transaction.on_commit(lambda: submit_variants(board.pk, name), robust=True)
+
+
+def reset_executor(broken):
+    """
+    Forget the pool `broken` (e.g. after a worker was killed; it has shut
+    itself down) so the next get_executor() call starts a new one.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+
+
+def submit_variants(board_id, name):
+    source = default_storage.path(name)
+    if not settings.BOARD_BACKGROUND_WORKERS:
+        try:
+            store_variants(board_id, name, render_variants(source, variants_root()))
+        except Exception:
+            logger.exception('Rendering background variants of board %s failed', board_id)
+        return
+    executor = get_executor()
+    try:
+        future = executor.submit(render_variants, source, variants_root())
+    except BrokenProcessPool:
+        logger.exception('Background variant pool is broken; board %s is not rendered', board_id)
+        reset_executor(executor)
+        return
+    future.add_done_callback(lambda done: variants_finished(board_id, name, done, executor))
+
+
+def variants_finished(board_id, name, future, executor):
+    # Runs on the executor's management thread
+    try:
+        digest = future.result()
+    except BrokenProcessPool:
+        logger.exception('A background variant worker died rendering board %s', board_id)
+        reset_executor(executor)
+        return
+    except Exception:
+        logger.exception('Rendering background variants of board %s failed', board_id)
+        return
+    close_old_connections()
+    try:
+        store_variants(board_id, name, digest)
+    except Exception:
+        logger.exception('Storing background variants of board %s failed', board_id)
+    finally:
+        close_old_connections()
+
+
+def store_variants(board_id, name, digest):
+    """
+    Point the board at the variants rendered from image `name`, unless its
+    image has changed again in the meantime.
+    """
+    with transaction.atomic():
+        updated = Board.objects.filter(pk=board_id, background_image=name).update(
+            background_hash=digest, background_source=name
+        )
+        if updated:
+            record_changes(board_id, Board, [board_id])
@@ -0,0 +1,74 @@
+"""
+Side effects that should only happen once the database work behind them
+has committed, collected so they can be handled in batches.
+
+An item added inside a transaction is held until the transaction commits
+and dropped if it rolls back. Within a buffered() scope (every request,
+via BufferedSideEffectsMiddleware) committed items are kept until the
+scope ends and then handed to the buffer's dispatch function in one call;
+outside a scope they are dispatched as soon as they are committed.
+"""
+import logging
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_buffers = []
+
+
+class CommitBuffer:
+    def __init__(self, dispatch, name):
+        self.dispatch = dispatch
+        self.name = name
+        self._local = Local()
+        _buffers.append(self)
+
+    def add(self, item):
+        transaction.on_commit(lambda: self._committed(item))
+
+    def _committed(self, item):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            self._dispatch([item])
+        else:
+            pending.append(item)
+
+    def open(self):
+        """
+        Start collecting committed items. Returns False if a scope is
+        already open, in which case the outer scope does the flushing.
+        """
+        if getattr(self._local, 'pending', None) is not None:
+            return False
+        self._local.pending = []
+        return True
+
+    def close(self):
+        pending = getattr(self._local, 'pending', None)
+        self._local.pending = None
+        if pending:
+            self._dispatch(pending)
+
+    def _dispatch(self, items):
+        # The triggering writes are committed; a failure here must not turn
+        # the response into an error
+        try:
+            self.dispatch(items)
+        except Exception:
+            logger.exception('Dispatching %d buffered %s failed', len(items), self.name)
+
+
+@contextmanager
+def buffered():
+    """
+    Collect committed items from every buffer until the block exits.
+    """
+    opened = [buffer for buffer in _buffers if buffer.open()]
+    try:
+        yield
+    finally:
+        for buffer in opened:
+            buffer.close()
@@ -0,0 +1,70 @@
+import pickle
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+# Pickled bytes held by each named cache. Shared by its instances like the
+# entries themselves, and only changed under the cache's lock.
+_stored_bytes = {}
+
+
+class BoundedLocMemCache(LocMemCache):
+    """
+    Local memory cache that evicts the least recently used entry whenever
+    MAX_ENTRIES or the OPTIONS['MAX_BYTES'] cap on stored (pickled) bytes
+    would be exceeded. The byte total is kept up to date as entries come
+    and go, so a write never has to measure the whole cache.
+    """
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        options = params.get('OPTIONS', {})
+        self._max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        self._name = name
+        _stored_bytes.setdefault(name, 0)
+
+    def _add_bytes(self, count):
+        _stored_bytes[self._name] += count
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        # Replacing an entry: its old bytes go first, and it cannot be culled
+        self._delete(key)
+        super()._set(key, value, timeout)
+        self._add_bytes(len(value))
+        # Newest entries sit at the front; the one just stored is always kept
+        while _stored_bytes[self._name] > self._max_bytes and len(self._cache) > 1:
+            self._evict_oldest()
+
+    def _delete(self, key):
+        pickled = self._cache.get(key)
+        deleted = super()._delete(key)
+        if deleted:
+            self._add_bytes(-len(pickled))
+        return deleted
+
+    def _cull(self):
+        self._evict_oldest()
+
+    def _evict_oldest(self):
+        key, pickled = self._cache.popitem()
+        self._expire_info.pop(key, None)
+        self._add_bytes(-len(pickled))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                self._delete(key)
+                raise ValueError("Key '%s' not found" % key)
+            old = self._cache[key]
+            new_value = pickle.loads(old) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            self._cache[key] = pickled
+            self._cache.move_to_end(key, last=False)
+            self._add_bytes(len(pickled) - len(old))
+        return new_value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            _stored_bytes[self._name] = 0
@@ -0,0 +1,176 @@
+import threading
+from django.db import transaction
+from .models import Board, List, Label, Card, Comment, Checklist, ChecklistItem, Attachment, BoardChange
+from .serializers import (
+    BoardSerializer, ListSerializer, LabelSerializer, CardSerializer, CommentSerializer,
+    ChecklistSerializer, ChecklistItemSerializer, AttachmentSerializer
+)
+
+# Response key, queryset and flat field list (no nested children, those
+# arrive as their own entries) for each tracked model
+SYNC_MODELS = {
+    'board': ('board', Board.objects.select_related('owner').prefetch_related('members'),
+              BoardSerializer, ['id', 'title', 'description', 'owner', 'members',
+                                'background_color', 'background_image', 'background_variants', 'archived',
+                                'version', 'created_at', 'updated_at']),
+    'list': ('lists', List.objects.all(), ListSerializer,
+             ['id', 'title', 'board', 'position', 'created_at', 'updated_at']),
+    'label': ('labels', Label.objects.all(), LabelSerializer, ['id', 'board', 'name', 'color']),
+    'card': ('cards', Card.objects.prefetch_related('members', 'labels'), CardSerializer,
+             ['id', 'title', 'description', 'list', 'position', 'due_date', 'labels',
+              'members', 'archived', 'created_at', 'updated_at']),
+    'attachment': ('attachments', Attachment.objects.all(), AttachmentSerializer,
+                   ['id', 'card', 'name', 'url', 'content_type', 'size', 'created_at']),
+    'comment': ('comments', Comment.objects.select_related('author'), CommentSerializer,
+                ['id', 'text', 'card', 'author', 'created_at', 'updated_at']),
+    'checklist': ('checklists', Checklist.objects.all(), ChecklistSerializer,
+                  ['id', 'title', 'card', 'created_at', 'updated_at']),
+    'checklistitem': ('checklist_items', ChecklistItem.objects.all(), ChecklistItemSerializer,
+                      ['id', 'checklist', 'text', 'completed', 'position',
+                       'created_at', 'updated_at']),
+}
+
+# A client further behind than this refetches the board instead
+MAX_CHANGES = 5000
+# Boards whose latest version a thread remembers for tagging broadcasts
+MAX_RECORDED_VERSIONS = 1024
+
+_local = threading.local()
+
+
+def mark_deleting(board_id):
+    """
+    Stop logging changes to `board_id` on this thread while it is being
+    hard-deleted: the log rows of its cascaded contents would outlive the
+    board. The mark belongs to the current transaction and lapses when it
+    commits or rolls back, so a failed delete cannot silence the board.
+    """
+    if not hasattr(_local, 'deleting_boards'):
+        _local.deleting_boards = {}
+    marks = _local.deleting_boards
+
+    def finished():
+        if marks.get(board_id) is finished:
+            del marks[board_id]
+
+    marks[board_id] = finished
+    transaction.on_commit(finished)
+
+
+def unmark_deleting(board_id):
+    getattr(_local, 'deleting_boards', {}).pop(board_id, None)
+
+
+def is_deleting(board_id):
+    marks = getattr(_local, 'deleting_boards', None)
+    finished = marks.get(board_id) if marks else None
+    if finished is None:
+        return False
+    # A rolled back transaction (or savepoint) drops its on_commit
+    # callbacks, and with them the mark
+    if not any(callback is finished for _, callback, _ in transaction.get_connection().run_on_commit):
+        del marks[board_id]
+        return False
+    return True
+
+
+def recorded_version(board_id):
+    """
+    Version this thread last moved `board_id` to, or None. Broadcasts use
+    it as their sequence number.
+    """
+    return getattr(_local, 'versions', {}).get(board_id)
+
+
+def record_changes(board_id, model, object_ids, operation=BoardChange.UPSERT):
+    """
+    Advance the board's version by one per object and log `object_ids` of
+    `model` under the new sequence numbers. Returns the new version, or
+    None if the board is gone or there was nothing to log.
+    """
+    object_ids = list(object_ids)
+    if board_id is None or not object_ids or is_deleting(board_id):
+        return None
+    with transaction.atomic():
+        version = Board.bump_version(board_id, len(object_ids))
+        if version is None:
+            return None
+        first = version - len(object_ids) + 1
+        BoardChange.objects.bulk_create([
+            BoardChange(
+                board_id=board_id,
+                sequence=first + offset,
+                model=model._meta.model_name,
+                object_id=object_id,
+                operation=operation
+            )
+            for offset, object_id in enumerate(object_ids)
+        ])
+
+    versions = getattr(_local, 'versions', None)
+    if versions is None or len(versions) >= MAX_RECORDED_VERSIONS:
+        versions = _local.versions = {}
+    versions[board_id] = version
+    return version
+
+
+def changes_since(board, since, request=None):
+    """
+    Everything created, updated or deleted on `board` after version `since`.
+
+    Upserted objects are returned in full (without nested children) and
+    deletions as lists of ids. 'reset' is set when the log cannot bring the
+    client up to date and it should refetch the whole board instead.
+    """
+    payload = {
+        'cursor': board.version,
+        'reset': False,
+        'board': None,
+        'deleted': {key: [] for key, _, _, _ in SYNC_MODELS.values() if key != 'board'},
+    }
+    for key, _, _, _ in SYNC_MODELS.values():
+        if key != 'board':
+            payload[key] = []
+
+    if since >= board.version:
+        payload['reset'] = since > board.version
+        return payload
+
+    changes = BoardChange.objects.filter(
+        board=board, sequence__gt=since, sequence__lte=board.version
+    ).order_by('sequence', 'id').values_list('sequence', 'model', 'object_id', 'operation')
+    changes = list(changes[:MAX_CHANGES + 1])
+    # The log is dense from here on, so the first entry must directly follow
+    # the client's cursor
+    if not changes or changes[0][0] != since + 1 or len(changes) > MAX_CHANGES:
+        payload['reset'] = True
+        return payload
+
+    # Last operation wins for each object
+    latest = {}
+    for _, model_name, object_id, operation in changes:
+        latest[(model_name, object_id)] = operation
+
+    for model_name, (key, queryset, serializer_class, fields) in SYNC_MODELS.items():
+        upserted = [
+            object_id for (name, object_id), operation in latest.items()
+            if name == model_name and operation == BoardChange.UPSERT
+        ]
+        deleted = {
+            object_id for (name, object_id), operation in latest.items()
+            if name == model_name and operation == BoardChange.DELETE
+        }
+        objects = list(queryset.filter(pk__in=upserted)) if upserted else []
+        # Upserted rows that have since vanished count as deleted
+        deleted.update(set(upserted) - {obj.pk for obj in objects})
+
+        data = serializer_class(
+            objects, many=True, context={'request': request, 'fields': fields}
+        ).data
+        if key == 'board':
+            payload['board'] = data[0] if data else None
+        else:
+            payload[key] = data
+            payload['deleted'][key] = sorted(deleted)
+
+    return payload
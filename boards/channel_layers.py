@@ -0,0 +1,329 @@
+"""
+Channel layer shared by several worker processes on one host through a
+SQLite database in WAL mode, for deployments without Redis.
+
+Messages are rows in a queue table and group memberships rows in a second
+table, so every process sees the same channels and groups. Readers poll:
+each process runs one poller per set of process-specific channels (all of
+its WebSocket consumers) that backs off from `poll_interval` to
+`max_poll_interval` while idle, which bounds the added delivery latency.
+All database work of a layer instance runs on one dedicated thread, keeping
+the event loop free and giving each process a single connection.
+"""
+import asyncio
+import base64
+import collections
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    message TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_owner ON channel_messages (owner, id);
+CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (name, channel)
+);
+"""
+
+# Most messages a poller takes off the queue per round trip
+READ_BATCH_SIZE = 100
+# Seconds between sweeps of expired messages and memberships
+CLEAN_INTERVAL = 1.0
+
+
+def _encode_value(value):
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'{type(value).__name__} is not allowed in a channel message')
+
+
+def _decode_object(obj):
+    if len(obj) == 1 and '__bytes__' in obj:
+        return base64.b64decode(obj['__bytes__'])
+    return obj
+
+
+def encode_message(message):
+    return json.dumps(message, default=_encode_value, separators=(',', ':'))
+
+
+def decode_message(text):
+    return json.loads(text, object_hook=_decode_object)
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        path=None,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.002,
+        max_poll_interval=0.05,
+        **kwargs
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = path or os.path.join(tempfile.gettempdir(), 'channel-layer.sqlite3')
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.client_prefix = uuid.uuid4().hex[:12]
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='channel-layer')
+        self._db = threading.local()
+        self._last_clean = 0.0
+        # Receive side of process-specific channels, bound to one event loop
+        self._loop = None
+        self._buffers = {}
+        self._pollers = {}
+        self._waiting = {}
+        # Messages per channel dropped because its local buffer was at capacity
+        self.dropped = collections.Counter()
+
+    # Database work, always on the executor thread
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connection(self):
+        connection = getattr(self._db, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._db.connection = connection
+        return connection
+
+    def _write(self, func, *args):
+        """
+        Run func(connection, now, *args) in a write transaction.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if now - self._last_clean > CLEAN_INTERVAL:
+                self._clean(connection, now)
+                self._last_clean = now
+            result = func(connection, now, *args)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    def _clean(self, connection, now):
+        # A channel with expired messages has stopped reading: drop it from
+        # its groups like the in-memory layer does
+        connection.execute(
+            'DELETE FROM channel_groups WHERE expires < ? OR channel IN '
+            '(SELECT channel FROM channel_messages WHERE expires < ?)',
+            (now, now)
+        )
+        connection.execute('DELETE FROM channel_messages WHERE expires < ?', (now,))
+
+    def _backlog(self, connection, now, channels):
+        placeholders = ','.join('?' * len(channels))
+        return dict(connection.execute(
+            f'SELECT channel, COUNT(*) FROM channel_messages '
+            f'WHERE channel IN ({placeholders}) AND expires >= ? GROUP BY channel',
+            (*channels, now)
+        ))
+
+    def _insert(self, connection, now, channels, text):
+        backlog = self._backlog(connection, now, channels)
+        accepted = [
+            channel for channel in channels
+            if backlog.get(channel, 0) < self.get_capacity(channel)
+        ]
+        connection.executemany(
+            'INSERT INTO channel_messages (owner, channel, message, expires) VALUES (?, ?, ?, ?)',
+            [(self.non_local_name(channel), channel, text, now + self.expiry) for channel in accepted]
+        )
+        return accepted
+
+    def _send(self, connection, now, channel, text):
+        if not self._insert(connection, now, [channel], text):
+            raise ChannelFull(channel)
+
+    def _group_send(self, connection, now, group, text):
+        channels = [row[0] for row in connection.execute(
+            'SELECT channel FROM channel_groups WHERE name = ? AND expires >= ?', (group, now)
+        )]
+        if channels:
+            # Full channels are skipped, as in the other layers
+            self._insert(connection, now, channels, text)
+
+    def _pop(self, connection, now, owner, channel=None, limit=1):
+        query = 'SELECT id, channel, message FROM channel_messages WHERE owner = ? AND expires >= ?'
+        params = [owner, now]
+        if channel is not None:
+            query += ' AND channel = ?'
+            params.append(channel)
+        rows = connection.execute(query + ' ORDER BY id LIMIT ?', (*params, limit)).fetchall()
+        if rows:
+            connection.executemany('DELETE FROM channel_messages WHERE id = ?', [(row[0],) for row in rows])
+        return [(row[1], row[2]) for row in rows]
+
+    def _has_rows(self, owner):
+        # Cheap read outside a write transaction, so idle polls never lock.
+        # Expired rows do not count: they wait for _clean, not for a reader
+        return self._connection().execute(
+            'SELECT 1 FROM channel_messages WHERE owner = ? AND expires >= ? LIMIT 1',
+            (owner, time.time())
+        ).fetchone() is not None
+
+    def _read(self, owner, channel=None, limit=1):
+        if not self._has_rows(owner):
+            return []
+        return self._write(self._pop, owner, channel, limit)
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        await self._run(self._write, self._send, channel, encode_message(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if '!' in channel:
+            return await self._receive_specific(channel)
+
+        delay = self.poll_interval
+        while True:
+            rows = await self._run(self._read, channel)
+            if rows:
+                return decode_message(rows[0][1])
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def new_channel(self, prefix='specific'):
+        return f'{prefix}.{self.client_prefix}!{uuid.uuid4().hex}'
+
+    async def _receive_specific(self, channel):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues and poller tasks cannot outlive their event loop
+            self._loop = loop
+            self._buffers = {}
+            self._pollers = {}
+            self._waiting = {}
+
+        owner = self.non_local_name(channel)
+        buffer = self._buffers.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+        self._waiting[owner] = self._waiting.get(owner, 0) + 1
+        poller = self._pollers.get(owner)
+        if poller is None or poller.done():
+            self._pollers[owner] = loop.create_task(self._poll(owner))
+        try:
+            while True:
+                expires, message = await buffer.get()
+                if expires >= time.time():
+                    return message
+        finally:
+            self._waiting[owner] = self._waiting.get(owner, 1) - 1
+            if buffer.empty() and self._buffers.get(channel) is buffer:
+                del self._buffers[channel]
+
+    async def _poll(self, owner):
+        """
+        Move messages for every channel under `owner` into local buffers
+        while anything in this process is receiving on them.
+        """
+        delay = self.poll_interval
+        while self._waiting.get(owner):
+            rows = await self._run(self._read, owner, None, READ_BATCH_SIZE)
+            if not rows:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+                continue
+            delay = self.poll_interval
+            expires = time.time() + self.expiry
+            for channel, text in rows:
+                buffer = self._buffers.setdefault(
+                    channel, asyncio.Queue(maxsize=self.get_capacity(channel))
+                )
+                try:
+                    buffer.put_nowait((expires, decode_message(text)))
+                except asyncio.QueueFull:
+                    # Same outcome as a full channel on the send side
+                    self.dropped[channel] += 1
+                    logger.warning(
+                        'Channel %s is over its capacity of %d; dropped a message (%d so far)',
+                        channel, self.get_capacity(channel), self.dropped[channel]
+                    )
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._write, self._group_add, group, channel)
+
+    def _group_add(self, connection, now, group, channel):
+        connection.execute(
+            'INSERT OR REPLACE INTO channel_groups (name, channel, expires) VALUES (?, ?, ?)',
+            (group, channel, now + self.group_expiry)
+        )
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        await self._run(self._write, self._group_discard, group, channel)
+
+    def _group_discard(self, connection, now, group, channel):
+        connection.execute(
+            'DELETE FROM channel_groups WHERE name = ? AND channel = ?', (group, channel)
+        )
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+        # Encoded once however many channels are in the group
+        await self._run(self._write, self._group_send, group, encode_message(message))
+
+    # Flush extension
+
+    async def flush(self):
+        await self._run(self._write, self._flush)
+
+    def _flush(self, connection, now):
+        connection.execute('DELETE FROM channel_messages')
+        connection.execute('DELETE FROM channel_groups')
+
+    async def close(self):
+        await self._run(self._close)
+
+    def _close(self):
+        connection = getattr(self._db, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._db.connection = None
@@ -0,0 +1,338 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from .access import board_roles
+from .models import Board
+from .presence import tracker
+from .replay import hub
+from .serializers import parse_id
+from .snapshot import get_snapshot_frame
+from .signals import encode_frame
+from .throttling import TokenBucket, relay_batcher, relay_stats
+from users.authentication import authenticate_token
+
+
+class BaseBoardConsumer(AsyncWebsocketConsumer):
+    """
+    JWT authentication and buffered frame delivery shared by the board
+    sockets.
+    """
+    # Frames waiting to be written to this socket. A client that falls this
+    # far behind is disconnected; it resyncs through the changes endpoint
+    # instead of holding up the group.
+    send_queue_size = 256
+    outbox = None
+    writer = None
+    # Highest seq replayed per board; live copies of those frames are skipped
+    replayed = None
+    # Client events relayed per second, sustained and in a burst, and the
+    # largest one accepted
+    relay_rate = 20
+    relay_burst = 40
+    max_event_size = 8192
+    bucket = None
+
+    async def start_writer(self):
+        self.outbox = asyncio.Queue(maxsize=self.send_queue_size)
+        self.writer = asyncio.ensure_future(self.write_frames())
+        await self.queue_frame(json.dumps({
+            'type': 'connection_established',
+            'message': 'Connected to board updates'
+        }))
+
+    async def disconnect(self, close_code):
+        if self.writer is not None:
+            self.writer.cancel()
+
+    async def catch_up(self, board_id, since):
+        """
+        Send the frames of `board_id` newer than seq `since`, or ask the
+        client to resync when they are no longer buffered.
+        """
+        frames = hub.since(board_id, since)
+        if frames is None:
+            await self.queue_frame(json.dumps({'type': 'resync_required', 'board_id': board_id}))
+            return
+        for seq, text in frames:
+            await self.queue_frame(text)
+        if self.replayed is None:
+            self.replayed = {}
+        self.replayed[board_id] = frames[-1][0] if frames else since
+
+    async def join_presence(self, board_id):
+        # Full list once; afterwards only joined/left changes arrive
+        users = await tracker.join(board_id, self.user.pk)
+        await self.queue_frame(json.dumps({'type': 'presence', 'board_id': board_id, 'users': users}))
+
+    async def send_snapshot(self, board_id):
+        """
+        Send the board's snapshot frame. Live frames it already reflects
+        (seq up to its version) are skipped from here on.
+        """
+        version, text = await self.load_snapshot_frame(board_id)
+        await self.queue_frame(text)
+        if self.replayed is None:
+            self.replayed = {}
+        self.replayed[board_id] = max(version, self.replayed.get(board_id, -1))
+
+    @database_sync_to_async
+    def load_snapshot_frame(self, board_id):
+        # Read after joining the group: changes committed from here on
+        # arrive as live frames, so the snapshot can be no older than them
+        board = Board.objects.get(pk=board_id)
+        return board.version, get_snapshot_frame(board)
+
+    async def board_update(self, event):
+        seq = event.get('seq')
+        if self.replayed and seq is not None and seq <= self.replayed.get(event.get('board_id'), -1):
+            return
+        # Group events arrive already encoded; older producers send the parts
+        text = event.get('text')
+        if text is None:
+            text = encode_frame({
+                'type': event['action'],
+                'board_id': event.get('board_id'),
+                'data': event['data'],
+                'user': event.get('user')
+            })
+        await self.queue_frame(text)
+
+    def parse_event(self, text_data):
+        """
+        Decoded client message, or None if it is too large or not a JSON
+        object.
+        """
+        if text_data is None or len(text_data) > self.max_event_size:
+            relay_stats['oversized'] += 1
+            return None
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            relay_stats['invalid'] += 1
+            return None
+        return data
+
+    async def relay(self, board_id, action, data):
+        # Broadcast to board group on the next batch tick, if this
+        # connection is within its rate
+        relay_stats['received'] += 1
+        if self.bucket is None:
+            self.bucket = TokenBucket(self.relay_rate, self.relay_burst)
+        if not self.bucket.take():
+            relay_stats['rate_limited'] += 1
+            return
+        relay_batcher.add(board_id, action, data, self.user.username)
+
+    async def queue_frame(self, text):
+        if self.outbox is None:
+            return
+        try:
+            self.outbox.put_nowait(text)
+        except asyncio.QueueFull:
+            self.outbox = None
+            self.writer.cancel()
+            # 1013: try again later
+            await self.close(code=1013)
+
+    async def write_frames(self):
+        # Sole writer of the socket, so a slow client only delays itself
+        outbox = self.outbox
+        while True:
+            text = await outbox.get()
+            await self.send(text_data=text)
+
+    def query_param(self, name):
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        return params.get(name, [None])[0]
+
+    @database_sync_to_async
+    def authenticate_user(self):
+        # Get token from query string; the user usually comes from the cache
+        self.user = authenticate_token(self.query_param('token'))
+
+
+class BoardConsumer(BaseBoardConsumer):
+    """
+    Socket for one board. ?snapshot=1 sends the whole board right after
+    connecting, in place of a separate REST fetch; reconnecting clients
+    pass ?since=<seq> instead to receive only the frames they missed.
+    """
+    following = False
+
+    async def connect(self):
+        self.board_id = self.scope['url_route']['kwargs']['board_id']
+        self.board_group_name = f'board_{self.board_id}'
+
+        # Authenticate user via JWT token
+        await self.authenticate_user()
+
+        if self.user.is_anonymous:
+            await self.close()
+            return
+
+        # Check if user has access to board
+        has_access = await self.check_board_access()
+        if not has_access:
+            await self.close()
+            return
+
+        # Join board group
+        await self.channel_layer.group_add(
+            self.board_group_name,
+            self.channel_name
+        )
+
+        await hub.follow(self.board.pk)
+        self.following = True
+
+        await self.accept()
+        await self.start_writer()
+        await self.join_presence(self.board.pk)
+
+        since = parse_id(self.query_param('since'))
+        if self.query_param('snapshot') in ('1', 'true'):
+            await self.send_snapshot(self.board.pk)
+        elif since is not None:
+            await self.catch_up(self.board.pk, since)
+
+    async def disconnect(self, close_code):
+        await super().disconnect(close_code)
+        if self.following:
+            hub.unfollow(self.board.pk)
+            await tracker.leave(self.board.pk, self.user.pk)
+        # Leave board group
+        await self.channel_layer.group_discard(
+            self.board_group_name,
+            self.channel_name
+        )
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.parse_event(text_data)
+        if data is not None:
+            await self.relay(self.board.pk, data.get('action'), data.get('data', {}))
+
+    @database_sync_to_async
+    def check_board_access(self):
+        try:
+            if int(self.board_id) not in board_roles(self.user):
+                return False
+            self.board = Board.objects.get(id=self.board_id)
+            return True
+        except (Board.DoesNotExist, ValueError):
+            return False
+
+
+class MultiBoardConsumer(BaseBoardConsumer):
+    """
+    One socket for any number of boards.
+
+    Clients send {"action": "subscribe", "boards": [1, 2]} and
+    {"action": "unsubscribe", "boards": [2]}; any other action is relayed
+    to the subscribed board named in "board". Every frame carries the
+    board_id it belongs to. "snapshot": true in a subscribe message sends
+    each board's snapshot first; a resubscribing client adds
+    "since": {"1": <seq>} instead to receive only the frames it missed.
+    """
+    max_subscriptions = 100
+
+    async def connect(self):
+        self.boards = set()
+
+        await self.authenticate_user()
+        if self.user.is_anonymous:
+            await self.close()
+            return
+
+        await self.accept()
+        await self.start_writer()
+
+    async def disconnect(self, close_code):
+        await super().disconnect(close_code)
+        for board_id in self.boards:
+            hub.unfollow(board_id)
+            await tracker.leave(board_id, self.user.pk)
+            await self.channel_layer.group_discard(f'board_{board_id}', self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.parse_event(text_data)
+        if data is None:
+            await self.send_error('Invalid message')
+            return
+        action = data.get('action')
+
+        if action in ('subscribe', 'unsubscribe'):
+            board_ids = self.parse_board_ids(data.get('boards'))
+            if board_ids is None:
+                await self.send_error('"boards" must be a list of board ids')
+            elif action == 'subscribe':
+                await self.subscribe(board_ids, data.get('since'), data.get('snapshot') is True)
+            else:
+                await self.unsubscribe(board_ids)
+            return
+
+        board_id = data.get('board')
+        if board_id not in self.boards:
+            await self.send_error('Not subscribed to this board')
+            return
+        await self.relay(board_id, action, data.get('data', {}))
+
+    async def subscribe(self, board_ids, since=None, snapshot=False):
+        requested = board_ids - self.boards
+        room = self.max_subscriptions - len(self.boards)
+        # The whole batch is checked against the user's boards, loaded once
+        allowed = await self.accessible_boards(sorted(requested)[:room]) if room > 0 else set()
+        for board_id in allowed:
+            await self.channel_layer.group_add(f'board_{board_id}', self.channel_name)
+            await hub.follow(board_id)
+        self.boards |= allowed
+
+        await self.queue_frame(json.dumps({
+            'type': 'subscribed',
+            'boards': sorted(board_ids & self.boards),
+            'denied': sorted(requested - allowed),
+        }))
+        for board_id in sorted(allowed):
+            await self.join_presence(board_id)
+
+        if snapshot:
+            for board_id in sorted(allowed):
+                await self.send_snapshot(board_id)
+        elif isinstance(since, dict):
+            for board_id in sorted(allowed):
+                seq = since.get(str(board_id))
+                if isinstance(seq, int) and not isinstance(seq, bool):
+                    await self.catch_up(board_id, seq)
+
+    async def unsubscribe(self, board_ids):
+        removed = board_ids & self.boards
+        for board_id in removed:
+            hub.unfollow(board_id)
+            await tracker.leave(board_id, self.user.pk)
+            await self.channel_layer.group_discard(f'board_{board_id}', self.channel_name)
+        self.boards -= removed
+
+        await self.queue_frame(json.dumps({
+            'type': 'unsubscribed',
+            'boards': sorted(removed),
+        }))
+
+    async def send_error(self, message):
+        await self.queue_frame(json.dumps({'type': 'error', 'message': message}))
+
+    @staticmethod
+    def parse_board_ids(value):
+        if not isinstance(value, list):
+            return None
+        if not all(isinstance(item, int) and not isinstance(item, bool) for item in value):
+            return None
+        return set(value)
+
+    @database_sync_to_async
+    def accessible_boards(self, board_ids):
+        if not board_ids:
+            return set()
+        return set(board_ids) & board_roles(self.user).keys()
@@ -0,0 +1,96 @@
+"""
+Pillow side of the board background variants. Nothing here imports
+Django, so render_variants() runs in freshly spawned worker processes
+without setting it up.
+"""
+import hashlib
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+# Name: (width, height, crop). Cropped variants fill their box exactly,
+# the others fit inside it. Largest first: each is scaled down from the
+# previous one where that still covers its box.
+VARIANTS = {
+    'full': (1920, 1080, False),
+    'header': (960, 540, False),
+    'tile': (320, 180, True),
+}
+
+# Extension: (Pillow format, save options)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+READ_SIZE = 64 * 1024
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for data in iter(lambda: source.read(READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def variant_name(digest, variant, extension):
+    return f'{digest[:2]}/{digest}/{variant}.{extension}'
+
+
+def _save(image, path, extension):
+    # Written under a temporary name first, so readers never see half a file
+    image_format, options = FORMATS[extension]
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            image.save(temp, image_format, **options)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def render_variants(source, target_root):
+    """
+    Write the variants of the image at `source` under `target_root`, in a
+    directory named by the image's SHA-256, and return the digest. Files
+    already there are kept, so an image is only processed once however
+    many boards use it.
+    """
+    digest = file_digest(source)
+    paths = {
+        (variant, extension): os.path.join(target_root, variant_name(digest, variant, extension))
+        for variant in VARIANTS for extension in FORMATS
+    }
+    if all(os.path.exists(path) for path in paths.values()):
+        return digest
+
+    with Image.open(source) as image:
+        # JPEGs are scaled down by up to 8x while decoding; the square box
+        # keeps enough pixels whichever way the EXIF orientation turns it
+        longest = max(max(width, height) for width, height, _ in VARIANTS.values())
+        image.draft('RGB', (longest, longest))
+        base = ImageOps.exif_transpose(image).convert('RGB')
+
+    scaled = [base]
+    for variant, (width, height, crop) in VARIANTS.items():
+        parent = next(
+            candidate for candidate in reversed(scaled)
+            if candidate.width >= width and candidate.height >= height
+            or candidate is base
+        )
+        if crop:
+            resized = ImageOps.fit(parent, (width, height), Image.Resampling.LANCZOS)
+        else:
+            resized = parent.copy()
+            resized.thumbnail((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            scaled.append(resized)
+        for extension in FORMATS:
+            path = paths[(variant, extension)]
+            if not os.path.exists(path):
+                _save(resized, path, extension)
+    return digest
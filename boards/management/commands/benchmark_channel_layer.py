@@ -0,0 +1,135 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from boards.channel_layers import SQLiteChannelLayer
+
+GROUP = 'benchmark'
+
+
+async def _drain(layer, channel, count):
+    for _ in range(count):
+        await layer.receive(channel)
+
+
+async def point_to_point(layer, messages):
+    """
+    Send `messages` to one channel, then read them back.
+    """
+    channel = await layer.new_channel()
+    started = time.perf_counter()
+    for number in range(messages):
+        await layer.send(channel, {'type': 'benchmark.message', 'number': number})
+    await _drain(layer, channel, messages)
+    return time.perf_counter() - started
+
+
+async def fan_out(layer, messages, receivers):
+    """
+    group_send `messages` to a group of `receivers` channels in this
+    process, timed until every receiver has seen every message.
+    """
+    channels = [await layer.new_channel() for _ in range(receivers)]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+    started = time.perf_counter()
+    readers = [asyncio.ensure_future(_drain(layer, channel, messages)) for channel in channels]
+    for number in range(messages):
+        await layer.group_send(GROUP, {'type': 'benchmark.message', 'number': number})
+    await asyncio.gather(*readers)
+    elapsed = time.perf_counter() - started
+    for channel in channels:
+        await layer.group_discard(GROUP, channel)
+    return elapsed
+
+
+def _fan_out_worker(path, capacity, messages, receivers, ready, done):
+    async def run():
+        layer = SQLiteChannelLayer(path=path, capacity=capacity)
+        channels = [await layer.new_channel() for _ in range(receivers)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        ready.release()
+        await asyncio.gather(*(_drain(layer, channel, messages) for channel in channels))
+        done.put(time.time())
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Compare channel layer throughput: in-memory vs. the shared SQLite layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--receivers', type=int, default=10, help='Group members per process')
+        parser.add_argument(
+            '--processes', type=int, default=2,
+            help='Receiving processes for the cross-process SQLite run (0 to skip)'
+        )
+        parser.add_argument('--path', help='SQLite file to use (default: a temporary file)')
+
+    def handle(self, *args, **options):
+        messages = options['messages']
+        receivers = options['receivers']
+        capacity = messages + 1
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = options['path'] or os.path.join(directory, 'channel-layer.sqlite3')
+            layers = [
+                ('in-memory', lambda: InMemoryChannelLayer(capacity=capacity)),
+                ('sqlite', lambda: SQLiteChannelLayer(path=path, capacity=capacity)),
+            ]
+            for name, make_layer in layers:
+                elapsed = asyncio.run(point_to_point(make_layer(), messages))
+                self.report(name, 'send/receive', messages, elapsed)
+                elapsed = asyncio.run(fan_out(make_layer(), messages, receivers))
+                self.report(name, f'group fan-out x{receivers}', messages * receivers, elapsed)
+
+            if options['processes']:
+                elapsed = self.cross_process(path, capacity, messages, receivers, options['processes'])
+                deliveries = messages * receivers * options['processes']
+                self.report(
+                    'sqlite', f'fan-out x{receivers} in {options["processes"]} processes',
+                    deliveries, elapsed
+                )
+
+    def cross_process(self, path, capacity, messages, receivers, processes):
+        context = multiprocessing.get_context('spawn')
+        ready = context.Semaphore(0)
+        done = context.Queue()
+        workers = [
+            context.Process(
+                target=_fan_out_worker,
+                args=(path, capacity, messages, receivers, ready, done)
+            )
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready.acquire()
+
+        async def send():
+            layer = SQLiteChannelLayer(path=path, capacity=capacity)
+            started = time.time()
+            for number in range(messages):
+                await layer.group_send(GROUP, {'type': 'benchmark.message', 'number': number})
+            return started
+
+        started = asyncio.run(send())
+        finished = max(done.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+        # Wall clock: the finish times come from other processes
+        return finished - started
+
+    def report(self, layer, scenario, deliveries, elapsed):
+        self.stdout.write(
+            f'{layer:>10}  {scenario:<36} {deliveries:>8} msgs  '
+            f'{elapsed:8.3f}s  {deliveries / elapsed:>10.0f} msg/s'
+        )
@@ -0,0 +1,24 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from boards.backgrounds import store_variants, variants_root
+from boards.imaging import render_variants
+from boards.models import Board
+
+
+class Command(BaseCommand):
+    help = 'Render resized variants of board backgrounds that do not have them yet'
+
+    def handle(self, *args, **options):
+        boards = Board.objects.exclude(background_image='').exclude(
+            background_image__isnull=True
+        ).exclude(background_source=F('background_image'))
+        for board_id, name in boards.values_list('pk', 'background_image').iterator():
+            try:
+                digest = render_variants(default_storage.path(name), variants_root())
+            except Exception as exc:
+                self.stderr.write(f'Board {board_id}: {exc}')
+                continue
+            store_variants(board_id, name, digest)
+            self.stdout.write(f'Board {board_id}: {digest}')
@@ -0,0 +1,40 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from boards.attachments import abort_upload, part_path, storage_root
+from boards.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = 'Remove upload sessions that stopped receiving chunks, and their part files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=24,
+            help='Remove sessions idle for longer than this'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        removed = 0
+        for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+            abort_upload(session)
+            removed += 1
+
+        # Part files left behind by sessions deleted along with their card
+        directory = os.path.join(storage_root(), 'uploads')
+        live = {
+            os.path.basename(part_path(session))
+            for session in UploadSession.objects.only('pk')
+        }
+        orphans = 0
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.name in live or entry.stat().st_mtime > cutoff.timestamp():
+                    continue
+                os.remove(entry.path)
+                orphans += 1
+        self.stdout.write(f'Removed {removed} idle upload sessions and {orphans} orphaned part files')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Length
+from boards.models import List, Card
+from boards.ranking import MAX_RANK_LENGTH, rebalance
+
+
+class Command(BaseCommand):
+    help = 'Respace list and card rank keys that have grown too long'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-length', type=int, default=MAX_RANK_LENGTH,
+            help='Rebalance any parent holding a key longer than this'
+        )
+
+    def handle(self, *args, **options):
+        max_length = options['max_length']
+        for model, parent_field in ((List, 'board_id'), (Card, 'list_id')):
+            parent_ids = model.objects.annotate(
+                rank_length=Length('position')
+            ).filter(
+                rank_length__gt=max_length
+            ).order_by().values_list(parent_field, flat=True).distinct()
+
+            for parent_id in parent_ids:
+                count = rebalance(model, **{parent_field: parent_id})
+                self.stdout.write(
+                    f'Rebalanced {count} {model._meta.verbose_name_plural} '
+                    f'({parent_field}={parent_id})'
+                )
@@ -0,0 +1,14 @@
+from .buffering import buffered
+
+
+class BufferedSideEffectsMiddleware:
+    """
+    Hold activity entries and other committed side effects until the
+    response is ready, then flush each kind in one batch.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffered():
+            return self.get_response(request)
@@ -0,0 +1,142 @@
+# Generated by Django 6.0 on 2026-10-16 23:05
+
+import boards.models
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of boards.ranking.rank_sequence() as it stood when this
+# migration was written, so later changes to the ranking module do not
+# alter what it does
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+RANK_WIDTH = 6
+
+
+def _encode(value, width):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        chars.append(DIGITS[digit])
+    return ''.join(reversed(chars)).rstrip('0')
+
+
+def rank_sequence(count):
+    width = RANK_WIDTH
+    while BASE ** width <= count:
+        width += 1
+    spacing = BASE ** width // (count + 1)
+    return [_encode(spacing * index, width) for index in range(1, count + 1)]
+
+
+def assign_ranks(apps, schema_editor):
+    """
+    Convert the old dense integer positions into rank keys, keeping the
+    existing order of every board's lists and every list's cards.
+    """
+    Board = apps.get_model('boards', 'Board')
+    List = apps.get_model('boards', 'List')
+    Card = apps.get_model('boards', 'Card')
+
+    for board_id in Board.objects.values_list('id', flat=True).iterator():
+        lists = List.objects.filter(board_id=board_id).order_by('position', 'id')
+        _write_ranks(List, lists)
+        for list_id in lists.values_list('id', flat=True):
+            _write_ranks(Card, Card.objects.filter(list_id=list_id).order_by('position', 'id'))
+
+
+def assign_positions(apps, schema_editor):
+    """
+    Reverse of assign_ranks: dense integer positions in rank order.
+    """
+    List = apps.get_model('boards', 'List')
+    Card = apps.get_model('boards', 'Card')
+
+    for model, parent_field in ((List, 'board_id'), (Card, 'list_id')):
+        parent_ids = model.objects.order_by().values_list(parent_field, flat=True).distinct()
+        for parent_id in parent_ids:
+            queryset = model.objects.filter(**{parent_field: parent_id}).order_by('rank', 'id')
+            rows = list(queryset.only('id'))
+            for position, row in enumerate(rows):
+                row.position = position
+            model.objects.bulk_update(rows, ['position'], batch_size=500)
+
+
+def _write_ranks(model, queryset):
+    rows = list(queryset.only('id'))
+    for row, rank in zip(rows, rank_sequence(len(rows))):
+        row.rank = rank
+    model.objects.bulk_update(rows, ['rank'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='card',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='list',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='rank',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='list',
+            name='rank',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.RunPython(assign_ranks, assign_positions),
+        migrations.RemoveField(
+            model_name='card',
+            name='position',
+        ),
+        migrations.RemoveField(
+            model_name='list',
+            name='position',
+        ),
+        migrations.RenameField(
+            model_name='card',
+            old_name='rank',
+            new_name='position',
+        ),
+        migrations.RenameField(
+            model_name='list',
+            old_name='rank',
+            new_name='position',
+        ),
+        migrations.AlterModelOptions(
+            name='card',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AlterModelOptions(
+            name='list',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AlterField(
+            model_name='card',
+            name='attachments',
+            field=models.JSONField(default=boards.models.empty_list),
+        ),
+        migrations.AlterField(
+            model_name='card',
+            name='labels',
+            field=models.JSONField(default=boards.models.empty_list),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['list', 'position'], name='boards_card_list_id_1ea5d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(fields=['board', 'position'], name='boards_list_board_i_ada2a2_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-16 23:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0003_board_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveBigIntegerField()),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('operation', models.CharField(choices=[('UPSERT', 'Upsert'), ('DELETE', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='boards.board')),
+            ],
+            options={
+                'ordering': ['sequence', 'id'],
+                'indexes': [models.Index(fields=['board', 'sequence'], name='boards_boar_board_i_a08212_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-16 23:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0004_boardchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='activity',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name_plural': 'Activities'},
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['board', '-created_at', '-id'], name='boards_acti_board_i_568f16_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-16 23:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_board_access(apps, schema_editor):
+    """
+    One row per board owner and per member who is not also the owner.
+    """
+    Board = apps.get_model('boards', 'Board')
+    BoardAccess = apps.get_model('boards', 'BoardAccess')
+
+    rows = []
+    owners = dict(Board.objects.values_list('id', 'owner_id').iterator())
+    for board_id, owner_id in owners.items():
+        rows.append(BoardAccess(board_id=board_id, user_id=owner_id, role='owner'))
+    members = Board.members.through.objects.values_list('board_id', 'user_id').iterator()
+    for board_id, user_id in members:
+        if owners.get(board_id) != user_id:
+            rows.append(BoardAccess(board_id=board_id, user_id=user_id, role='member'))
+    BoardAccess.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0005_activity_feed_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('member', 'Member')], max_length=10)),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='boards.board')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='board_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'board', 'role'], name='boards_boar_user_id_9983f2_idx')],
+                'constraints': [models.UniqueConstraint(fields=('board', 'user'), name='boards_access_board_user_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_board_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 6.0 on 2026-10-16 23:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copies of the DDL: later changes to boards.search must not alter
+# what this migration did
+DOCUMENTS = 'boards_searchdocument'
+FTS_TABLE = f'{DOCUMENTS}_fts'
+
+
+def create_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = [
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, body, content='{DOCUMENTS}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='3')",
+            f"CREATE TRIGGER {DOCUMENTS}_ai AFTER INSERT ON {DOCUMENTS} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+            f"CREATE TRIGGER {DOCUMENTS}_ad AFTER DELETE ON {DOCUMENTS} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) "
+            f"VALUES ('delete', old.id, old.title, old.body); END",
+            f"CREATE TRIGGER {DOCUMENTS}_au AFTER UPDATE OF title, body ON {DOCUMENTS} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) "
+            f"VALUES ('delete', old.id, old.title, old.body); "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+        ]
+    elif vendor == 'postgresql':
+        statements = [
+            f"CREATE INDEX {DOCUMENTS}_tsv ON {DOCUMENTS} USING gin "
+            f"((setweight(to_tsvector('simple', title), 'A') || "
+            f"setweight(to_tsvector('simple', body), 'B')))",
+        ]
+    else:
+        statements = []
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {DOCUMENTS}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {DOCUMENTS}_tsv')
+
+
+def build_search_index(apps, schema_editor):
+    """
+    Create the database's full-text index, then fill it from the existing
+    cards, comments and checklist items.
+    """
+    create_search_index(schema_editor)
+
+    SearchDocument = apps.get_model('boards', 'SearchDocument')
+    Card = apps.get_model('boards', 'Card')
+    Comment = apps.get_model('boards', 'Comment')
+    ChecklistItem = apps.get_model('boards', 'ChecklistItem')
+
+    sources = [
+        ('card', Card.objects.values_list('id', 'id', 'list__board_id', 'title', 'description')),
+        ('comment', Comment.objects.values_list('id', 'card_id', 'card__list__board_id', 'text')),
+        ('checklistitem', ChecklistItem.objects.values_list(
+            'id', 'checklist__card_id', 'checklist__card__list__board_id', 'text'
+        )),
+    ]
+    for kind, rows in sources:
+        documents = []
+        for object_id, card_id, board_id, *text in rows.order_by('id').iterator():
+            title, body = text if len(text) == 2 else ('', text[0])
+            documents.append(SearchDocument(
+                kind=kind, object_id=object_id, card_id=card_id, board_id=board_id,
+                title=title, body=body
+            ))
+            if len(documents) >= 1000:
+                SearchDocument.objects.bulk_create(documents)
+                documents = []
+        SearchDocument.objects.bulk_create(documents)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0006_board_access'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='boards.board')),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='boards.card')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='boards_search_kind_object_uniq')],
+            },
+        ),
+        migrations.RunPython(build_search_index, remove_search_index),
+    ]
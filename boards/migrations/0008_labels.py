@@ -0,0 +1,113 @@
+# Generated by Django 6.0 on 2026-10-16 23:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _label_parts(entry):
+    """
+    (name, color) of an old JSON label entry: a plain string or an object
+    with a name (or title/text) and an optional color.
+    """
+    if isinstance(entry, dict):
+        name = entry.get('name') or entry.get('title') or entry.get('text') or ''
+        color = entry.get('color') or ''
+    else:
+        name, color = entry, ''
+    return str(name).strip()[:100], str(color)[:20]
+
+
+def copy_labels(apps, schema_editor):
+    """
+    Turn each card's JSON labels into Label rows of its board (one per
+    distinct name) and CardLabel links.
+    """
+    Card = apps.get_model('boards', 'Card')
+    Label = apps.get_model('boards', 'Label')
+    CardLabel = apps.get_model('boards', 'CardLabel')
+
+    labels = {}
+    links = []
+    cards = Card.objects.exclude(label_data=[]).values_list('id', 'list__board_id', 'label_data')
+    for card_id, board_id, entries in cards.iterator():
+        for entry in entries if isinstance(entries, list) else []:
+            name, color = _label_parts(entry)
+            if not name:
+                continue
+            label = labels.get((board_id, name))
+            if label is None:
+                label = labels[(board_id, name)] = Label.objects.create(
+                    board_id=board_id, name=name, color=color
+                )
+            links.append(CardLabel(card_id=card_id, label_id=label.pk))
+    CardLabel.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+
+
+def copy_labels_back(apps, schema_editor):
+    Card = apps.get_model('boards', 'Card')
+    CardLabel = apps.get_model('boards', 'CardLabel')
+
+    by_card = {}
+    rows = CardLabel.objects.order_by('id').values_list('card_id', 'label__name', 'label__color')
+    for card_id, name, color in rows.iterator():
+        by_card.setdefault(card_id, []).append({'name': name, 'color': color})
+    for card_id, entries in by_card.items():
+        Card.objects.filter(pk=card_id).update(label_data=entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0007_search_document'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='card',
+            old_name='labels',
+            new_name='label_data',
+        ),
+        migrations.CreateModel(
+            name='Label',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('color', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='labels', to='boards.board')),
+            ],
+            options={
+                'ordering': ['name', 'id'],
+                'constraints': [models.UniqueConstraint(fields=('board', 'name'), name='boards_label_board_name_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CardLabel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_labels', to='boards.card')),
+                ('label', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_labels', to='boards.label')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['label', 'card'], name='boards_card_label_i_e18b13_idx')],
+                'constraints': [models.UniqueConstraint(fields=('card', 'label'), name='boards_cardlabel_card_label_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='labels',
+            field=models.ManyToManyField(blank=True, related_name='cards', through='boards.CardLabel', to='boards.label'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['list', 'due_date'], name='boards_card_list_id_b0d663_idx'),
+        ),
+        migrations.RunPython(copy_labels, copy_labels_back),
+        migrations.RemoveField(
+            model_name='card',
+            name='label_data',
+        ),
+    ]
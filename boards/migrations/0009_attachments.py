@@ -0,0 +1,99 @@
+# Generated by Django 6.0 on 2026-10-16 23:33
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_links(apps, schema_editor):
+    """
+    Keep the old JSON attachment entries (URL strings or objects with a
+    url and optional name) as link attachments. Entries without a URL had
+    nothing to download and are dropped.
+    """
+    Card = apps.get_model('boards', 'Card')
+    Attachment = apps.get_model('boards', 'Attachment')
+
+    rows = []
+    for card_id, entries in Card.objects.exclude(link_data=[]).values_list('id', 'link_data').iterator():
+        for entry in entries if isinstance(entries, list) else []:
+            if isinstance(entry, dict):
+                url, name = entry.get('url') or '', entry.get('name') or ''
+            else:
+                url, name = str(entry), ''
+            if url:
+                rows.append(Attachment(card_id=card_id, url=url[:2000], name=(name or url)[:255]))
+    Attachment.objects.bulk_create(rows, batch_size=1000)
+
+
+def copy_links_back(apps, schema_editor):
+    Card = apps.get_model('boards', 'Card')
+    Attachment = apps.get_model('boards', 'Attachment')
+
+    by_card = {}
+    rows = Attachment.objects.exclude(url='').order_by('id').values_list('card_id', 'url', 'name')
+    for card_id, url, name in rows.iterator():
+        by_card.setdefault(card_id, []).append({'url': url, 'name': name})
+    for card_id, entries in by_card.items():
+        Card.objects.filter(pk=card_id).update(link_data=entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0008_labels'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='card',
+            old_name='attachments',
+            new_name='link_data',
+        ),
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(blank=True, max_length=2000)),
+                ('name', models.CharField(max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='boards.card')),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('blob', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='boards.blob')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('size', models.PositiveBigIntegerField()),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='boards.card')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_links, copy_links_back),
+        migrations.RemoveField(
+            model_name='card',
+            name='link_data',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0009_attachments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='background_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='board',
+            name='background_source',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
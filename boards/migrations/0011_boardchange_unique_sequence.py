@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-16 23:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def drop_shared_sequences(apps, schema_editor):
+    """
+    Older entries could share a sequence (one per change, not per object).
+    The logs of the boards that have such entries are dropped; clients of
+    those boards get a reset and refetch.
+    """
+    BoardChange = apps.get_model('boards', 'BoardChange')
+    shared = BoardChange.objects.values('board_id', 'sequence').annotate(
+        entries=Count('id')
+    ).filter(entries__gt=1).values_list('board_id', flat=True)
+    BoardChange.objects.filter(board_id__in=set(shared)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0010_board_background_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_shared_sequences, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='boardchange',
+            name='boards_boar_board_i_a08212_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='boardchange',
+            constraint=models.UniqueConstraint(fields=('board', 'sequence'), name='boards_boardchange_board_sequence_uniq'),
+        ),
+    ]
@@ -1,6 +1,12 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .ranking import rank_for_index
+
+
+def empty_list():
+    return []
 
 
 class Board(models.Model):
@@ -10,9 +16,20 @@ class Board(models.Model):
     members = models.ManyToManyField(User, related_name='member_boards', blank=True)
     background_color = models.CharField(max_length=7, default='#0079BF')  # Hex color
     background_image = models.ImageField(upload_to='board_backgrounds/', null=True, blank=True)
+    # SHA-256 of the image whose resized variants are on disk (see
+    # boards.backgrounds), and the background_image they were made from
+    background_hash = models.CharField(max_length=64, blank=True, editable=False)
+    background_source = models.CharField(max_length=100, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
+    # Bumped on every change to the board or anything on it
+    version = models.PositiveBigIntegerField(default=0)
+
+    # Only ever written with UPDATE statements (the version by
+    # boards.changes, the background fields by boards.backgrounds); save()
+    # of a board loaded earlier would put back stale values
+    update_only_fields = {'version', 'background_hash', 'background_source'}
 
     def __str__(self):
         return self.title
@@ -20,61 +37,173 @@ class Board(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields if not field.primary_key
+                ]
+            kwargs['update_fields'] = [
+                name for name in update_fields if name not in self.update_only_fields
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bump_version(cls, board_id, steps=1):
+        """
+        Advance the board's version by `steps` and return the new value, or
+        None if the board no longer exists. Call inside a transaction so the
+        returned value is the one this caller wrote.
+        """
+        if not cls.objects.filter(pk=board_id).update(version=models.F('version') + steps):
+            return None
+        return cls.objects.filter(pk=board_id).values_list('version', flat=True).first()
+
 
 class List(models.Model):
     title = models.CharField(max_length=255)
     board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='lists')
-    position = models.PositiveIntegerField(default=0)  # For ordering lists
+    position = models.CharField(max_length=64, default='')  # Rank key, see boards.ranking
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['position']
-        unique_together = ['board', 'position']
+        ordering = ['position', 'id']
+        indexes = [models.Index(fields=['board', 'position'])]
 
     def __str__(self):
         return f"{self.title} (Board: {self.board.title})"
 
     def save(self, *args, **kwargs):
         if self._state.adding and not self.position:
-            # Auto-assign position if not provided
-            max_position = List.objects.filter(board=self.board).aggregate(
-                models.Max('position')
-            )['position__max'] or -1
-            self.position = max_position + 1
+            # Append after the last list on the board
+            self.position = rank_for_index(List, {'board_id': self.board_id})
         super().save(*args, **kwargs)
 
 
+class Label(models.Model):
+    """
+    A label defined on a board; its cards are linked through CardLabel.
+    """
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='labels')
+    name = models.CharField(max_length=100)
+    color = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'name'], name='boards_label_board_name_uniq'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def matching(cls, label_ids, board_id):
+        """
+        Labels of board `board_id` named like the labels `label_ids`: what a
+        card moving to that board keeps. Labels never link across boards.
+        """
+        names = cls.objects.filter(pk__in=label_ids).values('name')
+        return cls.objects.filter(board_id=board_id, name__in=names)
+
+
 class Card(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     list = models.ForeignKey(List, on_delete=models.CASCADE, related_name='cards')
-    position = models.PositiveIntegerField(default=0)  # For ordering cards within a list
+    position = models.CharField(max_length=64, default='')  # Rank key within the list
     due_date = models.DateTimeField(null=True, blank=True)
-    labels = models.JSONField(default=list)  # FIXED: Use list instead of []
+    labels = models.ManyToManyField(Label, through='CardLabel', related_name='cards', blank=True)
     members = models.ManyToManyField(User, related_name='assigned_cards', blank=True)
-    attachments = models.JSONField(default=list)  # FIXED: Use list instead of []
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
 
     class Meta:
-        ordering = ['position']
-        unique_together = ['list', 'position']
+        ordering = ['position', 'id']
+        indexes = [
+            models.Index(fields=['list', 'position']),
+            models.Index(fields=['list', 'due_date']),
+        ]
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
         if self._state.adding and not self.position:
-            # Auto-assign position if not provided
-            max_position = Card.objects.filter(list=self.list).aggregate(
-                models.Max('position')
-            )['position__max'] or -1
-            self.position = max_position + 1
+            # Append after the last card in the list
+            self.position = rank_for_index(Card, {'list_id': self.list_id})
         super().save(*args, **kwargs)
 
 
+class CardLabel(models.Model):
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='card_labels')
+    label = models.ForeignKey(Label, on_delete=models.CASCADE, related_name='card_labels')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'label'], name='boards_cardlabel_card_label_uniq'),
+        ]
+        # Cards with a given label
+        indexes = [models.Index(fields=['label', 'card'])]
+
+
+class Blob(models.Model):
+    """
+    Uploaded file content, stored once per SHA-256 digest however many
+    attachments share it (see attachments.py for the storage layout).
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class Attachment(models.Model):
+    """
+    A file uploaded to a card (blob set) or a link to elsewhere (url set).
+    """
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='attachments')
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='attachments')
+    url = models.URLField(max_length=2000, blank=True)
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return self.name
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress: `offset` bytes of `size` have been
+    written to its part file so far.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.offset}/{self.size})"
+
+
 class Comment(models.Model):
     text = models.TextField()
     card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='comments')
@@ -135,8 +264,91 @@ class Activity(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
         verbose_name_plural = 'Activities'
+        # Serves the keyset-paginated feed of a board
+        indexes = [models.Index(fields=['board', '-created_at', '-id'])]
+
+    def __str__(self):
+        return f"{self.activity_type} by {self.user.username if self.user else 'Unknown'}"
+
+
+class BoardChange(models.Model):
+    """
+    Change log entry: `object_id` of `model` was written or deleted in the
+    change that moved its board to version `sequence`. Every entry has its
+    own sequence, so a board's log has no gaps and no repeats.
+    """
+    UPSERT = 'UPSERT'
+    DELETE = 'DELETE'
+    OPERATIONS = [
+        (UPSERT, 'Upsert'),
+        (DELETE, 'Delete'),
+    ]
+
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='changes')
+    sequence = models.PositiveBigIntegerField()
+    model = models.CharField(max_length=20)  # Model name, e.g. 'card'
+    object_id = models.PositiveBigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['sequence', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'sequence'], name='boards_boardchange_board_sequence_uniq')
+        ]
+
+    def __str__(self):
+        return f"{self.operation} {self.model} {self.object_id} (v{self.sequence})"
+
+
+class BoardAccess(models.Model):
+    """
+    Who can open which board: one row per owner and per member, kept in
+    sync with Board.owner and Board.members (see access.py). Lets "boards
+    of this user" be answered from one index instead of joining the
+    members table, which also repeats a board for its owner.
+    """
+    OWNER = 'owner'
+    MEMBER = 'member'
+    ROLES = [
+        (OWNER, 'Owner'),
+        (MEMBER, 'Member'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='board_access')
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='access')
+    role = models.CharField(max_length=10, choices=ROLES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'user'], name='boards_access_board_user_uniq'),
+        ]
+        # Covers the per-user lookups (board ids and roles) on its own
+        indexes = [models.Index(fields=['user', 'board', 'role'])]
+
+    def __str__(self):
+        return f"{self.user} {self.role} of {self.board}"
+
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of a card, comment or checklist item, with the board
+    and card it belongs to. The full-text index over title and body is
+    created per database by migration 0007_search_document.
+    """
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='+')
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=20)  # Model name, e.g. 'comment'
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='boards_search_kind_object_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.activity_type} by {self.user.username if self.user else 'Unknown'}"
\ No newline at end of file
+        return f"{self.kind} {self.object_id}"
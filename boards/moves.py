@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.utils import timezone
+from .changes import record_changes
+from .models import List, Label, Card, BoardChange
+from .ranking import rank_for_index
+from .search import move_card_documents
+from .signals import broadcast_board_event
+
+
+def move_card(card, destination_list_id=None, index=0):
+    """
+    Move `card` to `index` within the destination list (its own list when
+    no destination is given) in a single transaction.
+
+    Only the source and destination lists are locked, always in primary key
+    order, so concurrent drags queue up instead of deadlocking. The new rank
+    is picked while the locks are held, which means two moves into the same
+    gap cannot produce duplicate positions, and only the card's row is
+    written. Returns the locked (source, destination) lists, loaded with
+    their titles and board ids.
+
+    A card moving to another board keeps only the labels that board has
+    too (matched by name), relinked to that board's labels.
+    """
+    source_list_id = card.list_id
+    destination_list_id = destination_list_id or source_list_id
+
+    with transaction.atomic():
+        locked = List.objects.select_for_update().filter(
+            pk__in={source_list_id, destination_list_id}
+        ).order_by('pk').only('id', 'title', 'board_id')
+        lists = {list_obj.pk: list_obj for list_obj in locked}
+        if destination_list_id not in lists:
+            raise List.DoesNotExist('Destination list does not exist')
+        source, destination = lists[source_list_id], lists[destination_list_id]
+
+        position = rank_for_index(
+            Card, {'list_id': destination.pk}, index=index, exclude=card.pk
+        )
+        # Queryset update: skips the generic post_save broadcast in favour of
+        # the targeted card_moved event below
+        Card.objects.filter(pk=card.pk).update(
+            list_id=destination.pk, position=position, updated_at=timezone.now()
+        )
+        card.list = destination
+        card.position = position
+        record_changes(destination.board_id, Card, [card.pk])
+        if source.board_id != destination.board_id:
+            record_changes(source.board_id, Card, [card.pk], BoardChange.DELETE)
+            move_card_documents(card.pk, destination.board_id)
+            # Labels belong to one board: swap them for the destination's
+            # labels of the same names
+            card.labels.set(list(Label.matching(card.labels.values('pk'), destination.board_id)))
+
+        data = {
+            'id': card.pk,
+            'title': card.title,
+            'list_id': destination.pk,
+            'from_list_id': source.pk,
+            'position': position,
+        }
+        for board_id in {source.board_id, destination.board_id}:
+            broadcast_board_event(board_id, 'card_moved', dict(data, board_id=board_id))
+
+    return source, destination
@@ -1,4 +1,6 @@
 from rest_framework import permissions
+from .access import OWNER, board_roles
+from .signals import board_id_for
 
 
 class IsBoardMember(permissions.BasePermission):
@@ -6,17 +8,9 @@ class IsBoardMember(permissions.BasePermission):
     Permission to check if user is a member of the board.
     """
     def has_object_permission(self, request, view, obj):
-        # Handle different object types
-        if hasattr(obj, 'board'):
-            board = obj.board
-        elif hasattr(obj, 'list'):
-            board = obj.list.board
-        elif hasattr(obj, 'card'):
-            board = obj.card.list.board
-        else:
-            board = obj
-        
-        return board.owner == request.user or board.members.filter(id=request.user.id).exists()
+        # Works for boards and everything nested in them; the board id is
+        # looked up without loading the parent rows
+        return board_id_for(obj) in board_roles(request.user, request)
 
 
 class IsBoardOwnerOrMember(permissions.BasePermission):
@@ -24,9 +18,10 @@ class IsBoardOwnerOrMember(permissions.BasePermission):
     Permission to check if user is owner or member of the board.
     """
     def has_object_permission(self, request, view, obj):
+        role = board_roles(request.user, request).get(obj.pk)
         if request.method in permissions.SAFE_METHODS:
             # Allow read-only access for members
-            return obj.owner == request.user or obj.members.filter(id=request.user.id).exists()
+            return role is not None
         else:
             # Allow write access only for owner
-            return obj.owner == request.user
\ No newline at end of file
+            return role == OWNER
@@ -0,0 +1,221 @@
+"""
+Who is viewing each board, kept in the 'presence' cache instead of the
+database.
+
+Each (board, user) pair has its own small cache entry, {process: expires}.
+A process adds itself under a user when that user's first socket on the
+board connects and removes itself when the last one closes. While it has
+sockets, a process refreshes its entries every PRESENCE_TTL / 3 seconds.
+Because entries are per user, processes serving different users never
+write the same key; only one user's sockets on several processes share
+one. Entries of a process that died expire after PRESENCE_TTL and are
+noticed by the next refresh of any process on the board. Boards are read
+by looking up the entries of their members with one get_many(). Sockets
+on the board only receive the changes ('joined' or 'left' user ids).
+"""
+import asyncio
+import collections
+import logging
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.core.cache import caches
+
+from .models import BoardAccess
+from .signals import encode_frame
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL = 90
+# Entries outlive their expiry so a refresh still finds, and reports,
+# users whose last process died
+ENTRY_TIMEOUT = PRESENCE_TTL * 2
+PROCESS_ID = uuid.uuid4().hex[:12]
+
+
+def _cache():
+    return caches['presence']
+
+
+def _key(board_id, user_id):
+    return f'presence:{board_id}:{user_id}'
+
+
+def _live(processes, now):
+    return any(expires > now for expires in processes.values())
+
+
+def _members(board_ids):
+    """
+    {board_id: [user ids that can open it]}: the only users whose entries
+    are looked up.
+    """
+    members = {board_id: [] for board_id in board_ids}
+    rows = BoardAccess.objects.filter(board_id__in=board_ids).values_list('board_id', 'user_id')
+    for board_id, user_id in rows:
+        members[board_id].append(user_id)
+    return members
+
+
+def _entries(members):
+    keys = [_key(board_id, user_id) for board_id, user_ids in members.items() for user_id in user_ids]
+    return _cache().get_many(keys) if keys else {}
+
+
+def present_users(board_id):
+    members = _members([board_id])
+    entries = _entries(members)
+    now = time.time()
+    return sorted(
+        user_id for user_id in members[board_id]
+        if _live(entries.get(_key(board_id, user_id)) or {}, now)
+    )
+
+
+def presence_counts(board_ids):
+    """
+    {board_id: number of users viewing it} with one query and one cache
+    round trip.
+    """
+    members = _members(board_ids)
+    entries = _entries(members)
+    now = time.time()
+    return {
+        board_id: sum(
+            1 for user_id in user_ids
+            if _live(entries.get(_key(board_id, user_id)) or {}, now)
+        )
+        for board_id, user_ids in members.items()
+    }
+
+
+class PresenceTracker:
+    """
+    This process's sockets per (board, user), mirrored into the cache.
+    """
+    def __init__(self, process_id=PROCESS_ID):
+        self.process_id = process_id
+        self.local = collections.defaultdict(collections.Counter)
+        self.loop = None
+        self.refresher = None
+
+    async def join(self, board_id, user_id):
+        """
+        Count a socket of `user_id` on `board_id`. Returns the users now on
+        the board.
+        """
+        self._start()
+        connections = self.local[board_id]
+        connections[user_id] += 1
+        users, joined = await sync_to_async(self._join)(board_id, user_id)
+        if joined:
+            await self._broadcast(board_id, joined=[user_id])
+        return users
+
+    async def leave(self, board_id, user_id):
+        connections = self.local.get(board_id)
+        if not connections or not connections[user_id]:
+            return
+        connections[user_id] -= 1
+        if connections[user_id]:
+            return
+        del connections[user_id]
+        if not connections:
+            del self.local[board_id]
+        if await sync_to_async(self._leave)(board_id, user_id):
+            await self._broadcast(board_id, left=[user_id])
+
+    def _join(self, board_id, user_id):
+        cache = _cache()
+        now = time.time()
+        key = _key(board_id, user_id)
+        processes = cache.get(key) or {}
+        joined = not _live(processes, now)
+        processes = {process: expires for process, expires in processes.items() if expires > now}
+        processes[self.process_id] = now + PRESENCE_TTL
+        cache.set(key, processes, ENTRY_TIMEOUT)
+        return present_users(board_id), joined
+
+    def _leave(self, board_id, user_id):
+        cache = _cache()
+        now = time.time()
+        key = _key(board_id, user_id)
+        processes = cache.get(key) or {}
+        processes.pop(self.process_id, None)
+        processes = {process: expires for process, expires in processes.items() if expires > now}
+        if processes:
+            cache.set(key, processes, ENTRY_TIMEOUT)
+        else:
+            cache.delete(key)
+        return not processes
+
+    def _refresh(self, boards):
+        """
+        Re-stamp this process's users on `boards` ({board_id: [user ids]})
+        and drop the entries that expired elsewhere. Returns the users gone
+        from each board.
+        """
+        cache = _cache()
+        now = time.time()
+        members = _members(list(boards))
+        pairs = {
+            _key(board_id, user_id): (board_id, user_id)
+            for board_id, user_ids in members.items() for user_id in user_ids
+        }
+        entries = cache.get_many(list(pairs))
+        updated = {}
+        for board_id, user_ids in boards.items():
+            for user_id in user_ids:
+                key = _key(board_id, user_id)
+                processes = entries.pop(key, None) or {}
+                processes = {process: expires for process, expires in processes.items() if expires > now}
+                processes[self.process_id] = now + PRESENCE_TTL
+                updated[key] = processes
+        left = {board_id: [] for board_id in boards}
+        expired = [key for key, processes in entries.items() if not _live(processes, now)]
+        for key in expired:
+            board_id, user_id = pairs[key]
+            left[board_id].append(user_id)
+        cache.set_many(updated, ENTRY_TIMEOUT)
+        if expired:
+            cache.delete_many(expired)
+        return left
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is loop and not self.refresher.done():
+            return
+        self.loop = loop
+        self.refresher = loop.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(PRESENCE_TTL / 3)
+            boards = {board_id: list(users) for board_id, users in self.local.items()}
+            if not boards:
+                continue
+            try:
+                left = await sync_to_async(self._refresh)(boards)
+            except Exception:
+                logger.exception('Refreshing board presence failed')
+                continue
+            for board_id, user_ids in left.items():
+                if user_ids:
+                    await self._broadcast(board_id, left=user_ids)
+
+    async def _broadcast(self, board_id, joined=(), left=()):
+        frame = {'type': 'presence', 'board_id': board_id}
+        if joined:
+            frame['joined'] = list(joined)
+        if left:
+            frame['left'] = list(left)
+        await get_channel_layer().group_send(f'board_{board_id}', {
+            'type': 'board_update',
+            'board_id': board_id,
+            'text': encode_frame(frame)
+        })
+
+
+tracker = PresenceTracker()
@@ -0,0 +1,255 @@
+"""
+Lexicographic rank keys for ordering lists within a board and cards within
+a list.
+
+A rank is a base-36 fraction written without the leading "0." and without
+trailing zeros, so plain string comparison gives the right order and there
+is always room for another key between two different ranks. Inserting,
+moving or appending therefore only ever writes the row being placed. Keys
+grow when the same gap is split over and over; once a key is longer than
+MAX_RANK_LENGTH its siblings are respaced by a background rebalance, and a
+key that would not fit the position column respaces them right away.
+"""
+import logging
+import queue
+import threading
+
+from django.apps import apps
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+# Width of freshly generated keys and the gap left between appended keys
+RANK_WIDTH = 6
+APPEND_STEP = BASE ** 2
+MAX_RANK_LENGTH = 24
+
+
+# Sent after a bulk rank rewrite that bypassed post_save, with the
+# `parent` filter it applied to (e.g. {'list_id': 3}), the rewritten `ids`
+# and their new `positions`
+ranks_changed = Signal()
+
+
+class RankCollision(ValueError):
+    """
+    Raised when no key fits between two neighbours (they share a rank).
+    """
+
+
+def _encode(value, width):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        chars.append(DIGITS[digit])
+    return ''.join(reversed(chars)).rstrip('0')
+
+
+def _decode(rank, width):
+    return int(rank.ljust(width, '0'), BASE)
+
+
+def _midpoint(low, high):
+    # low < high; low may be '' (zero) and high None (one)
+    if high is not None:
+        common = 0
+        while (low[common] if common < len(low) else '0') == high[common]:
+            common += 1
+        if common:
+            return high[:common] + _midpoint(low[common:], high[common:])
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else BASE
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit + 1) // 2]
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def rank_between(before=None, after=None):
+    """
+    Return a rank that sorts strictly between `before` and `after`.
+    Either side may be None for the start or end of the sequence.
+    """
+    if before is not None and after is not None and before >= after:
+        raise RankCollision(f'No rank between {before!r} and {after!r}')
+    if after == '':
+        # The lowest possible key: nothing sorts before it
+        raise RankCollision('No rank before the empty rank')
+
+    if after is None and before is not None:
+        # Appending: step forward at a fixed width instead of halving the
+        # remaining space, so long runs of appends keep short keys
+        width = max(len(before), RANK_WIDTH)
+        value = _decode(before, width) + APPEND_STEP
+        if value < BASE ** width:
+            return _encode(value, width)
+    elif before is None and after is not None:
+        width = max(len(after), RANK_WIDTH)
+        value = _decode(after, width) - APPEND_STEP
+        if value > 0:
+            return _encode(value, width)
+
+    return _midpoint(before or '', after)
+
+
+def rank_sequence(count):
+    """
+    Return `count` evenly spaced, increasing ranks.
+    """
+    width = RANK_WIDTH
+    while BASE ** width <= count:
+        width += 1
+    spacing = BASE ** width // (count + 1)
+    return [_encode(spacing * index, width) for index in range(1, count + 1)]
+
+
+def _rank_at(siblings, index):
+    ranks = siblings.values_list('position', flat=True)
+    if index is None:
+        return rank_between(ranks.last(), None)
+    if index <= 0:
+        return rank_between(None, ranks.first())
+    neighbours = list(ranks[index - 1:index + 1])
+    if not neighbours:
+        return rank_between(ranks.last(), None)
+    before = neighbours[0]
+    after = neighbours[1] if len(neighbours) > 1 else None
+    return rank_between(before, after)
+
+
+def rank_for_index(model, parent, index=None, exclude=None):
+    """
+    Rank that places a row at `index` among the rows of `model` under
+    `parent` (e.g. {'list_id': 3}), ignoring `exclude`, the pk of the row
+    being moved. Only the two neighbouring keys are read; a missing or
+    out-of-range index appends.
+    """
+    siblings = model.objects.filter(**parent)
+    if exclude is not None:
+        siblings = siblings.exclude(pk=exclude)
+    try:
+        rank = _rank_at(siblings, index)
+    except RankCollision:
+        # Two neighbours share a rank: respace the siblings and retry
+        rebalance(model, **parent)
+        rank = _rank_at(siblings, index)
+    if len(rank) > model._meta.get_field('position').max_length:
+        # Too long for the column: the background rebalance would be too late
+        rebalance(model, **parent)
+        rank = _rank_at(siblings, index)
+    (parent_field, parent_id), = parent.items()
+    check_rank_length(model, parent_field, parent_id, rank)
+    return rank
+
+
+def rebalance(model, **parent):
+    """
+    Respace the ranks of every row of `model` under `parent`
+    (e.g. board_id=1) with one bulk UPDATE.
+    """
+    with transaction.atomic():
+        rows = list(
+            model.objects.select_for_update().filter(**parent).only('id', 'position')
+        )
+        for row, rank in zip(rows, rank_sequence(len(rows))):
+            row.position = rank
+        model.objects.bulk_update(rows, ['position'])
+        ranks_changed.send(
+            sender=model, parent=parent,
+            ids=[row.pk for row in rows], positions=[row.position for row in rows]
+        )
+    return len(rows)
+
+
+def reorder(model, parent, ids):
+    """
+    Put the rows `ids` of `model` under `parent` into the given order with a
+    single UPDATE. The rows trade their existing rank slots among
+    themselves, so siblings that are not listed keep their places. Returns
+    False without writing if an id is repeated or not under `parent`.
+    """
+    if len(set(ids)) != len(ids):
+        return False
+    with transaction.atomic():
+        rows = list(
+            model.objects.select_for_update().filter(
+                pk__in=ids, **parent
+            ).only('id', 'position')
+        )
+        if len(rows) != len(ids):
+            return False
+        slots = sorted(row.position for row in rows)
+        if len(set(slots)) != len(slots):
+            # Shared ranks would leave the requested order to the id tiebreak
+            rebalance(model, **parent)
+            rows = list(model.objects.filter(pk__in=ids).only('id', 'position'))
+            slots = sorted(row.position for row in rows)
+
+        rows_by_id = {row.pk: row for row in rows}
+        ordered = [rows_by_id[pk] for pk in ids]
+        for row, rank in zip(ordered, slots):
+            row.position = rank
+        model.objects.bulk_update(ordered, ['position'])
+        ranks_changed.send(
+            sender=model, parent=parent,
+            ids=list(ids), positions=[row.position for row in ordered]
+        )
+    return True
+
+
+class Rebalancer:
+    """
+    Background worker that respaces sibling ranks once a key grows past
+    MAX_RANK_LENGTH. Requests for the same parent are de-duplicated while
+    queued.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, model, parent_field, parent_id):
+        job = (model._meta.label, parent_field, parent_id)
+        with self._lock:
+            if job in self._pending:
+                return
+            self._pending.add(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='rank-rebalancer', daemon=True
+                )
+                self._thread.start()
+        self._queue.put(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._pending.discard(job)
+            label, parent_field, parent_id = job
+            close_old_connections()
+            try:
+                rebalance(apps.get_model(label), **{parent_field: parent_id})
+            except Exception:
+                logger.exception('Rank rebalance failed for %s %s=%s', *job)
+            finally:
+                close_old_connections()
+
+
+rebalancer = Rebalancer()
+
+
+def check_rank_length(model, parent_field, parent_id, rank):
+    """
+    Queue a rebalance of the parent once `rank` has grown too long.
+    The job starts after the current transaction commits.
+    """
+    if len(rank) > MAX_RANK_LENGTH:
+        transaction.on_commit(
+            lambda: rebalancer.schedule(model, parent_field, parent_id)
+        )
@@ -0,0 +1,127 @@
+"""
+Recent board events kept in memory so a reconnecting socket can catch up
+without refetching the board.
+
+Server frames carry `seq`, the board version their change produced. While
+any socket in this process follows a board, the process-wide ReplayHub is
+a member of the board's group too and keeps the last REPLAY_SIZE frames.
+A client that reconnects with the last seq it saw gets every newer frame
+from the buffer, or a resync_required frame when the buffer no longer
+reaches back that far. Buffers outlive their last socket by REPLAY_GRACE
+seconds so a quick reconnect still finds them.
+"""
+import asyncio
+import collections
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+from .models import Board
+
+logger = logging.getLogger(__name__)
+
+REPLAY_SIZE = 256
+REPLAY_GRACE = 60
+
+
+class BoardReplay:
+    def __init__(self, floor):
+        # Every frame with seq > floor is in `frames` (or was never sent)
+        self.floor = floor
+        self.frames = collections.deque()
+        self.followers = 0
+        self.idle_since = None
+
+    def add(self, seq, text):
+        self.frames.append((seq, text))
+        if len(self.frames) > REPLAY_SIZE:
+            evicted, _ = self.frames.popleft()
+            self.floor = max(self.floor, evicted)
+
+    def since(self, seq):
+        """
+        (seq, text) of the frames newer than `seq` in seq order, or None if
+        some may be missing.
+        """
+        if seq < self.floor:
+            return None
+        return sorted(frame for frame in self.frames if frame[0] > seq)
+
+
+class ReplayHub:
+    def __init__(self):
+        self.boards = {}
+        self.loop = None
+        self.channel = None
+        self.reader = None
+        self.sweeper = None
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is loop and not self.reader.done():
+            return
+        self.loop = loop
+        self.boards = {}
+        self.channel = await get_channel_layer().new_channel()
+        self.reader = loop.create_task(self._read())
+        self.sweeper = loop.create_task(self._sweep())
+
+    async def follow(self, board_id):
+        """
+        Start (or keep) buffering `board_id` for a socket that follows it.
+        """
+        await self._start()
+        replay = self.boards.get(board_id)
+        if replay is None:
+            # Nothing is replayable until the starting version is known
+            replay = self.boards[board_id] = BoardReplay(float('inf'))
+            replay.followers += 1
+            # Join first, then read the version: a change landing in between
+            # is buffered rather than lost
+            await get_channel_layer().group_add(f'board_{board_id}', self.channel)
+            replay.floor = await self._version(board_id)
+        else:
+            replay.followers += 1
+        replay.idle_since = None
+
+    def unfollow(self, board_id):
+        replay = self.boards.get(board_id)
+        if replay is not None:
+            replay.followers -= 1
+            if replay.followers <= 0:
+                replay.idle_since = time.monotonic()
+
+    def since(self, board_id, seq):
+        replay = self.boards.get(board_id)
+        return replay.since(seq) if replay is not None else None
+
+    @database_sync_to_async
+    def _version(self, board_id):
+        return Board.objects.filter(pk=board_id).values_list('version', flat=True).first() or 0
+
+    async def _read(self):
+        layer = get_channel_layer()
+        while True:
+            message = await layer.receive(self.channel)
+            replay = self.boards.get(message.get('board_id'))
+            # Relayed client messages carry no seq and are not replayed
+            if replay is not None and message.get('seq') is not None and 'text' in message:
+                replay.add(message['seq'], message['text'])
+
+    async def _sweep(self):
+        layer = get_channel_layer()
+        while True:
+            await asyncio.sleep(REPLAY_GRACE / 4)
+            cutoff = time.monotonic() - REPLAY_GRACE
+            for board_id, replay in list(self.boards.items()):
+                if replay.idle_since is not None and replay.idle_since < cutoff:
+                    del self.boards[board_id]
+                    try:
+                        await layer.group_discard(f'board_{board_id}', self.channel)
+                    except Exception:
+                        logger.exception('Leaving board %s replay group failed', board_id)
+
+
+hub = ReplayHub()
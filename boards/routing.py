@@ -3,4 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/board/(?P<board_id>\w+)/$', consumers.BoardConsumer.as_asgi()),
+    # Single connection subscribing to many boards
+    re_path(r'ws/boards/$', consumers.MultiBoardConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""
+Full-text search over card titles and descriptions, comments and
+checklist items.
+
+Every searchable object has a SearchDocument row, written from the save
+and delete signals. The inverted index over those rows is native to the
+database: an external-content FTS5 table kept current by triggers on
+SQLite, a GIN index over a weighted tsvector expression on PostgreSQL.
+Either way a query is one index lookup joined to the user's BoardAccess
+rows, and titles weigh more than bodies in the ranking. Other databases
+fall back to unindexed icontains matching over the same rows.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Board, BoardAccess, Card, Comment, Checklist, ChecklistItem, SearchDocument
+
+# Words of a query that are used; the rest is ignored
+MAX_QUERY_TERMS = 10
+# The last word also matches longer words once it is this long; shorter
+# prefixes match too much of the index to rank quickly
+MIN_PREFIX_LENGTH = 3
+
+# Fields whose change needs the object's document rewritten
+INDEXED_FIELDS = {
+    Card: {'title', 'description', 'list'},
+    Comment: {'text', 'card'},
+    ChecklistItem: {'text', 'checklist'},
+}
+
+DOCUMENTS = SearchDocument._meta.db_table
+FTS_TABLE = f'{DOCUMENTS}_fts'
+# Must match the expression indexed by migration 0007 exactly for
+# PostgreSQL to use the index
+TSVECTOR = (
+    "setweight(to_tsvector('simple', d.title), 'A') || "
+    "setweight(to_tsvector('simple', d.body), 'B')"
+)
+
+
+def document_for(instance, board_id):
+    """
+    Unsaved SearchDocument for a Card, Comment or ChecklistItem on
+    `board_id`, or None if its card is gone.
+    """
+    if isinstance(instance, Card):
+        card_id, title, body = instance.pk, instance.title, instance.description
+    elif isinstance(instance, Comment):
+        card_id, title, body = instance.card_id, '', instance.text
+    elif ChecklistItem.checklist.is_cached(instance):
+        card_id, title, body = instance.checklist.card_id, '', instance.text
+    else:
+        card_id = Checklist.objects.filter(pk=instance.checklist_id).values_list(
+            'card_id', flat=True
+        ).first()
+        title, body = '', instance.text
+    if card_id is None or board_id is None:
+        return None
+    return SearchDocument(
+        board_id=board_id, card_id=card_id, kind=instance._meta.model_name,
+        object_id=instance.pk, title=title, body=body
+    )
+
+
+def index_documents(documents):
+    """
+    Insert or update `documents` in one statement.
+    """
+    SearchDocument.objects.bulk_create(
+        documents, update_conflicts=True, unique_fields=['kind', 'object_id'],
+        update_fields=['board', 'card', 'title', 'body']
+    )
+
+
+def remove_documents(model, object_ids):
+    SearchDocument.objects.filter(
+        kind=model._meta.model_name, object_id__in=object_ids
+    ).delete()
+
+
+def move_card_documents(card_id, board_id):
+    """
+    Re-home a card's documents, and those of its comments and checklist
+    items, if the card moved to another board.
+    """
+    SearchDocument.objects.filter(card_id=card_id).exclude(board_id=board_id).update(board_id=board_id)
+
+
+def move_checklist_documents(checklist_id, card_id, board_id):
+    """
+    Re-home the documents of a checklist's items after the checklist was
+    moved to another card.
+    """
+    SearchDocument.objects.filter(
+        kind=ChecklistItem._meta.model_name,
+        object_id__in=ChecklistItem.objects.filter(checklist_id=checklist_id).values('pk')
+    ).exclude(card_id=card_id, board_id=board_id).update(card_id=card_id, board_id=board_id)
+
+
+def query_terms(text):
+    return re.findall(r'\w+', text or '')[:MAX_QUERY_TERMS]
+
+
+class SearchResults:
+    """
+    Ranked matches of `terms` on the boards `user_id` can open, best first.
+    Sliced like a queryset; each slice runs one query.
+    """
+    def __init__(self, user_id, terms, board_id=None):
+        self.user_id = user_id
+        self.terms = terms
+        self.board_id = board_id
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('SearchResults only supports slicing')
+        start = key.start or 0
+        if key.stop is None or key.stop <= start or not self.terms:
+            return []
+        return self.fetch(key.stop - start, start)
+
+    def fetch(self, limit, offset):
+        vendor = connection.vendor
+        prefix = len(self.terms[-1]) >= MIN_PREFIX_LENGTH
+        if vendor == 'sqlite':
+            # Every term quoted and required
+            match = ' '.join(f'"{term}"' for term in self.terms) + ('*' if prefix else '')
+            score = f'-bm25({FTS_TABLE}, 10.0, 1.0)'
+            source = f'{FTS_TABLE} f JOIN {DOCUMENTS} d ON d.id = f.rowid'
+            condition = f'{FTS_TABLE} MATCH %s'
+            source_params, condition_params = [], [match]
+        elif vendor == 'postgresql':
+            match = ' & '.join(self.terms) + (':*' if prefix else '')
+            score = f'ts_rank({TSVECTOR}, q)'
+            source = f"{DOCUMENTS} d CROSS JOIN to_tsquery('simple', %s) q"
+            condition = f'({TSVECTOR}) @@ q'
+            source_params, condition_params = [match], []
+        else:
+            return self.fetch_unindexed(limit, offset)
+
+        board_filter = ''
+        if self.board_id is not None:
+            board_filter = 'AND d.board_id = %s'
+            condition_params.append(self.board_id)
+
+        sql = f"""
+            SELECT d.kind, d.object_id, d.card_id, d.board_id, d.title, d.body, {score} AS score
+            FROM {source}
+            JOIN {BoardAccess._meta.db_table} a ON a.board_id = d.board_id AND a.user_id = %s
+            JOIN {Board._meta.db_table} b ON b.id = d.board_id
+            JOIN {Card._meta.db_table} c ON c.id = d.card_id
+            WHERE {condition} AND NOT b.archived AND NOT c.archived {board_filter}
+            ORDER BY score DESC, d.id
+            LIMIT %s OFFSET %s
+        """
+        params = source_params + [self.user_id] + condition_params + [limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def fetch_unindexed(self, limit, offset):
+        """
+        Same results from plain icontains filters, for databases without
+        a full-text index. Title matches rank first.
+        """
+        documents = SearchDocument.objects.filter(
+            board__in=BoardAccess.objects.filter(user_id=self.user_id).values('board_id'),
+            board__archived=False, card__archived=False
+        )
+        if self.board_id is not None:
+            documents = documents.filter(board_id=self.board_id)
+        title_match = Q()
+        for term in self.terms:
+            documents = documents.filter(Q(title__icontains=term) | Q(body__icontains=term))
+            title_match &= Q(title__icontains=term)
+        documents = documents.annotate(score=Case(
+            When(title_match, then=Value(1)), default=Value(0), output_field=IntegerField()
+        )).order_by('-score', 'id')
+        return list(documents.values(
+            'kind', 'object_id', 'card_id', 'board_id', 'title', 'body', 'score'
+        )[offset:offset + limit])
@@ -1,21 +1,102 @@
+import re
+
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Board, List, Card, Comment, Checklist, ChecklistItem, Activity
+from .models import (
+    Board, List, Label, Card, Comment, Checklist, ChecklistItem, Activity, Attachment, UploadSession
+)
+
+
+def parse_field_list(value):
+    """
+    Split a comma separated query parameter such as "id,title,lists.cards".
+    """
+    if not value:
+        return set()
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def parse_id(value):
+    """
+    Non-negative integer written in ASCII digits, or None. (str.isdigit()
+    also accepts characters such as '²' that int() rejects.)
+    """
+    if value is None or not re.fullmatch(r'[0-9]+', value):
+        return None
+    return int(value)
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets for read responses.
+
+    ?fields=id,title,lists.title limits the output to the named fields, and
+    ?expand=lists includes fields listed in Meta.expandable_fields, which are
+    left out by default. Dotted names address nested serializers. A
+    'fields'/'expand' entry in the serializer context overrides the query
+    string.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        # Only trim output: serializers validating input keep every field
+        if hasattr(self, 'initial_data'):
+            return fields
+
+        path = self._field_path()
+        selected = self._names_at(self._requested('fields'), path)
+        expanded = self._names_at(self._requested('expand'), path) | selected
+
+        for name in getattr(self.Meta, 'expandable_fields', []):
+            if name not in expanded:
+                fields.pop(name, None)
+        if selected:
+            for name in list(fields):
+                if name not in selected:
+                    fields.pop(name)
+        return fields
+
+    def _requested(self, param):
+        if param in self.context:
+            return set(self.context[param])
+        request = self.context.get('request')
+        if request is None:
+            return set()
+        return parse_field_list(request.query_params.get(param))
+
+    def _field_path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(names))
+
+    @staticmethod
+    def _names_at(requested, path):
+        prefix = f'{path}.' if path else ''
+        return {
+            name[len(prefix):].split('.', 1)[0]
+            for name in requested
+            if name.startswith(prefix)
+        }
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
-class ChecklistItemSerializer(serializers.ModelSerializer):
+class ChecklistItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ChecklistItem
-        fields = ['id', 'text', 'completed', 'position', 'created_at', 'updated_at']
+        fields = ['id', 'checklist', 'text', 'completed', 'position', 'created_at', 'updated_at']
 
 
-class ChecklistSerializer(serializers.ModelSerializer):
+class ChecklistSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = ChecklistItemSerializer(many=True, read_only=True)
     
     class Meta:
@@ -23,7 +104,7 @@ class ChecklistSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'card', 'items', 'created_at', 'updated_at']
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     
     class Meta:
@@ -32,7 +113,64 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['author', 'created_at', 'updated_at']
 
 
-class CardSerializer(serializers.ModelSerializer):
+class LabelSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Label
+        fields = ['id', 'board', 'name', 'color']
+
+    def validate_board(self, value):
+        # Cards link to labels of their own board only
+        if self.instance is not None and value.pk != self.instance.board_id:
+            raise serializers.ValidationError('A label cannot move to another board.')
+        return value
+
+
+class AttachmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Uploaded files and links. Creating one through this serializer adds a
+    link; files go through an upload session. The url of an uploaded file
+    is its download endpoint.
+    """
+    class Meta:
+        model = Attachment
+        fields = ['id', 'card', 'name', 'url', 'content_type', 'size', 'uploaded_by', 'created_at']
+        read_only_fields = ['content_type', 'size', 'uploaded_by', 'created_at']
+        extra_kwargs = {'url': {'required': True, 'allow_blank': False}}
+
+    def validate_card(self, value):
+        if self.instance is not None and value.pk != self.instance.card_id:
+            raise serializers.ValidationError('An attachment cannot move to another card.')
+        return value
+
+    def validate(self, data):
+        if self.instance is not None and self.instance.blob_id and 'url' in data:
+            raise serializers.ValidationError({'url': 'Uploaded files keep their download url.'})
+        return data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.blob_id and 'url' in data:
+            data['url'] = reverse(
+                'attachment-download', args=[instance.pk], request=self.context.get('request')
+            )
+        return data
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'card', 'name', 'content_type', 'size', 'offset', 'created_at']
+        read_only_fields = ['offset', 'created_at']
+
+    def validate_size(self, value):
+        if value > settings.ATTACHMENT_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Attachments are limited to {settings.ATTACHMENT_MAX_SIZE} bytes.'
+            )
+        return value
+
+
+class CardSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     members = UserSerializer(many=True, read_only=True)
     member_ids = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(),
@@ -41,6 +179,15 @@ class CardSerializer(serializers.ModelSerializer):
         write_only=True,
         required=False
     )
+    labels = LabelSerializer(many=True, read_only=True)
+    label_ids = serializers.PrimaryKeyRelatedField(
+        queryset=Label.objects.all(),
+        source='labels',
+        many=True,
+        write_only=True,
+        required=False
+    )
+    attachments = AttachmentSerializer(many=True, read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
     checklists = ChecklistSerializer(many=True, read_only=True)
     
@@ -48,22 +195,40 @@ class CardSerializer(serializers.ModelSerializer):
         model = Card
         fields = [
             'id', 'title', 'description', 'list', 'position', 'due_date',
-            'labels', 'members', 'member_ids', 'attachments', 'archived',
+            'labels', 'label_ids', 'members', 'member_ids', 'attachments', 'archived',
             'comments', 'checklists', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['position', 'created_at', 'updated_at']
+
+    def validate(self, data):
+        labels = data.get('labels')
+        list_obj = data.get('list') or getattr(self.instance, 'list', None)
+        if labels:
+            if list_obj is not None and any(label.board_id != list_obj.board_id for label in labels):
+                raise serializers.ValidationError({'label_ids': 'Labels must belong to the card\'s board.'})
+        elif labels is None and self.instance is not None and 'list' in data \
+                and list_obj.board_id != self.instance.list.board_id:
+            # Moving to another board: keep the labels that board also has
+            data['labels'] = list(Label.matching(self.instance.labels.values('pk'), list_obj.board_id))
+        return data
 
 
-class ListSerializer(serializers.ModelSerializer):
+class ListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     cards = CardSerializer(many=True, read_only=True)
     
     class Meta:
         model = List
         fields = ['id', 'title', 'board', 'position', 'cards', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['position', 'created_at', 'updated_at']
+
 
+def background_variants(board, request):
+    # Imported here: boards.backgrounds logs changes, which use these serializers
+    from .backgrounds import variant_urls
+    return variant_urls(board, request)
 
-class BoardSerializer(serializers.ModelSerializer):
+
+class BoardSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     members = UserSerializer(many=True, read_only=True)
     member_ids = serializers.PrimaryKeyRelatedField(
@@ -73,19 +238,61 @@ class BoardSerializer(serializers.ModelSerializer):
         write_only=True,
         required=False
     )
+    labels = LabelSerializer(many=True, read_only=True)
     lists = ListSerializer(many=True, read_only=True)
+    background_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Board
         fields = [
             'id', 'title', 'description', 'owner', 'members', 'member_ids',
-            'background_color', 'background_image', 'archived', 'lists',
-            'created_at', 'updated_at'
+            'background_color', 'background_image', 'background_variants', 'archived',
+            'labels', 'lists', 'version', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['owner', 'created_at', 'updated_at']
+        read_only_fields = ['owner', 'version', 'created_at', 'updated_at']
+
+    def get_background_variants(self, obj):
+        return background_variants(obj, self.context.get('request'))
+
 
+class BoardSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Lightweight board representation for board listings.
+    Nested data is only included when requested with ?expand=.
+    """
+    owner = UserSerializer(read_only=True)
+    members = UserSerializer(many=True, read_only=True)
+    lists = ListSerializer(many=True, read_only=True)
+    member_count = serializers.IntegerField(read_only=True)
+    list_count = serializers.IntegerField(read_only=True)
+    card_count = serializers.IntegerField(read_only=True)
+    presence_count = serializers.SerializerMethodField()
+    background_variants = serializers.SerializerMethodField()
 
-class ActivitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Board
+        fields = [
+            'id', 'title', 'description', 'owner', 'members',
+            'background_color', 'background_image', 'background_variants', 'archived',
+            'member_count', 'list_count', 'card_count', 'presence_count',
+            'lists', 'version', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['version']
+        expandable_fields = ['owner', 'members', 'lists']
+
+    def get_background_variants(self, obj):
+        return background_variants(obj, self.context.get('request'))
+
+    def get_presence_count(self, obj):
+        # The board list passes the counts of the whole page in the context
+        counts = self.context.get('presence_counts')
+        if counts is None or obj.pk not in counts:
+            from .presence import presence_counts
+            counts = presence_counts([obj.pk])
+        return counts[obj.pk]
+
+
+class ActivitySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
@@ -107,5 +314,12 @@ class ReorderCardsSerializer(serializers.Serializer):
         child=serializers.IntegerField(),
         allow_empty=False
     )
-    source_list_id = serializers.IntegerField(required=False)
+
+
+class MoveSerializer(serializers.Serializer):
+    # Target index among the destination's rows; past the end appends
+    position = serializers.IntegerField(min_value=0, default=0)
+
+
+class MoveCardSerializer(MoveSerializer):
     destination_list_id = serializers.IntegerField(required=False)
\ No newline at end of file
@@ -1,68 +1,354 @@
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.core.serializers.json import DjangoJSONEncoder
 from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import json
-from .models import Board, List, Card, Comment
+from .access import invalidate_board_access, sync_board_access
+from .attachments import collect_blob
+from .backgrounds import schedule_variants
+from .buffering import CommitBuffer
+from .changes import mark_deleting, record_changes, recorded_version, unmark_deleting
+from .models import (
+    Board, List, Label, Card, Comment, Checklist, ChecklistItem, Attachment, UploadSession,
+    BoardChange, BoardAccess
+)
+from .ranking import ranks_changed
+from .search import (
+    INDEXED_FIELDS, document_for, index_documents, move_card_documents, move_checklist_documents,
+    remove_documents
+)
+
+
+# Foreign key leading from each nested model towards its board
+PARENT_FIELDS = {
+    Card: 'list_id', Comment: 'card_id', Checklist: 'card_id', Attachment: 'card_id',
+    UploadSession: 'card_id', ChecklistItem: 'checklist_id'
+}
+
+
+def board_id_for(instance):
+    """
+    Id of the board `instance` belongs to. Uses loaded relations when they
+    are cached and otherwise a single values() query, never a chain of
+    lazy FK loads. The answer is remembered on the instance for as long as
+    its parent stays the same, so the several receivers of one save share
+    the lookup. Returns None once the parent rows are gone.
+    """
+    if isinstance(instance, Board):
+        return instance.pk
+    if isinstance(instance, (List, Label)):
+        return instance.board_id
+    parent_field = PARENT_FIELDS.get(type(instance))
+    if parent_field is None:
+        return None
+    parent_id = getattr(instance, parent_field)
+    memo = instance.__dict__.get('_board_id_memo')
+    if memo is not None and memo[0] == parent_id:
+        return memo[1]
+
+    if isinstance(instance, Card):
+        if Card.list.is_cached(instance):
+            board_id = instance.list.board_id
+        else:
+            board_id = List.objects.filter(pk=parent_id).values_list('board_id', flat=True).first()
+    elif isinstance(instance, (Comment, Checklist, Attachment, UploadSession)):
+        if type(instance).card.is_cached(instance):
+            board_id = board_id_for(instance.card)
+        else:
+            board_id = Card.objects.filter(pk=parent_id).values_list(
+                'list__board_id', flat=True
+            ).first()
+    elif ChecklistItem.checklist.is_cached(instance):
+        board_id = board_id_for(instance.checklist)
+    else:
+        board_id = Checklist.objects.filter(pk=parent_id).values_list(
+            'card__list__board_id', flat=True
+        ).first()
+    instance._board_id_memo = (parent_id, board_id)
+    return board_id
+
+
+@receiver(pre_delete, sender=Board)
+def mark_board_deleting(sender, instance, **kwargs):
+    mark_deleting(instance.pk)
+
+
+@receiver(post_delete, sender=Board)
+def unmark_board_deleting(sender, instance, **kwargs):
+    unmark_deleting(instance.pk)
+
+
+@receiver(post_save, sender=Board)
+@receiver([post_save, post_delete], sender=List)
+@receiver([post_save, post_delete], sender=Label)
+@receiver([post_save, post_delete], sender=Card)
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Checklist)
+@receiver([post_save, post_delete], sender=ChecklistItem)
+@receiver([post_save, post_delete], sender=Attachment)
+def record_board_change(sender, instance, **kwargs):
+    operation = BoardChange.DELETE if kwargs.get('signal') is post_delete else BoardChange.UPSERT
+    version = record_changes(board_id_for(instance), sender, [instance.pk], operation)
+    if sender is Board and version is not None:
+        # save() leaves the column alone, so the instance is caught up here
+        instance.version = version
+
+
+# User fields that boards, cards and comments show (see UserSerializer)
+DISPLAYED_USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_displayed_user_fields(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(DISPLAYED_USER_FIELDS) & set(update_fields):
+        return
+    instance._displayed_fields = User.objects.filter(pk=instance.pk).values_list(
+        *DISPLAYED_USER_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=User)
+def record_displayed_user_change(sender, instance, created, **kwargs):
+    """
+    Log the boards, cards and comments that show a renamed user, so their
+    versions move on and cached snapshots and ETags of them lapse.
+    """
+    previous = instance.__dict__.pop('_displayed_fields', None)
+    if created or previous is None:
+        return
+    if previous == tuple(getattr(instance, name) for name in DISPLAYED_USER_FIELDS):
+        return
+
+    changed = {}
+    for board_id in BoardAccess.objects.filter(user=instance).values_list('board_id', flat=True):
+        changed.setdefault(board_id, {}).setdefault(Board, []).append(board_id)
+    for card_id, board_id in Card.members.through.objects.filter(user=instance).values_list(
+        'card_id', 'card__list__board_id'
+    ):
+        changed.setdefault(board_id, {}).setdefault(Card, []).append(card_id)
+    for comment_id, board_id in Comment.objects.filter(author=instance).values_list(
+        'id', 'card__list__board_id'
+    ):
+        changed.setdefault(board_id, {}).setdefault(Comment, []).append(comment_id)
+    for board_id, by_model in changed.items():
+        for model, object_ids in by_model.items():
+            record_changes(board_id, model, object_ids)
+
+
+@receiver(post_save, sender=Board)
+def sync_owner_access(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'owner' not in update_fields:
+        return
+    if not created and BoardAccess.objects.filter(
+        board_id=instance.pk, user_id=instance.owner_id, role=BoardAccess.OWNER
+    ).exists():
+        return
+    invalidate_board_access(sync_board_access([instance.pk]))
+
+
+@receiver(post_save, sender=Board)
+def update_background_variants(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'background_image' not in update_fields:
+        return
+    name = instance.background_image.name or ''
+    if name == instance.background_source:
+        return
+    # Checked against the row: the instance may predate the last render.
+    # The old variants stop being served as soon as the image changes.
+    changed = Board.objects.filter(pk=instance.pk).exclude(background_source=name).update(
+        background_hash='', background_source=''
+    )
+    if not changed:
+        return
+    instance.background_hash = instance.background_source = ''
+    if name:
+        schedule_variants(instance)
+
+
+@receiver(m2m_changed, sender=Board.members.through)
+def sync_member_access(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if pk_set is not None and not pk_set:
+        return
+    if not reverse:
+        board_ids = [instance.pk]
+    elif pk_set is not None:
+        board_ids = pk_set
+    else:
+        # Cleared from the user side: its boards still have their rows
+        board_ids = list(BoardAccess.objects.filter(user=instance).values_list('board_id', flat=True))
+    invalidate_board_access(sync_board_access(board_ids))
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=ChecklistItem)
+def index_search_document(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_FIELDS[sender] & set(update_fields):
+        return
+    board_id = board_id_for(instance)
+    document = document_for(instance, board_id)
+    if document is not None:
+        index_documents([document])
+        if sender is Card:
+            # Comments and checklist items follow their card to a new board
+            move_card_documents(instance.pk, board_id)
+
+
+@receiver(post_save, sender=Checklist)
+def move_checklist_search_documents(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'card' not in update_fields):
+        return
+    # Items are indexed under their checklist's card; follow it to a new one
+    move_checklist_documents(instance.pk, instance.card_id, board_id_for(instance))
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=ChecklistItem)
+def remove_search_document(sender, instance, **kwargs):
+    # Card documents go with the card through their foreign key
+    remove_documents(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Attachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    # The file goes once its last attachment is gone; checked after commit
+    # so a rolled back delete keeps it
+    if instance.blob_id:
+        sha256 = instance.blob_id
+        transaction.on_commit(lambda: collect_blob(sha256))
+
+
+@receiver(m2m_changed, sender=Board.members.through)
+@receiver(m2m_changed, sender=Card.members.through)
+@receiver(m2m_changed, sender=Card.labels.through)
+def record_member_change(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        record_changes(board_id_for(instance), type(instance), [instance.pk])
+    elif pk_set:
+        # Changed from the user or label side: pk_set holds board or card ids
+        if model is Card:
+            by_board = {}
+            for card_id, board_id in Card.objects.filter(pk__in=pk_set).values_list(
+                'id', 'list__board_id'
+            ):
+                by_board.setdefault(board_id, []).append(card_id)
+            for board_id, card_ids in by_board.items():
+                record_changes(board_id, Card, card_ids)
+        else:
+            for board_id in pk_set:
+                record_changes(board_id, Board, [board_id])
+
+
+@receiver(ranks_changed)
+def record_rank_change(sender, parent, ids, positions, **kwargs):
+    if 'board_id' in parent:
+        board_id = parent['board_id']
+    else:
+        board_id = List.objects.filter(pk=parent['list_id']).values_list('board_id', flat=True).first()
+    record_changes(board_id, sender, ids)
+
+    action = 'lists_reordered' if sender is List else 'cards_reordered'
+    broadcast_board_event(board_id, action, dict(parent, positions=[
+        {'id': pk, 'position': position} for pk, position in zip(ids, positions)
+    ]))
+
+
+def encode_frame(frame):
+    """
+    JSON text of a WebSocket frame, as sent to clients.
+    """
+    return json.dumps(frame, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def send_board_events(events):
+    """
+    Deliver committed (board_id, action, data, version) events: one group
+    message per board, repeated updates of the same object collapsed to the
+    last one. The message's seq is the newest board version among its
+    events, for replay to reconnecting clients.
+    """
+    by_board = {}
+    sequences = {}
+    for board_id, action, data, version in events:
+        board_events = by_board.setdefault(board_id, {})
+        key = (action, data['id']) if data.get('id') is not None else object()
+        # Re-inserting moves the event to the position of its latest occurrence
+        board_events.pop(key, None)
+        board_events[key] = {'type': action, 'data': data}
+        if version is not None:
+            sequences[board_id] = max(version, sequences.get(board_id, 0))
+
+    channel_layer = get_channel_layer()
+    for board_id, board_events in by_board.items():
+        board_events = list(board_events.values())
+        seq = sequences.get(board_id)
+        if len(board_events) == 1:
+            frame = dict(board_events[0], board_id=board_id, seq=seq, user=None)
+        else:
+            frame = {'type': 'batch', 'board_id': board_id, 'seq': seq, 'events': board_events}
+        # Encoded here, once, instead of by every subscribed consumer
+        async_to_sync(channel_layer.group_send)(f'board_{board_id}', {
+            'type': 'board_update',
+            'board_id': board_id,
+            'seq': seq,
+            'text': encode_frame(frame)
+        })
+
+
+board_events = CommitBuffer(send_board_events, 'board events')
+
+
+def broadcast_board_event(board_id, action, data):
+    """
+    Queue a WebSocket event for the board's group. It is sent once the
+    current transaction commits, batched with the rest of the request's
+    events for the same board, and tagged with the board version the
+    change produced.
+    """
+    if board_id is not None:
+        board_events.add((board_id, action, data, recorded_version(board_id)))
 
 
 @receiver(post_save, sender=List)
 def broadcast_list_update(sender, instance, created, **kwargs):
-    channel_layer = get_channel_layer()
     action = 'list_created' if created else 'list_updated'
-    
-    async_to_sync(channel_layer.group_send)(
-        f'board_{instance.board.id}',
-        {
-            'type': 'board_update',
-            'action': action,
-            'data': {
-                'id': instance.id,
-                'title': instance.title,
-                'position': instance.position,
-                'board_id': instance.board.id
-            }
-        }
-    )
+    broadcast_board_event(instance.board_id, action, {
+        'id': instance.id,
+        'title': instance.title,
+        'position': instance.position,
+        'board_id': instance.board_id
+    })
 
 
 @receiver(post_save, sender=Card)
 def broadcast_card_update(sender, instance, created, **kwargs):
-    channel_layer = get_channel_layer()
     action = 'card_created' if created else 'card_updated'
-    
-    async_to_sync(channel_layer.group_send)(
-        f'board_{instance.list.board.id}',
-        {
-            'type': 'board_update',
-            'action': action,
-            'data': {
-                'id': instance.id,
-                'title': instance.title,
-                'position': instance.position,
-                'list_id': instance.list.id,
-                'board_id': instance.list.board.id
-            }
-        }
-    )
+    board_id = board_id_for(instance)
+    broadcast_board_event(board_id, action, {
+        'id': instance.id,
+        'title': instance.title,
+        'position': instance.position,
+        'list_id': instance.list_id,
+        'board_id': board_id
+    })
 
 
 @receiver(post_save, sender=Comment)
 def broadcast_comment_update(sender, instance, created, **kwargs):
     if created:
-        channel_layer = get_channel_layer()
-        
-        async_to_sync(channel_layer.group_send)(
-            f'board_{instance.card.list.board.id}',
-            {
-                'type': 'board_update',
-                'action': 'comment_added',
-                'data': {
-                    'id': instance.id,
-                    'text': instance.text,
-                    'card_id': instance.card.id,
-                    'author': instance.author.username if instance.author else None,
-                    'created_at': instance.created_at.isoformat()
-                }
-            }
-        )
\ No newline at end of file
+        broadcast_board_event(board_id_for(instance), 'comment_added', {
+            'id': instance.id,
+            'text': instance.text,
+            'card_id': instance.card_id,
+            'author': instance.author.username if instance.author_id else None,
+            'created_at': instance.created_at.isoformat()
+        })
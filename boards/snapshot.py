@@ -0,0 +1,103 @@
+import threading
+from django.core.cache import caches
+from django.db.models import Prefetch
+from .models import Board, Comment
+from .serializers import BoardSerializer
+from .signals import encode_frame
+
+
+def board_tree_queryset(queryset=None):
+    """
+    Board queryset that loads the whole lists -> cards -> comments/checklists
+    tree with a fixed number of queries, however large the board is.
+    """
+    if queryset is None:
+        queryset = Board.objects.all()
+    return queryset.select_related('owner').prefetch_related(
+        'members',
+        'labels',
+        'lists',
+        'lists__cards',
+        'lists__cards__members',
+        'lists__cards__labels',
+        'lists__cards__attachments',
+        Prefetch('lists__cards__comments', queryset=Comment.objects.select_related('author')),
+        'lists__cards__checklists',
+        'lists__cards__checklists__items',
+    )
+
+
+def build_board_snapshot(board, request=None):
+    """
+    Serialize a board loaded through board_tree_queryset().
+    The output is exactly what BoardSerializer returns.
+    """
+    return BoardSerializer(board, context={'request': request}).data
+
+
+def snapshot_cache_key(board_id, version, request=None):
+    # Absolute media URLs depend on the host the request came in on
+    origin = f'{request.scheme}://{request.get_host()}' if request is not None else ''
+    return f'board:{board_id}:v{version}:{origin}'
+
+
+def get_board_snapshot(board, request=None):
+    """
+    Full snapshot of `board` at its current version.
+
+    Snapshots are cached under (board id, version), so an unchanged board
+    is served from the 'board_snapshots' cache and the tree is only loaded
+    and serialized on a miss. Sparse fieldset requests bypass the cache.
+    """
+    params = request.query_params if request is not None else {}
+    if 'fields' in params or 'expand' in params:
+        return build_board_snapshot(_load_tree(board), request)
+
+    return _cached(
+        snapshot_cache_key(board.pk, board.version, request),
+        lambda: build_board_snapshot(_load_tree(board), request)
+    )
+
+
+def get_snapshot_frame(board):
+    """
+    Encoded 'snapshot' WebSocket frame for `board`, tagged with the version
+    it was taken at. Cached next to the snapshot itself, so sockets joining
+    an unchanged board reuse the same text.
+    """
+    return _cached(
+        snapshot_cache_key(board.pk, board.version) + ':frame',
+        lambda: encode_frame({
+            'type': 'snapshot',
+            'board_id': board.pk,
+            'seq': board.version,
+            'data': get_board_snapshot(board),
+        })
+    )
+
+
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def _cached(key, build):
+    # Single flight: concurrent misses on one key wait for the first build
+    # instead of each loading and serializing the board
+    cache = caches['board_snapshots']
+    data = cache.get(key)
+    if data is not None:
+        return data
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(key, threading.Lock())
+    with lock:
+        data = cache.get(key)
+        if data is None:
+            data = build()
+            cache.set(key, data)
+    with _build_locks_guard:
+        _build_locks.pop(key, None)
+    return data
+
+
+def _load_tree(board):
+    return board_tree_queryset(Board.objects.filter(pk=board.pk)).get()
@@ -1,3 +1,1381 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import pre_delete
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .access import MEMBER, OWNER, accessible_board_ids, board_roles
+from .activity import record_activity
+from .attachments import blob_path
+from . import backgrounds
+from .backgrounds import variants_root
+from . import cache as cache_module
+from .buffering import buffered
+from .cache import BoundedLocMemCache
+from .changes import record_changes
+from .channel_layers import SQLiteChannelLayer
+from .imaging import variant_name
+from .models import (
+    Activity, Board, BoardAccess, List, Label, Card, Comment, Checklist, ChecklistItem, BoardChange,
+    Attachment, Blob
+)
+from .consumers import BaseBoardConsumer
+from .presence import PRESENCE_TTL, PresenceTracker, presence_counts, present_users
+from .routing import websocket_urlpatterns
+from .ranking import RankCollision, rank_between, rank_for_index, rank_sequence, reorder
+from .search import SearchResults
+from .signals import encode_frame
+from .views import CardViewSet
+from .throttling import TokenBucket, get_relay_stats
+
+
+def create_board(owner, lists=0, cards=0, **fields):
+    """
+    Board owned by `owner` with `lists` lists of `cards` cards each.
+    """
+    board = Board.objects.create(title=fields.pop('title', 'Board'), owner=owner, **fields)
+    board.members.add(owner)
+    for list_index in range(lists):
+        list_obj = List.objects.create(board=board, title=f'List {list_index}')
+        for card_index in range(cards):
+            Card.objects.create(list=list_obj, title=f'Card {list_index}.{card_index}')
+    return board
+
+
+def fill_cards(board, comments=1, checklist_items=1):
+    """
+    Give every card of `board` comments and a checklist with items.
+    """
+    for card in Card.objects.filter(list__board=board):
+        for index in range(comments):
+            Comment.objects.create(card=card, author=board.owner, text=f'Comment {index}')
+        checklist = Checklist.objects.create(card=card, title='Checklist')
+        for index in range(checklist_items):
+            ChecklistItem.objects.create(checklist=checklist, text=f'Item {index}')
+
+
+class BoardSnapshotTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.client.force_authenticate(self.owner)
+
+    def count_retrieve_queries(self, board):
+        caches['board_snapshots'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/trello_backend/boards/{board.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_retrieve_query_count_does_not_grow_with_the_board(self):
+        small = create_board(self.owner, lists=1, cards=1)
+        fill_cards(small)
+        large = create_board(self.owner, lists=4, cards=5)
+        fill_cards(large, comments=3, checklist_items=4)
+
+        small_queries, _ = self.count_retrieve_queries(small)
+        large_queries, data = self.count_retrieve_queries(large)
+        self.assertEqual(large_queries, small_queries)
+        self.assertEqual(len(data['lists']), 4)
+        card = data['lists'][0]['cards'][0]
+        self.assertEqual(len(card['comments']), 3)
+        self.assertEqual(len(card['checklists'][0]['items']), 4)
+
+
+class BoardListTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.member = User.objects.create_user('member')
+        self.client.force_authenticate(self.owner)
+        self.board = create_board(self.owner, lists=2, cards=3)
+        self.board.members.add(self.member)
+        Card.objects.filter(pk=Card.objects.first().pk).update(archived=True)
+        create_board(User.objects.create_user('stranger'))
+
+    def test_summary_carries_counts_instead_of_the_tree(self):
+        response = self.client.get('/trello_backend/boards/')
+        self.assertEqual(response.status_code, 200)
+        [summary] = response.data['results']
+        self.assertEqual(summary['id'], self.board.pk)
+        self.assertEqual(
+            (summary['member_count'], summary['list_count'], summary['card_count']), (2, 2, 5)
+        )
+        for name in ('lists', 'owner', 'members'):
+            self.assertNotIn(name, summary)
+
+    def test_fields_and_expand(self):
+        response = self.client.get('/trello_backend/boards/?fields=id,title')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+        response = self.client.get('/trello_backend/boards/?expand=owner,lists')
+        summary = response.data['results'][0]
+        self.assertEqual(summary['owner']['username'], 'owner')
+        self.assertEqual(len(summary['lists']), 2)
+        self.assertEqual(len(summary['lists'][0]['cards']), 3)
+
+        response = self.client.get('/trello_backend/boards/?fields=id,lists.title')
+        self.assertEqual(response.data['results'][0]['lists'][0].keys(), {'title'})
+
+
+class BoundedCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = BoundedLocMemCache('bounded-test', {'OPTIONS': {'MAX_BYTES': 1000, 'MAX_ENTRIES': 50}})
+        self.addCleanup(self.cache.clear)
+
+    def stored(self):
+        # The running total must match what is actually held
+        total = sum(len(pickled) for pickled in self.cache._cache.values())
+        self.assertEqual(cache_module._stored_bytes['bounded-test'], total)
+        return total
+
+    def test_least_recently_used_entries_go_past_the_byte_cap(self):
+        for name in 'abcd':
+            self.cache.set(name, 'x' * 200)
+        self.cache.get('a')
+        self.cache.set('e', 'x' * 200)
+        self.assertLessEqual(self.stored(), 1000)
+        self.assertEqual(
+            [name for name in 'abcde' if self.cache.get(name) is not None], ['a', 'c', 'd', 'e']
+        )
+
+    def test_total_follows_every_change(self):
+        self.cache.set('a', 'x' * 100)
+        self.cache.set('a', 'x' * 10)
+        self.cache.set('n', 1)
+        self.cache.incr('n', 10 ** 30)
+        self.cache.set('gone', 'x', timeout=-1)
+        self.assertIsNone(self.cache.get('gone'))
+        self.stored()
+        self.cache.delete('a')
+        self.stored()
+        self.cache.clear()
+        self.assertEqual(self.stored(), 0)
+
+
+class SnapshotUserDataTests(APITestCase):
+    def setUp(self):
+        caches['board_snapshots'].clear()
+        self.owner = User.objects.create_user('owner')
+        self.author = User.objects.create_user('author')
+        self.client.force_authenticate(self.owner)
+        self.board = create_board(self.owner, lists=1, cards=1)
+        Comment.objects.create(card=Card.objects.get(), author=self.author, text='Hello')
+
+    def retrieve(self, **headers):
+        return self.client.get(f'/trello_backend/boards/{self.board.pk}/', **headers)
+
+    def test_renamed_users_are_not_served_stale(self):
+        etag = self.retrieve()['ETag']
+        self.author.username = 'writer'
+        self.author.save()
+
+        response = self.retrieve(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        comment = response.data['lists'][0]['cards'][0]['comments'][0]
+        self.assertEqual(comment['author']['username'], 'writer')
+
+        self.owner.first_name = 'Olive'
+        self.owner.save()
+        self.assertEqual(self.retrieve().data['owner']['first_name'], 'Olive')
+
+    def test_other_user_saves_keep_the_cache(self):
+        etag = self.retrieve()['ETag']
+        self.author.last_login = datetime.now(timezone.utc)
+        self.author.save(update_fields=['last_login'])
+        self.author.save()
+        self.assertEqual(self.retrieve(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class RankingTests(TestCase):
+    def test_rank_between_sorts_between_neighbours(self):
+        ranks = rank_sequence(3)
+        self.assertEqual(ranks, sorted(ranks))
+        for before, after in [(None, ranks[0]), (ranks[0], ranks[1]), (ranks[2], None), ('a', 'a1')]:
+            rank = rank_between(before, after)
+            if before is not None:
+                self.assertLess(before, rank)
+            if after is not None:
+                self.assertLess(rank, after)
+
+    def test_rank_between_rejects_impossible_bounds(self):
+        with self.assertRaises(RankCollision):
+            rank_between('b', 'a')
+        with self.assertRaises(RankCollision):
+            rank_between(None, '')
+
+    def test_inserting_at_index_orders_rows(self):
+        owner = User.objects.create_user('owner')
+        board = create_board(owner, lists=1, cards=3)
+        list_obj = board.lists.get()
+        first = Card.objects.create(
+            list=list_obj, title='First',
+            position=rank_for_index(Card, {'list_id': list_obj.pk}, index=0)
+        )
+        middle = Card.objects.create(
+            list=list_obj, title='Middle',
+            position=rank_for_index(Card, {'list_id': list_obj.pk}, index=2)
+        )
+        titles = list(list_obj.cards.values_list('title', flat=True))
+        self.assertEqual(titles, ['First', 'Card 0.0', 'Middle', 'Card 0.1', 'Card 0.2'])
+        self.assertNotEqual(first.position, middle.position)
+
+    def test_empty_rank_is_respaced(self):
+        owner = User.objects.create_user('owner')
+        board = create_board(owner, lists=1, cards=2)
+        list_obj = board.lists.get()
+        list_obj.cards.update(position='')
+        rank = rank_for_index(Card, {'list_id': list_obj.pk}, index=0)
+        self.assertNotIn('', list_obj.cards.values_list('position', flat=True))
+        self.assertLess(rank, list_obj.cards.order_by('position').first().position)
+
+    def test_keys_never_outgrow_the_column(self):
+        owner = User.objects.create_user('owner')
+        board = create_board(owner, lists=1, cards=2)
+        list_obj = board.lists.get()
+        max_length = Card._meta.get_field('position').max_length
+        # Keep splitting the same gap
+        for _ in range(400):
+            rank = rank_for_index(Card, {'list_id': list_obj.pk}, index=1)
+            self.assertLessEqual(len(rank), max_length)
+            Card.objects.create(list=list_obj, title='Split', position=rank)
+
+
+class ReorderTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.client.force_authenticate(self.owner)
+        self.board = create_board(self.owner, lists=4)
+        self.list_ids = list(List.objects.filter(board=self.board).values_list('pk', flat=True))
+
+    def reorder_lists(self, ids):
+        return self.client.post(
+            f'/trello_backend/boards/{self.board.pk}/reorder_lists/', {'lists': ids}, format='json'
+        )
+
+    def ordered_ids(self):
+        return list(List.objects.filter(board=self.board).values_list('pk', flat=True))
+
+    def test_lists_are_reordered_with_one_update(self):
+        reversed_ids = self.list_ids[::-1]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reorder_lists(reversed_ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ordered_ids(), reversed_ids)
+        list_updates = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "boards_list"')
+        ]
+        self.assertEqual(len(list_updates), 1)
+
+    def test_unlisted_siblings_keep_their_places(self):
+        first, second, third, fourth = self.list_ids
+        self.assertEqual(self.reorder_lists([fourth, second]).status_code, 200)
+        self.assertEqual(self.ordered_ids(), [first, fourth, third, second])
+
+    def test_invalid_ids_change_nothing(self):
+        other = List.objects.create(board=create_board(self.owner), title='Elsewhere')
+        for ids in ([self.list_ids[0], self.list_ids[0]], [self.list_ids[0], other.pk], [0]):
+            self.assertEqual(self.reorder_lists(ids).status_code, 400)
+        self.assertEqual(self.ordered_ids(), self.list_ids)
+
+
+class CardMoveTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.client.force_authenticate(self.owner)
+        self.board = create_board(self.owner, lists=2, cards=3)
+        self.source, self.destination = List.objects.filter(board=self.board)
+
+    def move(self, card, **data):
+        return self.client.post(f'/trello_backend/cards/{card.pk}/move/', data, format='json')
+
+    def card_ids(self, list_obj):
+        return list(list_obj.cards.values_list('pk', flat=True))
+
+    def test_move_within_a_list_writes_only_the_card(self):
+        first, second, third = self.card_ids(self.source)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.move(Card.objects.get(pk=first), position=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.card_ids(self.source), [second, third, first])
+        card_updates = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "boards_card"')
+        ]
+        self.assertEqual(len(card_updates), 1)
+
+    def test_move_to_another_list(self):
+        card = self.source.cards.last()
+        response = self.move(card, destination_list_id=self.destination.pk, position=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['list_id'], self.destination.pk)
+        self.assertEqual(self.card_ids(self.destination)[1], card.pk)
+        self.assertEqual(len(self.card_ids(self.source)), 2)
+        self.assertEqual(Card.objects.get(pk=card.pk).position, response.data['position'])
+
+    def test_destination_deleted_before_the_lock(self):
+        card = self.source.cards.first()
+        check = CardViewSet.check_parent_permissions
+
+        def check_then_delete(viewset, queryset, pk, board_field):
+            board_id = check(viewset, queryset, pk, board_field)
+            List.objects.filter(pk=pk).delete()
+            return board_id
+
+        with mock.patch.object(CardViewSet, 'check_parent_permissions', check_then_delete):
+            response = self.move(card, destination_list_id=self.destination.pk)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Card.objects.get(pk=card.pk).list_id, self.source.pk)
+
+    def test_cannot_move_into_an_inaccessible_list(self):
+        stranger_board = create_board(User.objects.create_user('stranger'), lists=1)
+        card = self.source.cards.first()
+        response = self.move(card, destination_list_id=stranger_board.lists.get().pk)
+        self.assertEqual(response.status_code, 403)
+        response = self.move(card, destination_list_id=999999)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Card.objects.get(pk=card.pk).list_id, self.source.pk)
+
+
+class BoardVersionTests(TestCase):
+    def test_saving_a_stale_board_keeps_the_version_moving(self):
+        owner = User.objects.create_user('owner')
+        board = create_board(owner)
+        loaded = Board.objects.get(pk=board.pk)
+        List.objects.create(board=board, title='Added meanwhile')
+        loaded.title = 'Renamed'
+        loaded.save()
+
+        board.refresh_from_db()
+        sequences = list(board.changes.values_list('sequence', flat=True))
+        self.assertEqual(len(sequences), len(set(sequences)))
+        self.assertEqual(board.version, max(sequences))
+        self.assertEqual(loaded.version, board.version)
+        self.assertEqual(board.title, 'Renamed')
+
+
+class ConditionalReadTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.client.force_authenticate(self.owner)
+        self.board = create_board(self.owner, lists=1, cards=2)
+        self.list = self.board.lists.get()
+
+    def assert_revalidates(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_board_retrieve(self):
+        self.assert_revalidates(
+            f'/trello_backend/boards/{self.board.pk}/',
+            lambda: Card.objects.create(list=self.list, title='New')
+        )
+
+    def test_list_and_card_reads(self):
+        card = self.list.cards.first()
+
+        def rename():
+            card.title = 'Renamed'
+            card.save()
+
+        self.assert_revalidates(f'/trello_backend/lists/?board_id={self.board.pk}', rename)
+        self.assert_revalidates(f'/trello_backend/cards/{card.pk}/', rename)
+        self.assert_revalidates(f'/trello_backend/cards/?list_id={self.list.pk}', rename)
+
+    def test_tags_differ_per_query(self):
+        url = f'/trello_backend/cards/?list_id={self.list.pk}'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url + '&page=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ActivityFeedTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.member = User.objects.create_user('member')
+        self.client.force_authenticate(self.owner)
+        self.board = create_board(self.owner)
+        Activity.objects.all().delete()
+        self.activities = Activity.objects.bulk_create([
+            Activity(
+                board=self.board, user=self.owner if index % 2 else self.member,
+                activity_type='MOVE' if index % 3 else 'COMMENT', description=f'Entry {index}'
+            )
+            for index in range(7)
+        ])
+        # Rows created in the same instant are ordered by id
+        Activity.objects.filter(pk__in=[row.pk for row in self.activities[2:5]]).update(
+            created_at=self.activities[2].created_at
+        )
+        self.url = f'/trello_backend/boards/{self.board.pk}/activities/'
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_the_feed_newest_first(self):
+        expected = list(Activity.objects.filter(board=self.board).values_list('pk', flat=True))
+        self.assertEqual(self.walk(self.url + '?page_size=2'), expected)
+
+    def test_filters(self):
+        ids = self.walk(self.url + f'?activity_type=COMMENT&user={self.member.pk}&page_size=1')
+        expected = Activity.objects.filter(activity_type='COMMENT', user=self.member)
+        self.assertEqual(ids, list(expected.values_list('pk', flat=True)))
+        self.assertTrue(ids)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url + '?cursor=bogus').status_code, 404)
+        self.assertEqual(self.client.get(self.url + '?user=me').status_code, 400)
+
+
+class ActivityBufferTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.board = create_board(self.owner)
+        Activity.objects.all().delete()
+
+    def record(self, count):
+        for index in range(count):
+            record_activity(
+                board=self.board, user=self.owner, activity_type='UPDATE', description=f'Entry {index}'
+            )
+
+    def test_scope_writes_committed_entries_in_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            with buffered():
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.record(3)
+                self.assertFalse(Activity.objects.exists())
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "boards_activity"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Activity.objects.count(), 3)
+
+    def test_rolled_back_entries_are_dropped(self):
+        with buffered():
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        self.record(2)
+                        raise IntegrityError
+                except IntegrityError:
+                    pass
+                self.record(1)
+        self.assertEqual(Activity.objects.count(), 1)
+
+    def test_entries_outside_a_scope_are_written_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.record(1)
+        self.assertFalse(Activity.objects.exists())
+        callbacks[0]()
+        self.assertEqual(Activity.objects.count(), 1)
+
+
+class BroadcastTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.board = create_board(self.owner, lists=1)
+        self.list = self.board.lists.get()
+        patcher = mock.patch('boards.signals.get_channel_layer')
+        self.channel_layer = patcher.start().return_value
+        self.channel_layer.group_send = mock.AsyncMock()
+        self.addCleanup(patcher.stop)
+
+    def sent_frames(self):
+        return [
+            (group, json.loads(message['text']))
+            for (group, message), _ in self.channel_layer.group_send.call_args_list
+        ]
+
+    def test_request_events_go_out_after_commit_in_one_batch(self):
+        with buffered():
+            with self.captureOnCommitCallbacks(execute=True):
+                card = Card.objects.create(list=self.list, title='Draft')
+                for title in ('Second', 'Final'):
+                    card.title = title
+                    card.save()
+                self.list.title = 'Renamed'
+                self.list.save()
+                self.channel_layer.group_send.assert_not_called()
+
+        [(group, frame)] = self.sent_frames()
+        self.assertEqual(group, f'board_{self.board.pk}')
+        self.assertEqual(frame['type'], 'batch')
+        self.assertEqual(frame['seq'], Board.objects.get(pk=self.board.pk).version)
+        self.assertEqual(
+            [(event['type'], event['data']['title']) for event in frame['events']],
+            [('card_created', 'Draft'), ('card_updated', 'Final'), ('list_updated', 'Renamed')]
+        )
+
+    def test_rolled_back_changes_are_not_broadcast(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Card.objects.create(list=self.list, title='Lost')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.channel_layer.group_send.assert_not_called()
+
+
+class SQLiteChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'layer.sqlite3')
+
+    async def layers(self, count, **config):
+        # One instance per simulated worker process, all on the same file
+        layers = [SQLiteChannelLayer(path=self.path, **config) for _ in range(count)]
+        for layer in layers:
+            self.addCleanup(async_to_sync(layer.close))
+        return layers
+
+    async def test_group_messages_cross_processes(self):
+        first, second = await self.layers(2)
+        channels = [await first.new_channel(), await second.new_channel()]
+        for layer, channel in zip((first, second), channels):
+            await layer.group_add('board_1', channel)
+
+        await second.group_send('board_1', {'type': 'board.update', 'text': 'hello', 'raw': b'\x00'})
+        for layer, channel in zip((first, second), channels):
+            message = await asyncio.wait_for(layer.receive(channel), 5)
+            self.assertEqual(message, {'type': 'board.update', 'text': 'hello', 'raw': b'\x00'})
+
+        await first.group_discard('board_1', channels[0])
+        await second.group_send('board_1', {'type': 'board.update', 'text': 'again'})
+        message = await asyncio.wait_for(second.receive(channels[1]), 5)
+        self.assertEqual(message['text'], 'again')
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(first.receive(channels[0]), 0.3)
+
+    async def test_full_channels(self):
+        sender, receiver = await self.layers(2, capacity=2)
+        await sender.send('worker', {'type': 'job', 'n': 1})
+        await sender.send('worker', {'type': 'job', 'n': 2})
+        with self.assertRaises(ChannelFull):
+            await sender.send('worker', {'type': 'job', 'n': 3})
+        self.assertEqual((await asyncio.wait_for(receiver.receive('worker'), 5))['n'], 1)
+
+    async def test_expired_rows_do_not_wake_readers(self):
+        layer, = await self.layers(1, expiry=0)
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'stale'})
+        await asyncio.sleep(0.01)
+        self.assertFalse(await layer._run(layer._has_rows, layer.non_local_name(channel)))
+
+    async def test_full_local_buffers_count_drops(self):
+        layer, = await self.layers(1, capacity=1)
+        listening, idle = await layer.new_channel(), await layer.new_channel()
+        # Keeps the shared poller running while nothing reads the idle channel
+        receiver = asyncio.ensure_future(layer.receive(listening))
+        self.addCleanup(receiver.cancel)
+
+        async def until(condition):
+            while not condition():
+                await asyncio.sleep(0.01)
+
+        with self.assertLogs('boards.channel_layers', 'WARNING'):
+            await layer.send(idle, {'type': 'job', 'n': 1})
+            await asyncio.wait_for(until(lambda: idle in layer._buffers), 5)
+            await layer.send(idle, {'type': 'job', 'n': 2})
+            await asyncio.wait_for(until(lambda: layer.dropped[idle]), 5)
+        self.assertEqual(layer.dropped, {idle: 1})
+        self.assertEqual((await asyncio.wait_for(layer.receive(idle), 5))['n'], 1)
+
+
+class Socket(ApplicationCommunicator):
+    """
+    WebSocket client for the board consumers, on asgiref's communicator
+    (channels.testing needs daphne, which is not a dependency).
+    """
+    def __init__(self, path, user):
+        query = f'token={AccessToken.for_user(user)}'
+        if '?' in path:
+            path, extra = path.split('?', 1)
+            query = f'{extra}&{query}'
+        super().__init__(URLRouter(websocket_urlpatterns), {
+            'type': 'websocket', 'path': path, 'query_string': query.encode(),
+            'headers': [], 'subprotocols': [],
+        })
+
+    async def connect(self):
+        await self.send_input({'type': 'websocket.connect'})
+        return (await self.receive_output(5))['type'] == 'websocket.accept'
+
+    async def send_json(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json(self, timeout=5):
+        message = await self.receive_output(timeout)
+        if message['type'] != 'websocket.send':
+            raise AssertionError(f'Expected a frame, got {message}')
+        return json.loads(message['text'])
+
+    async def receive_until(self, frame_type):
+        while True:
+            frame = await self.receive_json()
+            if frame['type'] == frame_type:
+                return frame
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait(1)
+
+
+class SocketTestCase(TransactionTestCase):
+    """
+    Real commits, so changes made on the test thread reach the consumers
+    (which use their own connections) and fire their on_commit broadcasts.
+    """
+    def setUp(self):
+        caches['presence'].clear()
+        caches['board_snapshots'].clear()
+        self.owner = User.objects.create_user('owner')
+        self.board = create_board(self.owner, lists=1, cards=1)
+        self.list = self.board.lists.get()
+
+    async def connect(self, path, user=None):
+        socket = Socket(path, user or self.owner)
+        self.assertTrue(await socket.connect())
+        self.assertEqual((await socket.receive_json())['type'], 'connection_established')
+        return socket
+
+    @database_sync_to_async
+    def create_card(self, title, list_obj=None):
+        with buffered():
+            card = Card.objects.create(list=list_obj or self.list, title=title)
+        return card
+
+
+class BroadcastEncodingTests(SocketTestCase):
+    async def test_each_event_is_encoded_once_for_all_sockets(self):
+        sockets = [await self.connect(f'/ws/board/{self.board.pk}/') for _ in range(3)]
+        encode = mock.Mock(wraps=encode_frame)
+        with mock.patch('boards.signals.encode_frame', encode), \
+                mock.patch('boards.consumers.encode_frame', encode):
+            await self.create_card('Shared')
+            texts = set()
+            for socket in sockets:
+                frame = await socket.receive_until('card_created')
+                self.assertEqual(frame['data']['title'], 'Shared')
+                texts.add(json.dumps(frame, sort_keys=True))
+                await socket.disconnect()
+        self.assertEqual(len(texts), 1)
+        self.assertEqual(encode.call_count, 1)
+
+
+class MultiBoardSocketTests(SocketTestCase):
+    async def test_one_socket_follows_several_boards(self):
+        second = await database_sync_to_async(create_board)(self.owner, lists=1)
+        second_list = await database_sync_to_async(second.lists.get)()
+        stranger = await database_sync_to_async(User.objects.create_user)('stranger')
+        hidden = await database_sync_to_async(create_board)(stranger)
+
+        socket = await self.connect('/ws/boards/')
+        await socket.send_json({'action': 'subscribe', 'boards': [self.board.pk, second.pk, hidden.pk]})
+        frame = await socket.receive_until('subscribed')
+        self.assertEqual(frame['boards'], sorted([self.board.pk, second.pk]))
+        self.assertEqual(frame['denied'], [hidden.pk])
+
+        await self.create_card('First', self.list)
+        frame = await socket.receive_until('card_created')
+        self.assertEqual((frame['board_id'], frame['data']['title']), (self.board.pk, 'First'))
+        await self.create_card('Second', second_list)
+        frame = await socket.receive_until('card_created')
+        self.assertEqual((frame['board_id'], frame['data']['title']), (second.pk, 'Second'))
+
+        await socket.send_json({'action': 'unsubscribe', 'boards': [self.board.pk]})
+        self.assertEqual((await socket.receive_until('unsubscribed'))['boards'], [self.board.pk])
+        await socket.send_json({'action': 'cursor', 'board': self.board.pk, 'data': {}})
+        self.assertEqual((await socket.receive_until('error'))['message'], 'Not subscribed to this board')
+
+        await self.create_card('Unseen', self.list)
+        await self.create_card('Seen', second_list)
+        frame = await socket.receive_until('card_created')
+        self.assertEqual(frame['data']['title'], 'Seen')
+        await socket.disconnect()
+
+    async def test_malformed_messages(self):
+        socket = await self.connect('/ws/boards/')
+        for message in ({'action': 'subscribe', 'boards': 'all'}, ['not', 'an', 'object']):
+            await socket.send_json(message)
+            self.assertEqual((await socket.receive_json())['type'], 'error')
+        await socket.disconnect()
+
+
+class ReplayTests(SocketTestCase):
+    async def test_reconnecting_socket_gets_the_frames_it_missed(self):
+        socket = await self.connect(f'/ws/board/{self.board.pk}/')
+        await self.create_card('Seen')
+        seen = await socket.receive_until('card_created')
+        await socket.disconnect()
+
+        await self.create_card('Missed')
+        # Let the replay buffer read the frame off its channel
+        await asyncio.sleep(0.1)
+        socket = await self.connect(f'/ws/board/{self.board.pk}/?since={seen["seq"]}')
+        frame = await socket.receive_until('card_created')
+        self.assertEqual(frame['data']['title'], 'Missed')
+        self.assertGreater(frame['seq'], seen['seq'])
+        await socket.disconnect()
+
+    async def test_gap_older_than_the_buffer_asks_for_a_resync(self):
+        await self.create_card('Before anyone listened')
+        socket = await self.connect(f'/ws/board/{self.board.pk}/')
+        await socket.disconnect()
+        socket = await self.connect(f'/ws/board/{self.board.pk}/?since=0')
+        self.assertEqual((await socket.receive_until('resync_required'))['board_id'], self.board.pk)
+        await socket.disconnect()
+
+
+class SocketSnapshotTests(SocketTestCase):
+    async def test_snapshot_is_sent_on_connect(self):
+        socket = await self.connect(f'/ws/board/{self.board.pk}/?snapshot=1')
+        frame = await socket.receive_until('snapshot')
+        version = await database_sync_to_async(
+            lambda: Board.objects.get(pk=self.board.pk).version
+        )()
+        self.assertEqual(frame['seq'], version)
+        self.assertEqual(frame['data']['id'], self.board.pk)
+        self.assertEqual(frame['data']['lists'][0]['cards'][0]['title'], 'Card 0.0')
+
+        await self.create_card('Later')
+        frame = await socket.receive_until('card_created')
+        self.assertGreater(frame['seq'], version)
+        await socket.disconnect()
+
+    async def test_multiplexed_subscribe_with_snapshots(self):
+        socket = await self.connect('/ws/boards/')
+        await socket.send_json({'action': 'subscribe', 'boards': [self.board.pk], 'snapshot': True})
+        frame = await socket.receive_until('snapshot')
+        self.assertEqual(frame['board_id'], self.board.pk)
+        self.assertEqual(len(frame['data']['lists']), 1)
+        await socket.disconnect()
+
+
+class RelayThrottlingTests(SocketTestCase):
+    def test_token_bucket(self):
+        with mock.patch('boards.throttling.time.monotonic', return_value=100.0) as monotonic:
+            bucket = TokenBucket(rate=2, burst=3)
+            self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+            monotonic.return_value = 100.5
+            self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+            monotonic.return_value = 200.0
+            self.assertEqual(sum(bucket.take() for _ in range(5)), 3)
+
+    async def test_client_events_are_merged_into_one_frame_per_tick(self):
+        sender = await self.connect(f'/ws/board/{self.board.pk}/')
+        viewer = await self.connect(f'/ws/board/{self.board.pk}/')
+        for x in (1, 2, 3):
+            await sender.send_json({'action': 'cursor', 'data': {'id': 'pointer', 'x': x}})
+        await sender.send_json({'action': 'drag', 'data': {'id': 7}})
+
+        frame = await viewer.receive_until('batch')
+        self.assertEqual(
+            [(event['type'], event['data']) for event in frame['events']],
+            [('cursor', {'id': 'pointer', 'x': 3}), ('drag', {'id': 7})]
+        )
+        self.assertEqual(frame['events'][0]['user'], 'owner')
+        await sender.disconnect()
+        await viewer.disconnect()
+
+    async def test_events_over_the_rate_are_dropped(self):
+        sender = await self.connect(f'/ws/board/{self.board.pk}/')
+        viewer = await self.connect(f'/ws/board/{self.board.pk}/')
+        with mock.patch.multiple(BaseBoardConsumer, relay_rate=0.001, relay_burst=2):
+            before = get_relay_stats()
+            for index in range(5):
+                await sender.send_json({'action': 'drag', 'data': {'id': index}})
+            frame = await viewer.receive_until('batch')
+        self.assertEqual([event['data']['id'] for event in frame['events']], [0, 1])
+        stats = get_relay_stats()
+        self.assertEqual(stats['received'] - before.get('received', 0), 5)
+        self.assertEqual(stats['rate_limited'] - before.get('rate_limited', 0), 3)
+        await sender.disconnect()
+        await viewer.disconnect()
+
+    def test_stats_endpoint_is_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        self.assertEqual(client.get('/trello_backend/boards/relay-stats/').status_code, 403)
+
+        self.owner.is_staff = True
+        self.owner.save()
+        with mock.patch.dict('boards.throttling.relay_stats', clear=True, received=4, frames=1):
+            response = client.get('/trello_backend/boards/relay-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'received': 4, 'frames': 1})
+
+
+class BoardRoleTests(APITestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.owner = User.objects.create_user('owner')
+        self.member = User.objects.create_user('member')
+        self.board = create_board(self.owner, lists=1, cards=1)
+        self.board.members.add(self.member)
+
+    def test_roles_are_loaded_once_per_request(self):
+        request = RequestFactory().get('/')
+        with self.assertNumQueries(1):
+            self.assertEqual(board_roles(self.member, request), {self.board.pk: MEMBER})
+            self.assertEqual(board_roles(self.member, request), {self.board.pk: MEMBER})
+        # Later requests are answered from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(board_roles(self.member, RequestFactory().get('/')), {self.board.pk: MEMBER})
+
+    def test_nested_objects_need_membership(self):
+        card = Card.objects.get()
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(f'/trello_backend/cards/{card.pk}/').status_code, 200)
+        self.client.force_authenticate(User.objects.create_user('stranger'))
+        self.assertEqual(self.client.get(f'/trello_backend/cards/{card.pk}/').status_code, 404)
+        response = self.client.get(f'/trello_backend/lists/?board_id={self.board.pk}')
+        self.assertEqual(response.status_code, 403)
+
+
+class BoardAccessTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.owner = User.objects.create_user('owner')
+        self.member = User.objects.create_user('member')
+        self.board = create_board(self.owner)
+
+    def access_rows(self):
+        return set(BoardAccess.objects.filter(board=self.board).values_list('user__username', 'role'))
+
+    def test_rows_follow_owner_and_members(self):
+        self.assertEqual(self.access_rows(), {('owner', OWNER)})
+        self.board.members.add(self.member)
+        self.assertEqual(self.access_rows(), {('owner', OWNER), ('member', MEMBER)})
+
+        self.board.owner = self.member
+        self.board.save()
+        self.assertEqual(self.access_rows(), {('owner', MEMBER), ('member', OWNER)})
+
+        self.member.member_boards.clear()
+        self.board.members.remove(self.owner)
+        self.assertEqual(self.access_rows(), {('member', OWNER)})
+
+    def test_changes_clear_cached_roles(self):
+        self.assertEqual(board_roles(self.member), {})
+        self.board.members.add(self.member)
+        self.assertEqual(board_roles(self.member), {self.board.pk: MEMBER})
+        self.board.members.remove(self.member)
+        self.assertEqual(board_roles(self.member), {})
+
+    def test_listings_use_the_index(self):
+        self.board.members.add(self.member)
+        create_board(User.objects.create_user('stranger'))
+        self.assertEqual(
+            list(Board.objects.filter(pk__in=accessible_board_ids(self.member))), [self.board]
+        )
+
+
+class CardFilterTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.member = User.objects.create_user('member')
+        self.client.force_authenticate(self.owner)
+        self.board = create_board(self.owner, lists=1, cards=4)
+        self.board.members.add(self.member)
+        self.bug = Label.objects.create(board=self.board, name='Bug', color='red')
+        self.urgent = Label.objects.create(board=self.board, name='Urgent', color='orange')
+        self.cards = list(Card.objects.all())
+        first, second, third, fourth = self.cards
+        first.labels.add(self.bug, self.urgent)
+        second.labels.add(self.urgent)
+        first.members.add(self.owner)
+        third.members.add(self.member)
+        Card.objects.filter(pk=second.pk).update(due_date=datetime(2026, 3, 1, 12, tzinfo=timezone.utc))
+        Card.objects.filter(pk=third.pk).update(due_date=datetime(2026, 3, 2, tzinfo=timezone.utc))
+        Card.objects.filter(pk=fourth.pk).update(archived=True)
+
+    def card_ids(self, query):
+        response = self.client.get(f'/trello_backend/cards/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return {card['id'] for card in response.data['results']}
+
+    def test_filters(self):
+        first, second, third, fourth = [card.pk for card in self.cards]
+        self.assertEqual(self.card_ids(''), {first, second, third})
+        self.assertEqual(self.card_ids('archived=all'), {first, second, third, fourth})
+        self.assertEqual(self.card_ids('archived=true'), {fourth})
+        # Any of the labels, each card once
+        self.assertEqual(self.card_ids(f'label={self.bug.pk},{self.urgent.pk}'), {first, second})
+        self.assertEqual(self.card_ids('member=me'), {first})
+        self.assertEqual(self.card_ids(f'member=me,{self.member.pk}'), {first, third})
+        self.assertEqual(self.card_ids('due_after=2026-03-01&due_before=2026-03-02'), {second})
+        self.assertEqual(self.card_ids('due_after=2026-03-01T13:00:00Z'), {third})
+        self.assertEqual(
+            self.card_ids(f'label={self.urgent.pk}&due_before=2026-03-02'), {second}
+        )
+
+    def test_invalid_filters(self):
+        for query in ('label=bug', 'member=1,x', 'due_after=soon', 'archived=maybe'):
+            response = self.client.get(f'/trello_backend/cards/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_labels_follow_cards_to_another_board(self):
+        other = create_board(self.owner, lists=1)
+        other_list = other.lists.get()
+        other_bug = Label.objects.create(board=other, name='Bug')
+        first, second = self.cards[:2]
+
+        response = self.client.post(
+            f'/trello_backend/cards/{first.pk}/move/', {'destination_list_id': other_list.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(first.labels.all()), [other_bug])
+
+        response = self.client.patch(
+            f'/trello_backend/cards/{second.pk}/', {'list': other_list.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['labels'], [])
+        self.assertEqual(self.card_ids(f'list_id={other_list.pk}&label={other_bug.pk}'), {first.pk})
+
+    def test_labels_stay_on_their_board(self):
+        other = Label.objects.create(board=create_board(self.owner), name='Bug')
+        card = self.cards[2]
+        response = self.client.patch(
+            f'/trello_backend/cards/{card.pk}/', {'label_ids': [other.pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            f'/trello_backend/cards/{card.pk}/', {'label_ids': [self.bug.pk]}, format='json'
+        )
+        self.assertEqual([label['name'] for label in response.data['labels']], ['Bug'])
+        duplicate = self.client.post(
+            '/trello_backend/labels/', {'board': self.board.pk, 'name': 'Bug'}, format='json'
+        )
+        self.assertEqual(duplicate.status_code, 400)
+
+
+class DeltaSyncTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.board = create_board(self.owner, lists=1, cards=3)
+        self.client.force_authenticate(self.owner)
+
+    def changes(self, since):
+        response = self.client.get(f'/trello_backend/boards/{self.board.pk}/changes/', {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_changes_since_cursor(self):
+        self.board.refresh_from_db()
+        cursor = self.board.version
+        renamed, removed, _ = Card.objects.order_by('position')
+        renamed.title = 'Renamed'
+        renamed.save()
+        removed_id = removed.pk
+        removed.delete()
+
+        data = self.changes(cursor)
+        self.assertFalse(data['reset'])
+        self.assertEqual([card['title'] for card in data['cards']], ['Renamed'])
+        self.assertEqual(data['deleted']['cards'], [removed_id])
+
+        data = self.changes(data['cursor'])
+        self.assertFalse(data['reset'])
+        self.assertEqual(data['cards'], [])
+
+    def test_failed_board_delete_keeps_logging(self):
+        def fail(sender, instance, **kwargs):
+            raise IntegrityError('Delete refused')
+
+        pre_delete.connect(fail, sender=Board)
+        self.addCleanup(pre_delete.disconnect, fail, sender=Board)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.board.delete()
+        pre_delete.disconnect(fail, sender=Board)
+
+        self.board.refresh_from_db()
+        cursor = self.board.version
+        card = Card.objects.first()
+        card.title = 'After the failed delete'
+        card.save()
+        self.assertEqual([card['title'] for card in self.changes(cursor)['cards']], [card.title])
+
+    def test_deleted_board_leaves_no_log(self):
+        board_id = self.board.pk
+        self.board.delete()
+        self.assertFalse(BoardChange.objects.filter(board_id=board_id).exists())
+
+    def test_cursor_ahead_of_board_resets(self):
+        self.board.refresh_from_db()
+        self.assertTrue(self.changes(self.board.version + 5)['reset'])
+
+    def test_bulk_change_logs_one_sequence_per_object(self):
+        list_obj = self.board.lists.get()
+        ids = list(list_obj.cards.order_by('-position').values_list('pk', flat=True))
+        self.board.refresh_from_db()
+        cursor = self.board.version
+        self.assertTrue(reorder(Card, {'list_id': list_obj.pk}, ids))
+
+        sequences = list(self.board.changes.filter(sequence__gt=cursor).values_list('sequence', flat=True))
+        self.assertEqual(sequences, list(range(cursor + 1, cursor + len(ids) + 1)))
+        self.assertEqual(sorted(card['id'] for card in self.changes(cursor)['cards']), sorted(ids))
+
+    def test_nothing_to_log_keeps_the_version(self):
+        self.board.refresh_from_db()
+        version = self.board.version
+        self.assertIsNone(record_changes(self.board.pk, Card, []))
+        self.board.refresh_from_db()
+        self.assertEqual(self.board.version, version)
+
+    def test_sequences_are_unique_per_board(self):
+        change = self.board.changes.first()
+        with self.assertRaises(IntegrityError):
+            BoardChange.objects.create(
+                board=self.board, sequence=change.sequence, model='card',
+                object_id=1, operation=BoardChange.UPSERT
+            )
+
+
+class PresenceTests(APITestCase):
+    def setUp(self):
+        caches['presence'].clear()
+        self.owner = User.objects.create_user('owner')
+        self.member = User.objects.create_user('member')
+        self.board = create_board(self.owner)
+        self.board.members.add(self.member)
+        # Two server processes sharing the cache
+        self.first = PresenceTracker('first')
+        self.second = PresenceTracker('second')
+
+    def test_users_on_different_processes_are_all_present(self):
+        _, joined = self.first._join(self.board.pk, self.owner.pk)
+        self.assertTrue(joined)
+        users, joined = self.second._join(self.board.pk, self.member.pk)
+        self.assertTrue(joined)
+        self.assertEqual(users, [self.owner.pk, self.member.pk])
+        self.assertEqual(presence_counts([self.board.pk]), {self.board.pk: 2})
+
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(f'/trello_backend/boards/{self.board.pk}/presence/')
+        self.assertEqual(response.data['users'], [self.owner.pk, self.member.pk])
+
+    def test_user_stays_while_another_process_has_them(self):
+        self.first._join(self.board.pk, self.owner.pk)
+        _, joined = self.second._join(self.board.pk, self.owner.pk)
+        self.assertFalse(joined)
+        self.assertFalse(self.first._leave(self.board.pk, self.owner.pk))
+        self.assertEqual(present_users(self.board.pk), [self.owner.pk])
+        self.assertTrue(self.second._leave(self.board.pk, self.owner.pk))
+        self.assertEqual(present_users(self.board.pk), [])
+
+    def test_refresh_reports_users_of_a_dead_process(self):
+        self.first._join(self.board.pk, self.owner.pk)
+        self.second._join(self.board.pk, self.member.pk)
+        later = mock.patch('boards.presence.time.time', return_value=time.time() + PRESENCE_TTL + 1)
+        with later:
+            # Only the first process is still alive and refreshing
+            left = self.first._refresh({self.board.pk: [self.owner.pk]})
+            self.assertEqual(left, {self.board.pk: [self.member.pk]})
+            self.assertEqual(present_users(self.board.pk), [self.owner.pk])
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.board = create_board(self.owner, lists=1)
+        list_obj = self.board.lists.get()
+        self.card = Card.objects.create(list=list_obj, title='Quarterly roadmap', description='Plan')
+        Card.objects.create(list=list_obj, title='Groceries', description='Roadmap printout')
+        Comment.objects.create(card=self.card, author=self.owner, text='Roadmap needs review')
+        self.checklist = Checklist.objects.create(card=self.card, title='Steps')
+        ChecklistItem.objects.create(checklist=self.checklist, text='Draft the roadmap')
+
+        self.stranger = User.objects.create_user('stranger')
+        self.other_board = create_board(self.stranger, lists=1)
+        self.client.force_authenticate(self.owner)
+
+    def search(self, user=None, **params):
+        if user is not None:
+            self.client.force_authenticate(user)
+        return self.client.get('/trello_backend/boards/search/', params)
+
+    def test_pages(self):
+        everything = [
+            (result['kind'], result['object_id']) for result in self.search(q='roadmap').data['results']
+        ]
+        paged = []
+        response = self.search(q='roadmap', page_size=3)
+        while True:
+            self.assertLessEqual(len(response.data['results']), 3)
+            paged += [(result['kind'], result['object_id']) for result in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(paged, everything)
+        self.assertEqual(len(self.search(q='roadmap', page_size=0).data['results']), 4)
+
+    def test_matches_titles_first_across_kinds(self):
+        results = self.search(q='roadmap').data['results']
+        self.assertEqual(results[0]['title'], 'Quarterly roadmap')
+        self.assertEqual(
+            sorted(result['kind'] for result in results),
+            ['card', 'card', 'checklistitem', 'comment']
+        )
+
+    def test_last_word_matches_as_prefix(self):
+        results = self.search(q='quarterly road').data['results']
+        self.assertEqual([result['object_id'] for result in results], [self.card.pk])
+
+    def test_other_users_boards_are_not_searched(self):
+        self.assertEqual(self.search(user=self.stranger, q='roadmap').data['results'], [])
+
+    def test_checklist_moved_to_another_board_takes_its_items_along(self):
+        list_obj = self.other_board.lists.get()
+        self.checklist.card = Card.objects.create(list=list_obj, title='Elsewhere')
+        self.checklist.save()
+        kinds = [result['kind'] for result in self.search(q='draft').data['results']]
+        self.assertEqual(kinds, [])
+        kinds = [result['kind'] for result in self.search(user=self.stranger, q='draft').data['results']]
+        self.assertEqual(kinds, ['checklistitem'])
+
+    def test_unindexed_fallback_gives_the_same_matches(self):
+        indexed = SearchResults(self.owner.pk, ['roadmap'])[0:10]
+        unindexed = SearchResults(self.owner.pk, ['roadmap']).fetch_unindexed(10, 0)
+        self.assertEqual(unindexed[0]['object_id'], self.card.pk)
+        self.assertEqual(
+            sorted((row['kind'], row['object_id']) for row in indexed),
+            sorted((row['kind'], row['object_id']) for row in unindexed)
+        )
+
+    def test_non_ascii_digits_are_rejected(self):
+        self.assertEqual(self.search(q='roadmap', board='\u00b2').status_code, 400)
+        response = self.client.get(f'/trello_backend/boards/{self.board.pk}/activities/', {'user': '\u00b2'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/trello_backend/cards/', {'member': '\u00b2'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AttachmentTests(APITestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(ATTACHMENT_ROOT=self.root, ATTACHMENT_ACCEL_REDIRECT='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.owner = User.objects.create_user('owner')
+        self.board = create_board(self.owner, lists=1, cards=1)
+        self.card = Card.objects.get()
+        self.client.force_authenticate(self.owner)
+        self.content = os.urandom(300 * 1024)
+
+    def start(self, size, name='file.bin'):
+        response = self.client.post('/trello_backend/uploads/', {
+            'card': self.card.pk, 'name': name, 'size': size, 'content_type': 'application/pdf'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def send(self, upload_id, offset, chunk):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.generic(
+                'PATCH', f'/trello_backend/uploads/{upload_id}/', chunk,
+                content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+            )
+
+    def upload(self, content, name='file.bin'):
+        response = self.send(self.start(len(content), name), 0, content)
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def download(self, attachment_id, **headers):
+        return self.client.get(f'/trello_backend/attachments/{attachment_id}/download/', **headers)
+
+    def test_interrupted_upload_resumes_from_its_offset(self):
+        upload_id = self.start(len(self.content))
+        half = len(self.content) // 2
+        response = self.send(upload_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        # The same chunk again, e.g. retried after a lost response
+        response = self.send(upload_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], half)
+        self.assertEqual(self.client.get(f'/trello_backend/uploads/{upload_id}/').data['offset'], half)
+
+        response = self.send(upload_id, half, self.content[half:])
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get(pk=response.data['id'])
+        self.assertEqual(attachment.blob_id, hashlib.sha256(self.content).hexdigest())
+        download = self.download(attachment.pk)
+        self.assertEqual(b''.join(download.streaming_content), self.content)
+
+    def test_identical_files_share_one_blob(self):
+        first = self.upload(self.content, 'a.bin')
+        second = self.upload(self.content, 'b.bin')
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertEqual(Blob.objects.count(), 1)
+
+        blob_id = Blob.objects.get().pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/trello_backend/attachments/{first["id"]}/')
+        self.assertTrue(os.path.exists(blob_path(blob_id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/trello_backend/attachments/{second["id"]}/')
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob_path(blob_id)))
+
+    def test_completing_twice_does_not_fail(self):
+        upload_id = self.start(0, 'empty.txt')
+        self.assertEqual(self.send(upload_id, 0, b'').status_code, 201)
+        self.assertEqual(self.send(upload_id, 0, b'').status_code, 404)
+        self.assertEqual(Attachment.objects.count(), 1)
+
+    def test_range_requests(self):
+        attachment_id = self.upload(self.content)['id']
+        response = self.download(attachment_id, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.download(attachment_id, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.download(attachment_id, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+        etag = self.download(attachment_id)['ETag']
+        self.assertEqual(self.download(attachment_id, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_link_attachments_need_a_url(self):
+        response = self.client.post('/trello_backend/attachments/', {
+            'card': self.card.pk, 'name': 'Spec'
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/trello_backend/attachments/', {
+            'card': self.card.pk, 'name': 'Spec', 'url': 'https://example.com/spec'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['url'], 'https://example.com/spec')
+        self.assertEqual(self.download(response.data['id']).status_code, 404)
+
+
+class BackgroundVariantTests(APITestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root, BOARD_BACKGROUND_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.owner = User.objects.create_user('owner')
+        self.board = create_board(self.owner)
+
+    def image(self, name, color, size=(2400, 1600)):
+        data = io.BytesIO()
+        Image.new('RGB', size, color).save(data, 'JPEG')
+        return SimpleUploadedFile(name, data.getvalue(), content_type='image/jpeg')
+
+    def set_background(self, board, image, render=True):
+        with self.captureOnCommitCallbacks(execute=render):
+            board.background_image = image
+            board.save()
+        return Board.objects.get(pk=board.pk)
+
+    def test_variants_are_rendered_once_the_image_is_saved(self):
+        board = self.set_background(self.board, self.image('sky.jpg', 'blue'))
+        self.assertEqual(len(board.background_hash), 64)
+        self.assertEqual(board.background_source, board.background_image.name)
+
+        sizes = {}
+        for variant in ('full', 'header', 'tile'):
+            path = os.path.join(variants_root(), variant_name(board.background_hash, variant, 'webp'))
+            with Image.open(path) as variant_image:
+                sizes[variant] = variant_image.size
+        self.assertEqual(sizes, {'full': (1620, 1080), 'header': (810, 540), 'tile': (320, 180)})
+
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(f'/trello_backend/boards/{board.pk}/')
+        self.assertTrue(response.data['background_variants']['tile']['jpeg'].endswith('/tile.jpeg'))
+
+    def test_new_image_drops_the_old_variants_at_once(self):
+        board = self.set_background(self.board, self.image('sky.jpg', 'blue'))
+        old_hash = board.background_hash
+
+        board = self.set_background(board, self.image('sea.jpg', 'green'), render=False)
+        self.assertEqual(board.background_hash, '')
+
+        board = self.set_background(board, self.image('sun.jpg', 'yellow'))
+        self.assertNotIn(board.background_hash, ('', old_hash))
+
+    @override_settings(BOARD_BACKGROUND_WORKERS=1)
+    def test_broken_worker_pool_is_replaced(self):
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool
+        with mock.patch.object(backgrounds, '_executor', broken):
+            with self.assertLogs('boards.backgrounds', 'ERROR'):
+                board = self.set_background(self.board, self.image('sky.jpg', 'blue'))
+            self.assertIsNone(backgrounds._executor)
+        self.assertEqual(board.background_hash, '')
+
+        failed = mock.Mock()
+        failed.result.side_effect = BrokenProcessPool
+        with mock.patch.object(backgrounds, '_executor', broken):
+            with self.assertLogs('boards.backgrounds', 'ERROR'):
+                backgrounds.variants_finished(board.pk, board.background_image.name, failed, broken)
+            self.assertIsNone(backgrounds._executor)
+
+    def test_stale_save_keeps_the_rendered_hash(self):
+        stale = Board.objects.get(pk=self.board.pk)
+        board = self.set_background(self.board, self.image('sky.jpg', 'blue'))
+
+        stale.background_image = board.background_image.name
+        stale.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            stale.save()
+        self.assertEqual(callbacks, [])
+        board.refresh_from_db()
+        self.assertEqual(board.title, 'Renamed')
+        self.assertEqual(len(board.background_hash), 64)
+        self.assertEqual(board.background_source, board.background_image.name)
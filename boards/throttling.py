@@ -0,0 +1,105 @@
+"""
+Rate limiting and batching for client-originated socket events (cursor
+moves, drag previews and the like), which are relayed to the board's
+other viewers without touching the database.
+
+Each connection spends tokens from its own TokenBucket; events beyond the
+limit are dropped. Accepted events wait in the process-wide relay batcher
+for one tick, during which a newer event with the same key (user, action
+and data id) replaces the older one, and are then sent as one frame per
+board. relay_stats counts what happened to every event in this process;
+get_relay_stats() reads it (and backs the staff-only relay stats endpoint).
+"""
+import asyncio
+import collections
+import logging
+import time
+
+from channels.layers import get_channel_layer
+
+from .signals import encode_frame
+
+logger = logging.getLogger(__name__)
+
+RELAY_TICK = 0.05
+# Seconds between relay_stats log lines
+STATS_INTERVAL = 60
+
+relay_stats = collections.Counter()
+
+
+def get_relay_stats():
+    """
+    Snapshot of relay_stats for this process.
+    """
+    return dict(relay_stats)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RelayBatcher:
+    def __init__(self, tick=RELAY_TICK):
+        self.tick = tick
+        self.pending = {}
+        self.logged = time.monotonic()
+
+    def add(self, board_id, action, data, user):
+        events = self.pending.get(board_id)
+        if events is None:
+            events = self.pending[board_id] = {}
+            loop = asyncio.get_running_loop()
+            loop.call_later(self.tick, lambda: loop.create_task(self.flush(board_id)))
+
+        object_id = data.get('id') if isinstance(data, dict) else None
+        if not isinstance(object_id, (str, int)):
+            object_id = None
+        key = (user, action, object_id)
+        if key in events:
+            relay_stats['merged'] += 1
+            # Re-inserting keeps events in the order of their latest version
+            del events[key]
+        events[key] = {'type': action, 'data': data, 'user': user}
+
+    async def flush(self, board_id):
+        events = list(self.pending.pop(board_id, {}).values())
+        if not events:
+            return
+        if len(events) == 1:
+            frame = dict(events[0], board_id=board_id)
+        else:
+            frame = {'type': 'batch', 'board_id': board_id, 'events': events}
+        try:
+            await get_channel_layer().group_send(f'board_{board_id}', {
+                'type': 'board_update',
+                'board_id': board_id,
+                'text': encode_frame(frame)
+            })
+        except Exception:
+            relay_stats['failed'] += len(events)
+            logger.exception('Relaying %d events to board %s failed', len(events), board_id)
+        else:
+            relay_stats['relayed'] += len(events)
+            relay_stats['frames'] += 1
+
+        now = time.monotonic()
+        if now - self.logged >= STATS_INTERVAL:
+            self.logged = now
+            logger.info('Socket relay stats: %s', get_relay_stats())
+
+
+relay_batcher = RelayBatcher()
@@ -3,12 +3,15 @@ from rest_framework.routers import DefaultRouter
 from . import views
 
 router = DefaultRouter()
-router.register(r'boards', views.BoardViewSet)
-router.register(r'lists', views.ListViewSet)
-router.register(r'cards', views.CardViewSet)
-router.register(r'comments', views.CommentViewSet)
-router.register(r'checklists', views.ChecklistViewSet)
-router.register(r'checklist-items', views.ChecklistItemViewSet)
+router.register(r'boards', views.BoardViewSet, basename='board')
+router.register(r'lists', views.ListViewSet, basename='list')
+router.register(r'labels', views.LabelViewSet, basename='label')
+router.register(r'cards', views.CardViewSet, basename='card')
+router.register(r'comments', views.CommentViewSet, basename='comment')
+router.register(r'checklists', views.ChecklistViewSet, basename='checklist')
+router.register(r'checklist-items', views.ChecklistItemViewSet, basename='checklistitem')
+router.register(r'attachments', views.AttachmentViewSet, basename='attachment')
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,38 +1,196 @@
+import hashlib
+import io
+from datetime import datetime, time
 from django.db import transaction
-from django.db.models import Q
-from django.shortcuts import get_object_or_404
-from rest_framework import viewsets, status, permissions
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_etags
+from rest_framework import mixins, viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import Board, List, Card, Comment, Checklist, ChecklistItem, Activity
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from .models import (
+    Board, List, Label, Card, CardLabel, Comment, Checklist, ChecklistItem, Activity,
+    Attachment, UploadSession
+)
 from .serializers import (
-    BoardSerializer, ListSerializer, CardSerializer, 
+    BoardSerializer, BoardSummarySerializer, ListSerializer, LabelSerializer, CardSerializer,
     CommentSerializer, ChecklistSerializer, ChecklistItemSerializer,
-    ActivitySerializer, ReorderListsSerializer, ReorderCardsSerializer
+    AttachmentSerializer, UploadSessionSerializer,
+    ActivitySerializer, ReorderListsSerializer, ReorderCardsSerializer,
+    MoveSerializer, MoveCardSerializer, parse_field_list, parse_id
 )
 from .permissions import IsBoardMember, IsBoardOwnerOrMember
+from .access import accessible_board_ids
+from .activity import record_activity
+from .attachments import (
+    UploadConflict, abort_upload, finish_upload, serve_attachment, start_upload, write_chunk
+)
+from .changes import changes_since
+from .moves import move_card
+from .pagination import ActivityCursorPagination, SearchPagination
+from .presence import present_users, presence_counts
+from .ranking import rank_for_index, reorder
+from .search import SearchResults, query_terms
+from .snapshot import board_tree_queryset, get_board_snapshot
+from .throttling import get_relay_stats
+
+
+def count_subquery(queryset, field):
+    """
+    Per-row count of a related queryset, grouped on `field` (which the caller
+    filters against OuterRef). Avoids the row explosion of joined Count()s.
+    """
+    counts = queryset.order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
 
+class ConditionalReadMixin:
+    """
+    Strong ETags for read actions. The tag is derived from the versions of
+    the boards behind the response (plus the request path and query
+    string) and computed before anything is serialized, so a matching
+    If-None-Match is answered with 304 Not Modified at the cost of one
+    small query.
+    """
+    # Lookup from this viewset's model to its board id
+    etag_board_field = 'board_id'
 
-class BoardViewSet(viewsets.ModelViewSet):
+    def get_etag(self, queryset):
+        board_ids = queryset.order_by().values(self.etag_board_field)
+        versions = Board.objects.filter(pk__in=board_ids).order_by('pk').values_list('pk', 'version')
+        return self.make_etag(list(versions))
+
+    def make_etag(self, versions):
+        key = f'{self.basename}:{self.request.get_full_path()}:{versions}'
+        return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+    def conditional_response(self, etag, build_response):
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match:
+            client_etags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+            if etag in client_etags or '*' in client_etags:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response = build_response()
+        response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self.get_etag(type(instance).objects.filter(pk=instance.pk))
+        return self.conditional_response(
+            etag, lambda: Response(self.get_serializer(instance).data)
+        )
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag(self.filter_queryset(self.get_queryset()))
+        return self.conditional_response(
+            etag, lambda: super(ConditionalReadMixin, self).list(request, *args, **kwargs)
+        )
+
+
+class BoardAccessMixin:
+    """
+    Permission checks for a parent object named in the request (?board_id=,
+    ?list_id= ...) that only look up its board id instead of loading the
+    object and its ancestors.
+    """
+    def check_parent_permissions(self, queryset, pk, board_field):
+        """
+        Raise 404 unless object `pk` of `queryset` exists, then run the object
+        permissions against its board. Returns the board id.
+        """
+        try:
+            board_id = queryset.filter(pk=pk).values_list(board_field, flat=True).first()
+        except (ValueError, TypeError):
+            board_id = None
+        if board_id is None:
+            raise Http404
+        # Permissions only look at the pk, so the board is never fetched
+        self.check_object_permissions(self.request, Board(pk=board_id))
+        return board_id
+
+
+class BoardViewSet(ConditionalReadMixin, viewsets.ModelViewSet):
     serializer_class = BoardSerializer
     permission_classes = [IsAuthenticated]
+    etag_board_field = 'pk'
 
     def get_queryset(self):
         user = self.request.user
         # Return boards where user is owner or member
-        return Board.objects.filter(
-            archived=False
-        ).filter(
-            Q(owner=user) | Q(members=user)
-        ).distinct()
+        queryset = Board.objects.filter(archived=False, pk__in=accessible_board_ids(user))
+        if self.action == 'list':
+            queryset = self.get_summary_queryset(queryset)
+        return queryset
+
+    def get_summary_queryset(self, queryset):
+        queryset = queryset.annotate(
+            member_count=count_subquery(
+                Board.members.through.objects.filter(board=OuterRef('pk')), 'board'
+            ),
+            list_count=count_subquery(
+                List.objects.filter(board=OuterRef('pk')), 'board'
+            ),
+            card_count=count_subquery(
+                Card.objects.filter(list__board=OuterRef('pk'), archived=False), 'list__board'
+            ),
+        )
+        # Only load the nested data the client asked for
+        expand = parse_field_list(self.request.query_params.get('expand'))
+        expand |= parse_field_list(self.request.query_params.get('fields'))
+        top_level = {name.split('.', 1)[0] for name in expand}
+        if 'lists' in top_level:
+            return board_tree_queryset(queryset)
+        if 'owner' in top_level:
+            queryset = queryset.select_related('owner')
+        if 'members' in top_level:
+            queryset = queryset.prefetch_related('members')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return BoardSummarySerializer
+        return BoardSerializer
+
+    def get_etag(self, queryset):
+        if self.action != 'list':
+            return super().get_etag(queryset)
+        # Viewer counts change without a version bump, so they are part of
+        # the listing's tag; they are read once and reused for the body
+        versions = list(
+            Board.objects.filter(pk__in=queryset.order_by().values('pk'))
+            .order_by('pk').values_list('pk', 'version')
+        )
+        self.presence_counts = presence_counts([pk for pk, _ in versions])
+        return self.make_etag([
+            (pk, version, self.presence_counts[pk]) for pk, version in versions
+        ])
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if hasattr(self, 'presence_counts'):
+            context['presence_counts'] = self.presence_counts
+        return context
+
+    def retrieve(self, request, *args, **kwargs):
+        # The nested tree is only loaded when the snapshot cache misses
+        board = self.get_object()
+        return self.conditional_response(
+            self.make_etag([(board.pk, board.version)]),
+            lambda: Response(get_board_snapshot(board, request))
+        )
 
     def perform_create(self, serializer):
         board = serializer.save(owner=self.request.user)
         # Add owner as a member
         board.members.add(self.request.user)
         # Log activity
-        Activity.objects.create(
+        record_activity(
             board=board,
             user=self.request.user,
             activity_type='CREATE',
@@ -41,7 +199,7 @@ class BoardViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         board = serializer.save()
-        Activity.objects.create(
+        record_activity(
             board=board,
             user=self.request.user,
             activity_type='UPDATE',
@@ -52,7 +210,7 @@ class BoardViewSet(viewsets.ModelViewSet):
         # Soft delete (archive)
         instance.archived = True
         instance.save()
-        Activity.objects.create(
+        record_activity(
             board=instance,
             user=self.request.user,
             activity_type='DELETE',
@@ -67,20 +225,15 @@ class BoardViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             list_ids = serializer.validated_data['lists']
             
-            # Validate that all lists belong to this board
-            lists = List.objects.filter(id__in=list_ids, board=board)
-            if len(lists) != len(list_ids):
+            # Validate and rewrite every position in one atomic UPDATE
+            if not reorder(List, {'board_id': board.id}, list_ids):
                 return Response(
                     {'error': 'Invalid list IDs'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Update positions
-            for position, list_id in enumerate(list_ids):
-                List.objects.filter(id=list_id, board=board).update(position=position)
-            
             # Log activity
-            Activity.objects.create(
+            record_activity(
                 board=board,
                 user=request.user,
                 activity_type='MOVE',
@@ -92,13 +245,96 @@ class BoardViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def activities(self, request, pk=None):
+        """
+        Activity feed, newest first, paged with ?cursor=. Filter with
+        ?activity_type=MOVE,COMMENT and ?user=<id>.
+        """
+        board = self.get_object()
+        activities = Activity.objects.filter(board=board).select_related('user')
+
+        activity_types = parse_field_list(request.query_params.get('activity_type'))
+        if activity_types:
+            activities = activities.filter(activity_type__in=activity_types)
+        user_id = request.query_params.get('user')
+        if user_id:
+            user_id = parse_id(user_id)
+            if user_id is None:
+                return Response(
+                    {'user': ['A valid user id is required.']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            activities = activities.filter(user_id=user_id)
+
+        paginator = ActivityCursorPagination()
+        page = paginator.paginate_queryset(activities, request, view=self)
+        serializer = ActivitySerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def changes(self, request, pk=None):
+        """
+        Delta sync: everything that changed after ?since=<version>. The
+        returned cursor is the version to pass on the next call.
+        """
         board = self.get_object()
-        activities = Activity.objects.filter(board=board).order_by('-created_at')[:50]
-        serializer = ActivitySerializer(activities, many=True)
-        return Response(serializer.data)
+        try:
+            since = int(request.query_params.get('since', ''))
+        except ValueError:
+            since = -1
+        if since < 0:
+            return Response(
+                {'since': ['A non-negative board version is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(changes_since(board, since, request))
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Cards, comments and checklist items matching ?q= on the user's
+        boards (or only on ?board=<id>), best match first. Every word of
+        the query must appear in the text; the last one may also be the
+        start of a longer word, for search-as-you-type.
+        """
+        terms = query_terms(request.query_params.get('q'))
+        if not terms:
+            return Response(
+                {'q': ['A search query with at least one word is required.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        board_id = request.query_params.get('board')
+        if board_id is not None:
+            board_id = parse_id(board_id)
+            if board_id is None:
+                return Response(
+                    {'board': ['A board id is required.']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        results = SearchResults(request.user.pk, terms, board_id)
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(results, request, view=self)
+        return paginator.get_paginated_response(page)
+
+    @action(detail=True, methods=['get'])
+    def presence(self, request, pk=None):
+        """
+        Ids of the users with the board open right now.
+        """
+        board = self.get_object()
+        users = present_users(board.pk)
+        return Response({'board_id': board.pk, 'users': users, 'count': len(users)})
 
-class ListViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], url_path='relay-stats',
+            permission_classes=[IsAdminUser])
+    def relay_stats(self, request):
+        """
+        Socket relay counters of the process serving this request (staff only).
+        """
+        return Response(get_relay_stats())
+
+
+class ListViewSet(BoardAccessMixin, ConditionalReadMixin, viewsets.ModelViewSet):
     serializer_class = ListSerializer
     permission_classes = [IsAuthenticated, IsBoardMember]
 
@@ -107,15 +343,14 @@ class ListViewSet(viewsets.ModelViewSet):
         board_id = self.request.query_params.get('board_id')
         
         if board_id:
-            board = get_object_or_404(Board, id=board_id)
-            self.check_object_permissions(self.request, board)
-            return List.objects.filter(board=board, board__archived=False)
+            board_id = self.check_parent_permissions(Board.objects.all(), board_id, 'pk')
+            return List.objects.filter(board_id=board_id, board__archived=False)
         
-        return List.objects.filter(board__members=user, board__archived=False)
+        return List.objects.filter(board_id__in=accessible_board_ids(user), board__archived=False)
 
     def perform_create(self, serializer):
         list_obj = serializer.save()
-        Activity.objects.create(
+        record_activity(
             board=list_obj.board,
             user=self.request.user,
             activity_type='CREATE',
@@ -124,32 +359,163 @@ class ListViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         list_obj = serializer.save()
-        Activity.objects.create(
+        record_activity(
             board=list_obj.board,
             user=self.request.user,
             activity_type='UPDATE',
             description=f'{self.request.user.username} updated list "{list_obj.title}"'
         )
 
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        list_obj = self.get_object()
+        serializer = MoveSerializer(data=request.data)
+
+        if serializer.is_valid():
+            # Only the moved list is written; its neighbours keep their ranks
+            list_obj.position = rank_for_index(
+                List, {'board_id': list_obj.board_id},
+                index=serializer.validated_data['position'],
+                exclude=list_obj.pk
+            )
+            list_obj.save(update_fields=['position', 'updated_at'])
+
+            record_activity(
+                board_id=list_obj.board_id,
+                user=request.user,
+                activity_type='MOVE',
+                description=f'{request.user.username} moved list "{list_obj.title}"'
+            )
+
+            return Response({'status': 'list moved', 'position': list_obj.position})
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['post'])
+    def reorder_cards(self, request, pk=None):
+        list_obj = self.get_object()
+        serializer = ReorderCardsSerializer(data=request.data)
+
+        if serializer.is_valid():
+            card_ids = serializer.validated_data['cards']
+
+            if not reorder(Card, {'list_id': list_obj.id}, card_ids):
+                return Response(
+                    {'error': 'Invalid card IDs'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            record_activity(
+                board_id=list_obj.board_id,
+                user=request.user,
+                activity_type='MOVE',
+                description=f'{request.user.username} reordered cards in "{list_obj.title}"'
+            )
+
+            return Response({'status': 'cards reordered'})
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class LabelViewSet(BoardAccessMixin, ConditionalReadMixin, viewsets.ModelViewSet):
+    serializer_class = LabelSerializer
+    permission_classes = [IsAuthenticated, IsBoardMember]
+
+    def get_queryset(self):
+        user = self.request.user
+        board_id = self.request.query_params.get('board_id')
+
+        if board_id:
+            board_id = self.check_parent_permissions(Board.objects.all(), board_id, 'pk')
+            return Label.objects.filter(board_id=board_id)
+
+        return Label.objects.filter(board_id__in=accessible_board_ids(user))
+
+    def perform_create(self, serializer):
+        self.check_object_permissions(self.request, serializer.validated_data['board'])
+        serializer.save()
+
 
-class CardViewSet(viewsets.ModelViewSet):
+class CardViewSet(BoardAccessMixin, ConditionalReadMixin, viewsets.ModelViewSet):
     serializer_class = CardSerializer
     permission_classes = [IsAuthenticated, IsBoardMember]
+    etag_board_field = 'list__board_id'
 
     def get_queryset(self):
         user = self.request.user
         list_id = self.request.query_params.get('list_id')
         
         if list_id:
-            list_obj = get_object_or_404(List, id=list_id)
-            self.check_object_permissions(self.request, list_obj.board)
-            return Card.objects.filter(list=list_obj, archived=False)
-        
-        return Card.objects.filter(list__board__members=user, archived=False)
+            self.check_parent_permissions(List.objects.all(), list_id, 'board_id')
+            queryset = Card.objects.filter(list_id=list_id)
+        else:
+            queryset = Card.objects.filter(list__board_id__in=accessible_board_ids(user))
+        return self.filter_cards(queryset).prefetch_related('labels', 'attachments')
+
+    def filter_cards(self, queryset):
+        """
+        Query string filters, all applied in SQL:
+        ?label= and ?member= (comma separated ids, "me" for the requesting
+        user) match cards with any of the given labels or members;
+        ?due_after= and ?due_before= (ISO date or datetime; due_before is
+        exclusive) bound the due date; ?archived=true|false|all, false by
+        default.
+        """
+        params = self.request.query_params
+
+        archived = params.get('archived', 'false').lower()
+        if archived not in ('true', 'false', 'all'):
+            raise ValidationError({'archived': ['Must be true, false or all.']})
+        if archived != 'all':
+            queryset = queryset.filter(archived=archived == 'true')
+
+        # Semi-joins on the link tables: no duplicate cards, no distinct()
+        label_ids = self.parse_ids('label')
+        if label_ids:
+            queryset = queryset.filter(
+                pk__in=CardLabel.objects.filter(label_id__in=label_ids).values('card_id')
+            )
+        member_ids = self.parse_ids('member')
+        if member_ids:
+            queryset = queryset.filter(
+                pk__in=Card.members.through.objects.filter(user_id__in=member_ids).values('card_id')
+            )
+
+        due_after = self.parse_due('due_after')
+        if due_after is not None:
+            queryset = queryset.filter(due_date__gte=due_after)
+        due_before = self.parse_due('due_before')
+        if due_before is not None:
+            queryset = queryset.filter(due_date__lt=due_before)
+        return queryset
+
+    def parse_ids(self, param):
+        ids = set()
+        for value in parse_field_list(self.request.query_params.get(param)):
+            pk = self.request.user.pk if value == 'me' else parse_id(value)
+            if pk is None:
+                raise ValidationError({param: ['Must be a comma separated list of ids.']})
+            ids.add(pk)
+        return ids
+
+    def parse_due(self, param):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        try:
+            moment = parse_datetime(value)
+            if moment is None:
+                day = parse_date(value)
+                moment = datetime.combine(day, time.min) if day is not None else None
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({param: ['Must be an ISO 8601 date or datetime.']})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
 
     def perform_create(self, serializer):
         card = serializer.save()
-        Activity.objects.create(
+        record_activity(
             board=card.list.board,
             user=self.request.user,
             activity_type='CREATE',
@@ -158,7 +524,7 @@ class CardViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         card = serializer.save()
-        Activity.objects.create(
+        record_activity(
             board=card.list.board,
             user=self.request.user,
             activity_type='UPDATE',
@@ -168,47 +534,44 @@ class CardViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def move(self, request, pk=None):
         card = self.get_object()
-        serializer = ReorderCardsSerializer(data=request.data)
+        serializer = MoveCardSerializer(data=request.data)
         
         if serializer.is_valid():
             new_list_id = serializer.validated_data.get('destination_list_id')
-            new_position = serializer.validated_data.get('position', 0)
+            new_position = serializer.validated_data['position']
             
             if new_list_id:
-                new_list = get_object_or_404(List, id=new_list_id)
-                self.check_object_permissions(request, new_list.board)
-                
-                # Move card to new list
-                old_list = card.list
-                card.list = new_list
-                card.position = new_position
-                card.save()
-                
-                # Log activity
-                Activity.objects.create(
-                    board=new_list.board,
-                    user=request.user,
-                    activity_type='MOVE',
-                    description=f'{request.user.username} moved card "{card.title}" from "{old_list.title}" to "{new_list.title}"'
-                )
+                self.check_parent_permissions(List.objects.all(), new_list_id, 'board_id')
+            
+            try:
+                source, destination = move_card(card, new_list_id, new_position)
+            except List.DoesNotExist:
+                # Deleted since the permission check
+                raise Http404
+            
+            # Log activity
+            if source.pk != destination.pk:
+                description = f'{request.user.username} moved card "{card.title}" from "{source.title}" to "{destination.title}"'
             else:
-                # Reorder within same list
-                card.position = new_position
-                card.save()
-                
-                Activity.objects.create(
-                    board=card.list.board,
-                    user=request.user,
-                    activity_type='MOVE',
-                    description=f'{request.user.username} reordered card "{card.title}"'
-                )
+                description = f'{request.user.username} reordered card "{card.title}"'
+            record_activity(
+                board_id=destination.board_id,
+                user=request.user,
+                activity_type='MOVE',
+                description=description
+            )
             
-            return Response({'status': 'card moved'})
+            return Response({
+                'status': 'card moved',
+                'id': card.pk,
+                'list_id': destination.pk,
+                'position': card.position
+            })
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(BoardAccessMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated, IsBoardMember]
 
@@ -217,15 +580,14 @@ class CommentViewSet(viewsets.ModelViewSet):
         card_id = self.request.query_params.get('card_id')
         
         if card_id:
-            card = get_object_or_404(Card, id=card_id)
-            self.check_object_permissions(self.request, card.list.board)
-            return Comment.objects.filter(card=card)
+            self.check_parent_permissions(Card.objects.all(), card_id, 'list__board_id')
+            return Comment.objects.filter(card_id=card_id)
         
-        return Comment.objects.filter(card__list__board__members=user)
+        return Comment.objects.filter(card__list__board_id__in=accessible_board_ids(user))
 
     def perform_create(self, serializer):
         comment = serializer.save(author=self.request.user)
-        Activity.objects.create(
+        record_activity(
             board=comment.card.list.board,
             user=self.request.user,
             activity_type='COMMENT',
@@ -233,7 +595,7 @@ class CommentViewSet(viewsets.ModelViewSet):
         )
 
 
-class ChecklistViewSet(viewsets.ModelViewSet):
+class ChecklistViewSet(BoardAccessMixin, viewsets.ModelViewSet):
     serializer_class = ChecklistSerializer
     permission_classes = [IsAuthenticated, IsBoardMember]
 
@@ -242,14 +604,13 @@ class ChecklistViewSet(viewsets.ModelViewSet):
         card_id = self.request.query_params.get('card_id')
         
         if card_id:
-            card = get_object_or_404(Card, id=card_id)
-            self.check_object_permissions(self.request, card.list.board)
-            return Checklist.objects.filter(card=card)
+            self.check_parent_permissions(Card.objects.all(), card_id, 'list__board_id')
+            return Checklist.objects.filter(card_id=card_id)
         
-        return Checklist.objects.filter(card__list__board__members=user)
+        return Checklist.objects.filter(card__list__board_id__in=accessible_board_ids(user))
 
 
-class ChecklistItemViewSet(viewsets.ModelViewSet):
+class ChecklistItemViewSet(BoardAccessMixin, viewsets.ModelViewSet):
     serializer_class = ChecklistItemSerializer
     permission_classes = [IsAuthenticated, IsBoardMember]
 
@@ -258,18 +619,112 @@ class ChecklistItemViewSet(viewsets.ModelViewSet):
         checklist_id = self.request.query_params.get('checklist_id')
         
         if checklist_id:
-            checklist = get_object_or_404(Checklist, id=checklist_id)
-            self.check_object_permissions(self.request, checklist.card.list.board)
-            return ChecklistItem.objects.filter(checklist=checklist)
+            self.check_parent_permissions(Checklist.objects.all(), checklist_id, 'card__list__board_id')
+            return ChecklistItem.objects.filter(checklist_id=checklist_id)
         
-        return ChecklistItem.objects.filter(checklist__card__list__board__members=user)
+        return ChecklistItem.objects.filter(
+            checklist__card__list__board_id__in=accessible_board_ids(user)
+        )
 
     def perform_update(self, serializer):
         item = serializer.save()
         if 'completed' in serializer.validated_data:
-            Activity.objects.create(
+            record_activity(
                 board=item.checklist.card.list.board,
                 user=self.request.user,
                 activity_type='COMPLETE',
                 description=f'{self.request.user.username} {"completed" if item.completed else "unchecked"} "{item.text}"'
-            )
\ No newline at end of file
+            )
+
+
+class AttachmentViewSet(BoardAccessMixin, ConditionalReadMixin, viewsets.ModelViewSet):
+    """
+    Attachments of the cards a user can open. POST adds a link; files are
+    uploaded through /uploads/ and fetched from the download action.
+    """
+    serializer_class = AttachmentSerializer
+    permission_classes = [IsAuthenticated, IsBoardMember]
+    etag_board_field = 'card__list__board_id'
+    http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        user = self.request.user
+        card_id = self.request.query_params.get('card_id')
+
+        if card_id:
+            self.check_parent_permissions(Card.objects.all(), card_id, 'list__board_id')
+            return Attachment.objects.filter(card_id=card_id)
+
+        return Attachment.objects.filter(card__list__board_id__in=accessible_board_ids(user))
+
+    def perform_create(self, serializer):
+        card = serializer.validated_data['card']
+        self.check_parent_permissions(Card.objects.all(), card.pk, 'list__board_id')
+        serializer.save(uploaded_by=self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        attachment = self.get_object()
+        if not attachment.blob_id:
+            raise Http404
+        return serve_attachment(request, attachment)
+
+
+class UploadViewSet(BoardAccessMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable file uploads. POST {card, name, size, content_type} opens a
+    session; each PATCH sends the next chunk as the raw body, with the
+    offset it starts at in Upload-Offset. A chunk that is not at the
+    session's offset gets 409 and the offset to resume from. The PATCH
+    that completes the file (an empty one for an empty file) answers 201
+    with the new attachment; the others 204. GET reports the offset after
+    an interrupted chunk.
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated, IsBoardMember]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        self.check_parent_permissions(Card.objects.all(), data['card'].pk, 'list__board_id')
+        serializer.instance = start_upload(
+            data['card'], self.request.user, data['name'], data['size'],
+            data.get('content_type', '')
+        )
+
+    def partial_update(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError({'detail': 'Upload-Offset and Content-Length must be integers.'})
+
+        try:
+            write_chunk(session, request.stream or io.BytesIO(), offset, length)
+        except UploadConflict as exc:
+            return Response(
+                {'detail': str(exc), 'offset': exc.offset},
+                status=status.HTTP_409_CONFLICT, headers={'Upload-Offset': str(exc.offset)}
+            )
+        except ValueError as exc:
+            raise ValidationError({'detail': str(exc)})
+
+        if session.offset < session.size:
+            return Response(status=status.HTTP_204_NO_CONTENT, headers={'Upload-Offset': str(session.offset)})
+        try:
+            attachment = finish_upload(session)
+        except UploadSession.DoesNotExist:
+            # Another request completed it first
+            raise Http404
+        return Response(
+            AttachmentSerializer(attachment, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    def perform_destroy(self, instance):
+        abort_upload(instance)
@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'boards.middleware.BufferedSideEffectsMiddleware',
 ]
 
 ROOT_URLCONF = 'trello_backend.urls'
@@ -118,13 +119,24 @@ if not DEBUG:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Processes resizing board background images; 0 renders them in-process
+BOARD_BACKGROUND_WORKERS = int(os.environ.get('BOARD_BACKGROUND_WORKERS', 2))
+
+# Card attachments: blobs and partial uploads, outside MEDIA_ROOT so they
+# are only reachable through the permission-checked download endpoint
+ATTACHMENT_ROOT = Path(os.environ.get('ATTACHMENT_ROOT', BASE_DIR / 'attachments'))
+ATTACHMENT_MAX_SIZE = int(os.environ.get('ATTACHMENT_MAX_SIZE', 100 * 1024 * 1024))
+# Internal nginx location aliased to ATTACHMENT_ROOT (e.g. '/_attachments/');
+# when set, downloads are sent by nginx instead of Django
+ATTACHMENT_ACCEL_REDIRECT = os.environ.get('ATTACHMENT_ACCEL_REDIRECT', '')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
@@ -151,12 +163,70 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
-# Channels settings (for WebSocket)
-CHANNEL_LAYERS = {
+# Caches
+CACHES = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Serialized board snapshots, keyed by board id and version
+    'board_snapshots': {
+        'BACKEND': 'boards.cache.BoundedLocMemCache',
+        'LOCATION': 'board-snapshots',
+        'TIMEOUT': None,  # Keys are versioned, stale ones age out via LRU
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('BOARD_SNAPSHOT_CACHE_ENTRIES', 1000)),
+            'MAX_BYTES': int(os.environ.get('BOARD_SNAPSHOT_CACHE_BYTES', 64 * 1024 * 1024)),
+        },
+    },
+    # Who is viewing each board; point this at a shared cache when running
+    # several ASGI processes
+    'presence': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'board-presence',
+    },
+    # Users behind JWTs, so authenticated requests skip the users table.
+    # Point AUTH_USER_CACHE_BACKEND/LOCATION at a shared cache (e.g.
+    # django.core.cache.backends.redis.RedisCache) when running several
+    # processes; see users.authentication for how a local one behaves.
+    'auth_users': {
+        'BACKEND': os.environ.get('AUTH_USER_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('AUTH_USER_CACHE_LOCATION', 'auth-users'),
     },
 }
+if CACHES['auth_users']['BACKEND'].endswith('LocMemCache'):
+    CACHES['auth_users']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+# Upper bound on how long an authenticated user is served from the cache
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 300))
+# Lower bound for a process-local auth_users cache, which does not see
+# deactivations and password changes made by other processes
+AUTH_USER_LOCAL_CACHE_TTL = int(os.environ.get('AUTH_USER_LOCAL_CACHE_TTL', 30))
+# Check every hit of a process-local auth_users cache against the database
+AUTH_USER_CACHE_RECHECK = os.environ.get('AUTH_USER_CACHE_RECHECK', 'False').lower() in ('true', '1', 't')
+
+# Write activity log entries from a background thread instead of at the
+# end of each request
+BOARD_ACTIVITY_ASYNC = os.environ.get('BOARD_ACTIVITY_ASYNC', 'False').lower() in ('true', '1', 't')
+
+# Channels settings (for WebSocket)
+# The in-memory layer only reaches clients connected to the same process;
+# CHANNEL_LAYER=sqlite shares groups between all worker processes on a host
+if os.environ.get('CHANNEL_LAYER', 'memory') == 'sqlite':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'boards.channel_layers.SQLiteChannelLayer',
+            'CONFIG': {
+                'path': os.environ.get('CHANNEL_LAYER_PATH'),  # Defaults to the temp directory
+                'capacity': int(os.environ.get('CHANNEL_LAYER_CAPACITY', 100)),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
 
 # Email settings (for development)
 if DEBUG:
@@ -9,6 +9,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     # path('trello_backend/stores/', include('stores.urls')),
     path('trello_backend/users/', include('users.urls')),
+    path('trello_backend/', include('boards.urls')),
     path('trello_backend/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('trello_backend/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]+static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+JWT authentication that keeps the authenticated user in a cache instead of
+loading the row on every request or socket connect.
+
+Entries are keyed by user id and token jti and live for
+AUTH_USER_CACHE_TTL seconds at most (never past the token's expiry). Each
+user also has a stamp key; entries are only trusted while they carry the
+current stamp, so deleting it (see users.signals) drops every cached copy
+of that user at once, in every process sharing the cache.
+
+The 'auth_users' cache should therefore be shared (Redis, memcached, the
+database cache) when running several processes. A process-local cache
+only sees invalidations made by its own process, so its entries live for
+AUTH_USER_LOCAL_CACHE_TTL seconds at most: that bounds how long a change
+made elsewhere goes unnoticed. Deployments that cannot accept that delay
+set AUTH_USER_CACHE_RECHECK, which checks each local hit against the
+user's is_active flag and password hash in the database (one query, so
+a shared cache is the better fix).
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+AUTH_CACHE = 'auth_users'
+
+
+def _stamp_key(user_id):
+    return f'auth_user_stamp:{user_id}'
+
+
+def _user_key(user_id, jti):
+    return f'auth_user:{user_id}:{jti}'
+
+
+def is_process_local(cache):
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+def is_current(user):
+    """
+    Whether the cached `user` is still active with the same password in
+    the database: one indexed single-row read.
+    """
+    row = get_user_model().objects.filter(pk=user.pk).values_list('is_active', 'password').first()
+    return row == (True, user.password)
+
+
+def invalidate_user(user_id):
+    """
+    Forget every cached copy of the user, e.g. after it was deactivated or
+    its password changed.
+    """
+    caches[AUTH_CACHE].delete(_stamp_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if user_id is None or jti is None:
+            return super().get_user(validated_token)
+
+        cache = caches[AUTH_CACHE]
+        stamp_key, user_key = _stamp_key(user_id), _user_key(user_id, jti)
+        found = cache.get_many([stamp_key, user_key])
+        stamp, entry = found.get(stamp_key), found.get(user_key)
+        if stamp is not None and entry is not None and entry[0] == stamp:
+            user = entry[1]
+            local = is_process_local(cache)
+            if not (local and settings.AUTH_USER_CACHE_RECHECK) or is_current(user):
+                return user
+            # Changed through another process: drop this process's copies
+            cache.delete(stamp_key)
+            stamp = None
+
+        ttl = settings.AUTH_USER_CACHE_TTL
+        if is_process_local(cache):
+            ttl = min(ttl, settings.AUTH_USER_LOCAL_CACHE_TTL)
+        if stamp is None:
+            # Taken before the row is read: an invalidation in between
+            # removes it, and the entry stored below is never trusted
+            cache.add(stamp_key, uuid.uuid4().hex, ttl)
+            stamp = cache.get(stamp_key)
+
+        user = super().get_user(validated_token)
+        ttl = min(ttl, int(validated_token.get('exp', 0) - time.time()))
+        if stamp is not None and ttl > 0:
+            cache.set(user_key, (stamp, user), ttl)
+        return user
+
+
+def authenticate_token(raw_token):
+    """
+    User for a raw access token (as sent by websocket clients), or
+    AnonymousUser if the token or its user is not valid.
+    """
+    if not raw_token:
+        return AnonymousUser()
+    authentication = CachedJWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return AnonymousUser()
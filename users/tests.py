@@ -1,3 +1,63 @@
-from django.test import TestCase
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication, authenticate_token
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        caches['auth_users'].clear()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.token = AccessToken.for_user(self.user)
+        self.authentication = CachedJWTAuthentication()
+
+    def test_socket_token_resolves_to_user(self):
+        self.assertEqual(authenticate_token(str(self.token)), self.user)
+        self.assertTrue(authenticate_token('not-a-token').is_anonymous)
+        self.assertTrue(authenticate_token(None).is_anonymous)
+
+    def test_save_drops_cached_user(self):
+        self.authentication.get_user(self.token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_local_cache_hit_skips_the_database(self):
+        self.authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authentication.get_user(self.token), self.user)
+
+    def test_local_cache_entries_are_short_lived(self):
+        self.authentication.get_user(self.token)
+        # Written elsewhere: no signal reaches this process's cache
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.authentication.get_user(self.token), self.user)
+        with mock.patch('time.time', return_value=time.time() + 31):
+            with self.assertRaises(AuthenticationFailed):
+                self.authentication.get_user(self.token)
+
+    @override_settings(AUTH_USER_CACHE_RECHECK=True)
+    def test_recheck_sees_changes_made_by_other_processes(self):
+        self.authentication.get_user(self.token)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_shared_cache_hit_skips_the_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+            }
+            with override_settings(CACHES={'default': shared, 'auth_users': shared}):
+                self.authentication.get_user(self.token)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.authentication.get_user(self.token), self.user)